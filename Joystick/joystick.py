@@ -2,103 +2,294 @@ from flask import Flask, render_template, request, jsonify
 import serial
 import threading
 import time
+import json
+import math
+import os
+import sys
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from opencr import connect, configured_port
+from opencr.telemetry import live_feed, shared_ring
+from serving import run_production, sse_response
+
+try:
+    from flask_sock import Sock
+    from simple_websocket import ConnectionClosed
+except ImportError:
+    Sock = None  # no WebSocket channel, the page falls back to POST /move
 
 app = Flask(__name__)
+sock = Sock(app) if Sock else None
 
 # === Serial Configuration ===
-PORT = '/dev/serial/by-path/platform-70090000.xusb-usb-0:3.2:1.0'
+PORT = configured_port()  # OPENCR_PORT=fake runs against the in-process simulator
+# With the serial broker running (python -m opencr.broker) the port is shared through it
 BAUDRATE = 115200
 
+# === Control Channel Configuration ===
+# WebSocket clients heartbeat every HEARTBEAT_MS; if nothing arrives for
+# DEADMAN_MS while they are driving, the watchdog stops the robot.
+DEADMAN_MS = int(os.environ.get('JOYSTICK_DEADMAN_MS', 300))
+HEARTBEAT_MS = max(20, DEADMAN_MS // 3)
+
+# === Setpoint Writer Configuration ===
+SEND_RATE_HZ = float(os.environ.get('JOYSTICK_SEND_RATE_HZ', 20))  # max setpoint changes written per second
+KEEPALIVE_MS = int(os.environ.get('JOYSTICK_KEEPALIVE_MS', 100))  # resend an unchanged drive command (0 = never)
+# 'discrete' maps the stick onto f/l/r/b for the current firmware; 'velocity'
+# sends "v <linear> <angular>" for firmware that accepts continuous setpoints
+VECTOR_MODE = os.environ.get('JOYSTICK_VECTOR_MODE', 'discrete')
+DEADZONE = 0.15
+TELEMETRY_FEED_HZ = 4.0  # live telemetry frames per second (recorded by the serial broker)
+
 # === Global Variables ===
 ser = None
 sending = False
 current_command = None
 lock = threading.Lock()
+control_source = None  # 'ws' or 'http' for whoever started the current move
+last_heartbeat = 0.0
+deadman_trips = 0
+latency = {'rtt_ms': deque(maxlen=500), 'server_ms': deque(maxlen=500)}
+setpoint_changed = threading.Condition(lock)
+setpoint_stamp = None
+writer_stats = {'updates': 0, 'writes': 0, 'keepalives': 0}
 
 # === Serial Connection Handler ===
 def connect_serial():
     global ser
     while True:
         try:
-            ser = serial.Serial(PORT, BAUDRATE, timeout=1)
-            print(f"✅ Connected to OpenCR on {PORT}")
+            ser = connect(timeout=1)
+            print(f"✅ Connected to OpenCR via {ser.port}")
             return
         except serial.SerialException as e:
             print(f"❌ Serial error: {e}, retrying in 2s...")
             time.sleep(2)
 
-# Call once at startup
-connect_serial()
-
 # === Background Thread to Monitor Serial Connection ===
 def monitor_serial_connection():
     global ser
     while True:
-        if ser and not ser.is_open:
+        if ser is None or not ser.is_open:
             print("⚠️ Serial port closed. Reconnecting...")
             connect_serial()
         time.sleep(1)
 
-# Start monitor thread
-threading.Thread(target=monitor_serial_connection, daemon=True).start()
+# === Setpoint Writer ===
+# Requests only replace the setpoint; one writer thread owns serial writes.
+# Updates arriving faster than SEND_RATE_HZ coalesce (only the latest is sent),
+# an unchanged setpoint is re-sent only every KEEPALIVE_MS while driving, and a
+# stop skips the rate limit. `lock` guards the setpoint, never the serial I/O.
+def write_command(command):
+    global ser
+    port = ser
+    if port is None:
+        return False
+    try:
+        port.write(f"{command}\r\n".encode('utf-8'))
+        return True
+    except (serial.SerialException, OSError) as e:
+        print(f"⚠️ Write failed: {e}")
+        try:
+            port.close()
+        except:
+            pass
+        ser = None  # monitor_serial_connection reconnects
+        return False
+
+def set_setpoint(command, source):
+    global sending, current_command, control_source, setpoint_stamp
+    with setpoint_changed:
+        writer_stats['updates'] += 1
+        sending = command != "s"
+        current_command = command
+        control_source = source if sending else None
+        setpoint_stamp = time.perf_counter()
+        setpoint_changed.notify()
 
-# === Background Thread to Continuously Send Command ===
-def send_continuous():
-    global sending, current_command, ser
+def setpoint_writer():
+    period = 1.0 / SEND_RATE_HZ
+    keepalive = KEEPALIVE_MS / 1000.0
+    last_sent, last_write = None, 0.0
     while True:
-        with lock:
-            if sending and current_command:
-                try:
-                    ser.write(f"{current_command}\r\n".encode('utf-8'))
-                    print(f"Sent: {current_command}")
-                except (serial.SerialException, OSError) as e:
-                    print(f"⚠️ Write failed: {e}")
-                    try:
-                        ser.close()
-                    except:
-                        pass
-                    ser = None
-                    connect_serial()
-        time.sleep(0.1)  # 10Hz send rate
+        with setpoint_changed:
+            while True:
+                now = time.monotonic()
+                if current_command != last_sent:
+                    break
+                if sending and keepalive and now - last_write >= keepalive:
+                    break
+                setpoint_changed.wait(last_write + keepalive - now if sending and keepalive else None)
+            # Rate limit: let newer setpoints replace this one, unless it is a stop
+            deadline = last_write + period
+            while current_command != "s" and deadline - time.monotonic() > 0:
+                setpoint_changed.wait(deadline - time.monotonic())
+            command, stamp = current_command, setpoint_stamp
+
+        changed = command != last_sent
+        if not write_command(command):
+            time.sleep(0.05)
+            continue
+        last_sent, last_write = command, time.monotonic()
+        writer_stats['writes'] += 1
+        if changed:
+            latency['server_ms'].append((time.perf_counter() - stamp) * 1000)
+            print("Sent: s (Stop)" if command == "s" else f"Sent: {command}")
+        else:
+            writer_stats['keepalives'] += 1
+
+
+# === Motion Commands ===
+def vector_command(speed, heading):
+    """Serial command for a stick position: speed 0..1, heading in degrees (0 forward, 90 right).
+    Raises ValueError for NaN or infinite values (min/max would turn a NaN speed into full speed)."""
+    speed, heading = float(speed), float(heading)
+    if not (math.isfinite(speed) and math.isfinite(heading)):
+        raise ValueError("speed and heading must be finite")
+    speed = max(0.0, min(1.0, speed))
+    if speed < DEADZONE:
+        return "s"
+    if VECTOR_MODE == "velocity":
+        rad = math.radians(heading)
+        return f"v {speed * math.cos(rad):.2f} {speed * math.sin(rad):.2f}"
+    return "frbl"[int(((heading % 360) + 45) // 90) % 4]  # nearest of the four drive letters
+
+def apply_command(direction, action, source, speed=None, heading=None):
+    """Raises ValueError for a malformed vector."""
+    if action == "start" and direction in ("f", "l", "r", "b"):
+        set_setpoint(direction, source)
+    elif action == "vector":
+        set_setpoint(vector_command(speed, heading), source)
+    elif action == "stop":
+        set_setpoint("s", source)
+
+# === Dead-Man's Switch ===
+def deadman_watchdog():
+    global deadman_trips
+    interval = min(DEADMAN_MS / 4000.0, 0.05)
+    while True:
+        time.sleep(interval)
+        if control_source == "ws" and sending and (time.monotonic() - last_heartbeat) * 1000 > DEADMAN_MS:
+            print(f"🛑 No heartbeat for {DEADMAN_MS}ms, stopping")
+            deadman_trips += 1
+            apply_command(None, "stop", "deadman")
+
+def percentiles(samples):
+    values = sorted(samples)
+    if not values:
+        return {'count': 0, 'p50': None, 'p95': None, 'max': None}
+    pick = lambda pct: round(values[min(len(values) - 1, int(pct / 100.0 * len(values)))], 2)
+    return {'count': len(values), 'p50': pick(50), 'p95': pick(95), 'max': round(values[-1], 2)}
 
-# Start the background thread
-threading.Thread(target=send_continuous, daemon=True).start()
 
 # === Routes ===
 @app.route("/")
 def index():
-    return render_template("joystick.html")
+    return render_template("joystick.html", websocket=sock is not None)
 
 @app.route("/move", methods=["POST"])
 def move():
-    global sending, current_command, ser
     data = request.json
     direction = data.get("direction")
     action = data.get("action")
-    print(f"Action: {action}, Direction: {direction}")
-
-    with lock:
-        if action == "start":
-            sending = True
-            current_command = direction
-        elif action == "stop":
-            sending = False
-            current_command = None
-            try:
-                if ser:
-                    ser.write("s\r\n".encode('utf-8'))
-                    print("Sent: s (Stop)")
-            except (serial.SerialException, OSError) as e:
-                print(f"⚠️ Stop command failed: {e}")
-                try:
-                    ser.close()
-                except:
-                    pass
-                ser = None
-                connect_serial()
+    try:
+        apply_command(direction, action, "http", data.get("speed"), data.get("heading"))
+    except (TypeError, ValueError):
+        return jsonify(status="error", error="vector needs numeric speed and heading"), 400
     return jsonify(status="ok")
 
+@app.route("/api/latency")
+def latency_stats():
+    return jsonify(
+        rtt_ms=percentiles(latency['rtt_ms']),  # browser -> server -> browser, reported by the page
+        server_ms=percentiles(latency['server_ms']),  # setpoint received -> written to serial
+        writer=dict(writer_stats, send_rate_hz=SEND_RATE_HZ, keepalive_ms=KEEPALIVE_MS,
+                    vector_mode=VECTOR_MODE, command=current_command),
+        deadman_ms=DEADMAN_MS,
+        deadman_trips=deadman_trips,
+        websocket=sock is not None
+    )
+
+@app.route("/api/telemetry/stream")
+def telemetry_stream():
+    """Server-Sent Events: pose, battery and motor currents TELEMETRY_FEED_HZ times a second."""
+    ring = shared_ring()
+    if ring is None:
+        return jsonify(status="error", error="no telemetry recorded (is the serial broker running?)"), 404
+    return sse_response(live_feed(ring, TELEMETRY_FEED_HZ))
+
+if sock:
+    @sock.route("/ws")
+    def control_channel(ws):
+        """Messages: {type: 'cmd'|'hb', seq, t, direction?, action?, speed?, heading?, rtt?}; each is acked with its seq."""
+        global last_heartbeat
+        last_seq = -1
+        ws.send(json.dumps({'type': 'hello', 'deadman_ms': DEADMAN_MS, 'heartbeat_ms': HEARTBEAT_MS}))
+        try:
+            while True:
+                raw = ws.receive()
+                received = time.perf_counter()
+                try:
+                    msg = json.loads(raw)
+                    seq = int(msg.get('seq', 0))
+                except (TypeError, ValueError):
+                    continue
+                if seq <= last_seq:
+                    continue  # stale or replayed, a newer command already won
+                last_seq = seq
+                last_heartbeat = time.monotonic()
+                if msg.get('type') == 'cmd':
+                    try:
+                        apply_command(msg.get('direction'), msg.get('action'), "ws",
+                                      msg.get('speed'), msg.get('heading'))
+                    except (TypeError, ValueError):
+                        apply_command(None, "stop", "ws")  # never keep driving on a garbled command
+                if isinstance(msg.get('rtt'), (int, float)):
+                    latency['rtt_ms'].append(msg['rtt'])
+                ws.send(json.dumps({'type': 'ack', 'seq': seq, 't': msg.get('t'),
+                                    'server_ms': round((time.perf_counter() - received) * 1000, 3)}))
+        except ConnectionClosed:
+            pass
+        finally:
+            if control_source == "ws" and sending:
+                print("🛑 Control channel closed, stopping")
+                apply_command(None, "stop", "ws")
+
+# === App Factory & Startup ===
+_background_started = False
+_background_lock = threading.Lock()
+
+def create_app():
+    """Return the app, starting the serial monitor and sender threads once per process.
+
+    Production (see serving.run_production):
+        python joystick.py --production
+        gunicorn -w 1 --threads 8 -b 0.0.0.0:5001 'joystick:create_app()'
+
+    waitress cannot upgrade to WebSocket, so under it the page drives over POST /move;
+    use the gunicorn line (or the dev server) to get the /ws control channel.
+    """
+    global _background_started
+    with _background_lock:
+        if not _background_started:
+            threading.Thread(target=monitor_serial_connection, daemon=True).start()
+            threading.Thread(target=setpoint_writer, daemon=True).start()
+            threading.Thread(target=deadman_watchdog, daemon=True).start()
+            _background_started = True
+    return app
+
 # === Run App ===
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5001, debug=True)
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--production", action="store_true", help="multi-threaded server, no debug")
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.production:
+        run_production(create_app(), 5001, args.threads)
+    else:
+        # The reloader would start a second process fighting over the serial port
+        create_app().run(host="0.0.0.0", port=5001, debug=True, use_reloader=False)
 
@@ -0,0 +1,242 @@
+# === Motion Executor ===
+# Runs a compiled motion program on a worker thread with cooperative stop:
+#   - stop() sets an Event, writes 's' straight to the open port (no lock, so a
+#     worker stuck mid-write can't delay it) and closes the protocol reader,
+#     which wakes a worker waiting for Done; `wait:` sleeps on the same Event
+#   - the worker's finally block always closes the port it opened
+#   - stop-to-'s'-written and stop-to-worker-exit times are recorded
+# The worker never calls flash(): messages are queued and the next request
+# hands them to flash() (see drain_messages()).
+#
+# With a `publish` callable (eventbus.Publisher.publish) the run is announced
+# to other processes: 'ad' and 'waypoint' events as the script reaches them,
+# 'preload' as soon as the robot sets off towards the next ad, and 'motion'
+# when a run starts or ends.
+#
+# With a `telemetry` recorder (opencr.telemetry.TelemetryRecorder) every line of
+# the run is recorded, unless the broker already records the port; the writer
+# lock is let go when the run ends so a broker started later can take it.
+import threading
+import time
+from collections import deque
+
+import serial
+
+from opencr.protocol import ProtocolReader
+
+MOVE_TIMEOUT = 30  # seconds to wait for a Done
+
+
+class MotionError(Exception):
+    pass
+
+
+class MotionExecutor:
+    def __init__(self, connect, pipeline=False, time_scale=1.0, publish=None, telemetry=None):
+        self._connect = connect
+        self._publish = publish
+        self._telemetry = telemetry
+        self.pipeline = pipeline
+        self.time_scale = time_scale  # >1 shortens waits, for simulation
+        self.reader = None  # reader of the current (or last) run
+        self._ser = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._messages = deque(maxlen=50)
+        self._stop_latencies = deque(maxlen=200)
+        self._state = {'state': 'idle', 'file': None, 'loop_count': 0, 'command_index': None,
+                       'line': None, 'command': None, 'started_at': None, 'last_stop': None}
+
+    # --- messages for the UI ---
+    def _message(self, text, category='info'):
+        print(text)
+        self._messages.append((category, text))
+
+    def drain_messages(self):
+        messages = []
+        while self._messages:
+            messages.append(self._messages.popleft())
+        return messages
+
+    def _emit(self, topic, **fields):
+        if self._publish is not None:
+            try:
+                self._publish(topic, **fields)
+            except OSError as e:
+                print(f"⚠ Could not publish {topic} event: {e}")
+
+    def _update(self, **fields):
+        with self._lock:
+            self._state.update(fields)
+
+    # --- control ---
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, name, program, loops=None):
+        """Run `program` in a loop until stop() (or `loops` times); False if a run is already going."""
+        with self._lock:
+            if self.running():
+                return False
+            self._stop = threading.Event()
+            self._state.update(state='starting', file=name, loop_count=0, command_index=None,
+                               line=None, command=None, started_at=time.time(), ops=len(program.ops))
+            self._thread = threading.Thread(target=self._run, args=(name, program, loops, self._stop), daemon=True)
+            self._thread.start()
+        return True
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stop(self, join_timeout=2.0):
+        """Halt the robot and the worker; returns the timing of this stop."""
+        requested = time.perf_counter()
+        self._stop.set()
+        with self._lock:
+            ser, reader, thread = self._ser, self.reader, self._thread
+        via = 'open port'
+        try:
+            if ser is not None and ser.is_open:
+                ser.write('s\r\n'.encode())
+            else:
+                via = 'emergency connection'
+                port = self._connect(timeout=2)
+                try:
+                    port.write('s\r\n'.encode())
+                finally:
+                    port.close()
+            written_ms = (time.perf_counter() - requested) * 1000
+        except (serial.SerialException, OSError) as e:
+            self._message(f"Error sending stop signal to OpenCR: {e}", 'danger')
+            written_ms = None
+        if reader is not None:
+            reader.close()  # resolves the pending Done the worker may be blocked on
+
+        exit_ms = None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(join_timeout)
+            if not thread.is_alive():
+                exit_ms = (time.perf_counter() - requested) * 1000
+        result = {'via': via,
+                  'stop_to_write_ms': round(written_ms, 3) if written_ms is not None else None,
+                  'stop_to_exit_ms': round(exit_ms, 3) if exit_ms is not None else None}
+        if written_ms is not None:
+            self._stop_latencies.append(written_ms)
+        self._update(last_stop=result)
+        return result
+
+    def status(self):
+        with self._lock:
+            status = dict(self._state)
+        latencies = sorted(self._stop_latencies)
+        status['running'] = self.running()
+        status['stop_to_write_ms'] = {
+            'count': len(latencies),
+            'p50': round(latencies[len(latencies) // 2], 3) if latencies else None,
+            'max': round(latencies[-1], 3) if latencies else None
+        }
+        return status
+
+    # --- worker ---
+    def _run(self, name, program, loops, stop):
+        ser = None
+        reader = None
+        try:
+            ser = self._connect(timeout=5)
+            print(f"Connected to OpenCR via {ser.port}.")
+            ser.reset_output_buffer()
+            reader = ProtocolReader(ser)
+            if self._telemetry is not None:
+                reader.taps.append(self._telemetry.record)
+            reader.start()
+            with self._lock:
+                self._ser, self.reader = ser, reader
+            if stop.is_set():
+                return  # stop() raced with start; it already wrote 's'
+            self._update(state='running')
+            self._emit('motion', state='running', file=name)
+            if self._execute(program, reader, loops, stop):
+                self._message(f"Finished {loops} loop(s) of '{name}'.", 'success')
+            else:
+                self._message("Motion execution stopped.", 'warning')
+        except MotionError as e:
+            self._message(f"❌ {name}: {e}", 'danger')
+        except serial.SerialException as e:
+            self._message(f"Serial error: {e}", 'danger')
+        except Exception as e:
+            self._message(f"Unexpected error: {e}", 'danger')
+        finally:
+            with self._lock:
+                self._ser = None
+                self._state.update(state='idle', command_index=None, line=None, command=None)
+            self._emit('motion', state='idle', file=name)
+            if reader is not None:
+                reader.close()
+            if ser is not None and ser.is_open:
+                ser.close()
+                print("Serial connection closed.")
+            if self._telemetry is not None:
+                self._telemetry.release()
+
+    def _execute(self, program, reader, loops, stop):
+        """True when all `loops` completed, None when stopped."""
+        ops = program.ops
+        prefetched = {}  # op index -> PendingCommand already sent ahead (pipelining)
+        preloaded = None  # ad the player was last told to get ready
+        loop_count = 0
+        while not stop.is_set():
+            if loops is not None and loop_count >= loops:
+                return True
+            loop_count += 1
+            self._update(loop_count=loop_count)
+            print(f"Starting Loop {loop_count}")
+
+            for index, (action, param, line_number) in enumerate(ops):
+                if stop.is_set():
+                    return
+                command = (param if action == 'move' else f"wait {param:g}" if action == 'wait'
+                           else f"{param[0]}: {param[1]}")
+                self._update(command_index=index, line=line_number, command=command)
+                upcoming = program.next_ad[index]
+                if upcoming is not None and upcoming != preloaded:
+                    self._emit('preload', ad=upcoming, line=line_number)
+                    preloaded = upcoming
+
+                if action == 'event':
+                    kind, value = param
+                    print(f"📣 {kind}: {value} (line {line_number})")
+                    if kind == 'ad':
+                        self._emit('ad', ad=value, line=line_number, loop=loop_count)
+                        preloaded = None  # the following ops start heading to the next one
+                    else:
+                        self._emit('waypoint', name=value, line=line_number, loop=loop_count)
+                    continue
+
+                if action == 'move':
+                    pending = prefetched.pop(index, None)
+                    if pending is None:
+                        print(f"Sending movement command: {param} (line {line_number})")
+                        pending = reader.send(param)
+                    next_index = (index + 1) % len(ops)
+                    last_op = next_index == 0 and loops is not None and loop_count >= loops
+                    if self.pipeline and ops[next_index][0] == 'move' and next_index != index and not last_op:
+                        # Firmware queues moves: have the next one waiting when this Done arrives
+                        prefetched[next_index] = reader.send(ops[next_index][1])
+
+                    reply = pending.wait(MOVE_TIMEOUT)
+                    if stop.is_set():
+                        return
+                    if reply is None:
+                        raise MotionError(f"line {line_number}: no 'Done' for '{param}' within {MOVE_TIMEOUT}s")
+                    if not pending.ok:
+                        raise MotionError(f"line {line_number}: OpenCR rejected '{param}': {reply.get('message')}")
+                    print(f"✓ '{param}' done after {pending.rtt_ms:.0f}ms")
+
+                elif action == 'wait':
+                    print(f"Waiting for {param} seconds...")
+                    if stop.wait(param / self.time_scale):
+                        return
+
+            print("All commands in loop completed")
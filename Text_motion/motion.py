@@ -1,10 +1,17 @@
 
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+import math
 import os
-import serial
-import time
-import threading
-import ctypes
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from opencr import connect, configured_port
+from eventbus import Publisher
+from serving import run_production, sse_response
+from opencr.telemetry import TelemetryRecorder, live_feed, query, shared_ring
+from motion_script import ScriptError, compile_script, load_program
+from executor import MotionExecutor
+import trajectory
 
 # === Flask App Config ===
 app = Flask(__name__)
@@ -13,12 +20,28 @@ UPLOAD_FOLDER = 'uploads'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 # === Serial Configuration ===
-PORT = '/dev/serial/by-path/platform-70090000.xusb-usb-0:3.2:1.0'
+# The serial broker (python -m opencr.broker) owns the port when it is running;
+# otherwise each run opens PORT directly, as before.
+PORT = configured_port()
 BAUDRATE = 115200
-
-# === Global Variables ===
-stop_execution = False
-execution_thread = None  # Background thread for motion
+# Send the next move while the current one is still running. Only for firmware
+# that queues moves and answers one Done per move, in order.
+PIPELINE = os.environ.get('MOTION_PIPELINE', '0') == '1'
+PROFILE_FILE = 'speed_profile.json'  # turn/move speeds for trajectory planning
+TELEMETRY_FEED_HZ = 4.0  # live telemetry frames per second to the page
+TELEMETRY_MAX_SECONDS = 7 * 24 * 3600  # longest /api/telemetry window before the ring has wrapped
+
+# === Motion Executor ===
+# 'ad:' / 'waypoint:' lines in a script are published to the ad player
+try:
+    event_bus = Publisher()
+except OSError as e:
+    print(f"⚠ Robot event bus unavailable: {e}")
+    event_bus = None
+# Runs record what the board sends to the telemetry ring, unless the broker does
+telemetry = TelemetryRecorder(publish=event_bus.publish if event_bus else None)
+executor = MotionExecutor(connect, pipeline=PIPELINE, publish=event_bus.publish if event_bus else None,
+                          telemetry=telemetry)
 
 
 # === Create uploads folder if it doesn't exist ===
@@ -26,148 +49,11 @@ if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
 
-# === Kill Thread Utility ===
-def kill_thread(thread):
-    """Forcefully kill a thread by raising SystemExit"""
-    if not thread.is_alive():
-        return
-    thread_id = thread.ident
-    res = ctypes.pythonapi.PyThreadState_SetAsyncExc(
-        ctypes.c_long(thread_id),
-        ctypes.py_object(SystemExit)
-    )
-    if res == 0:
-        print("⚠ Thread not found.")
-    elif res > 1:
-        # Undo if it messed up
-        ctypes.pythonapi.PyThreadState_SetAsyncExc(thread_id, None)
-        print("⚠ PyThreadState_SetAsyncExc failed.")
-
-
-# === Wait for "Done" response ===
-def wait_for_done_response(ser, timeout=30):
-    """Wait for 'Done' response from OpenCR with timeout"""
-    start_time = time.time()
-    buffer = ""
-
-    while (time.time() - start_time) < timeout:
-        if stop_execution:
-            print("🛑 Stop requested during wait_for_done_response()")
-            ser.write('s'.encode())  # send stop to OpenCR
-            raise SystemExit  # Kill this thread
-
-        if ser.in_waiting > 0:
-            try:
-                data = ser.read(ser.in_waiting).decode('utf-8', errors='ignore')
-                buffer += data
-                print(f"Received: {data.strip()}")
-
-                if "Done" in buffer:
-                    print("✓ Movement completed - 'Done' received")
-                    return True
-
-            except Exception as e:
-                print(f"Error reading serial data: {e}")
-
-        time.sleep(0.01)
-
-    print("⚠ Timeout waiting for 'Done' response")
-    return False
-
-
-# === Send motion commands ===
-def send_commands_to_opencr(filepath):
-    global stop_execution
-    loop_count = 0
-
-    try:
-        ser = serial.Serial(PORT, BAUDRATE, timeout=5)
-        print(f"Connected to OpenCR on {PORT} at {BAUDRATE} baud.")
-
-        ser.reset_input_buffer()
-        ser.reset_output_buffer()
-
-        while not stop_execution:
-            loop_count += 1
-            print(f"Starting Loop {loop_count}")
-
-            with open(filepath, 'r') as file:
-                lines = file.readlines()
-
-            commands = []
-            for line in lines:
-                line = line.strip()
-                if not line or ':' not in line:
-                    continue
-                cmd, value = line.split(':', 1)
-                cmd = cmd.strip().lower()
-                value = value.strip()
-
-                if cmd == 'turn':
-                    serial_cmd = f"a {value}\r\n"
-                    commands.append(('move', serial_cmd))
-                elif cmd == 'move':
-                    serial_cmd = f"d {value}\r\n"
-                    commands.append(('move', serial_cmd))
-                elif cmd == 'wait':
-                    try:
-                        wait_time = float(value)
-                        commands.append(('wait', wait_time))
-                    except ValueError:
-                        print(f"Invalid wait time: {value}")
-                else:
-                    print(f"Unknown command: {cmd}")
-
-            # Execute commands
-            for action, param in commands:
-                if stop_execution:
-                    print("🛑 Stop requested: aborting commands")
-                    ser.write('s'.encode())  # Send stop to OpenCR
-                    raise SystemExit  # Kill this thread
-
-                if action == 'move':
-                    print(f"Sending movement command: {param.strip()}")
-                    ser.write(param.encode('utf-8'))
-
-                    if not wait_for_done_response(ser):
-                        print("❌ Movement command failed or stopped.")
-                        raise SystemExit
-
-                elif action == 'wait':
-                    print(f"Waiting for {param} seconds...")
-                    start_wait = time.time()
-                    while (time.time() - start_wait) <= param:
-                        if stop_execution:
-                            print("🛑 Stop requested during wait")
-                            ser.write('s'.encode())  # Send stop
-                            raise SystemExit
-                        time.sleep(0.1)
-
-            print("All commands in loop completed")
-
-        print("Execution stopped.")
-        flash("Motion execution stopped.", "warning")
-
-    except serial.SerialException as e:
-        print(f"Serial error: {e}")
-        flash(f"Serial error: {e}", "danger")
-    except FileNotFoundError:
-        print(f"File '{filepath}' not found.")
-        flash(f"File '{filepath}' not found.", "danger")
-    except SystemExit:
-        print("🛑 Thread terminated by Stop request.")
-    except Exception as e:
-        print(f"Unexpected error: {e}")
-        flash(f"Unexpected error: {e}", "danger")
-    finally:
-        if 'ser' in locals() and ser.is_open:
-            ser.close()
-            print("Serial connection closed.")
-
-
 # === Routes ===
 @app.route("/", methods=['GET', 'POST'])
 def index():
+    for category, message in executor.drain_messages():
+        flash(message, category)  # from the motion thread, which has no request context
     files = os.listdir(UPLOAD_FOLDER)
     return render_template('index.html', files=files)
 
@@ -183,9 +69,18 @@ def upload_file():
         return redirect(url_for('index'))
     if file:
         filename = file.filename
+        data = file.read()
+        try:
+            program = compile_script(data.decode('utf-8', errors='replace'))
+        except ScriptError as e:
+            for line_number, message in e.errors:
+                flash(f"'{filename}' line {line_number}: {message}", 'danger')
+            flash(f"File '{filename}' was not saved.", 'danger')
+            return redirect(url_for('index'))
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        flash(f"File '{filename}' uploaded successfully!", 'success')
+        with open(filepath, 'wb') as f:
+            f.write(data)
+        flash(f"File '{filename}' uploaded successfully! ({program.moves} moves, {program.wait_seconds:g}s of waits per loop)", 'success')
         return redirect(url_for('index'))
 
 
@@ -205,14 +100,17 @@ def delete_file(filename):
 
 @app.route("/send/<filename>")
 def send_file(filename):
-    global stop_execution, execution_thread
-    stop_execution = False  # Reset stop flag
     filepath = os.path.join(UPLOAD_FOLDER, filename)
+    try:
+        program = load_program(filepath)  # compiled once, then reused from the cache
+    except ScriptError as e:
+        flash(f"Can't run '{filename}': {e}", "danger")
+        return redirect(url_for('index'))
+    except FileNotFoundError:
+        flash(f"File '{filename}' not found.", "danger")
+        return redirect(url_for('index'))
 
-    # Start background thread
-    if execution_thread is None or not execution_thread.is_alive():
-        execution_thread = threading.Thread(target=send_commands_to_opencr, args=(filepath,))
-        execution_thread.start()
+    if executor.start(filename, program):
         flash(f"Started executing '{filename}'", "info")
     else:
         flash("Another execution is already running.", "warning")
@@ -222,29 +120,131 @@ def send_file(filename):
 
 @app.route("/stop")
 def stop_motion():
-    global stop_execution, execution_thread
-    stop_execution = True
     print("🛑 Stop signal received from user.")
+    result = executor.stop()
+    if result['stop_to_write_ms'] is not None:
+        print(f"✔ Stop sent to OpenCR via {result['via']} in {result['stop_to_write_ms']:.1f}ms.")
+    for category, message in executor.drain_messages():
+        flash(message, category)
+    flash("Emergency stop: motion halted immediately.", "warning")
+    return redirect(url_for('index'))
+
 
-    # Emergency stop: send 's' to OpenCR immediately
+@app.route("/api/status")
+def motion_status():
+    """Current file, command index/line, loop count and stop timings."""
+    return jsonify(executor.status())
+
+
+@app.route("/api/timings")
+def command_timings():
+    """Round-trip time per command letter (send -> Done) for the current or last run."""
+    reader = executor.reader
+    if reader is None:
+        return jsonify(timings={}, recent=[], stray=0)
+    return jsonify(
+        timings=reader.timings(),
+        recent=[reply for _, reply in list(reader.recent)[-20:]],
+        stray=reader.stray
+    )
+
+
+@app.route("/api/telemetry")
+def telemetry_window():
+    """Summary of the last `seconds` (default 60) of OpenCR telemetry; `bucket` adds a resampled series."""
+    ring = shared_ring()
+    if ring is None:
+        return jsonify(error="No telemetry recorded yet."), 404
+    try:
+        seconds = float(request.args.get('seconds', 60))
+        bucket = float(request.args['bucket']) if request.args.get('bucket') else None
+    except ValueError:
+        return jsonify(error="seconds and bucket must be numbers"), 400
+    if not (math.isfinite(seconds) and seconds > 0) or (bucket is not None and not (math.isfinite(bucket) and bucket > 0)):
+        return jsonify(error="seconds and bucket must be positive numbers"), 400
+    # A wrapped ring only reaches back so far; a filling one holds everything since it started
+    limit = ring.retention() or TELEMETRY_MAX_SECONDS
+    if seconds > limit:
+        return jsonify(error=f"seconds must be at most {limit:.0f}"), 400
+    result = query(ring, seconds, bucket)
+    result['recorder'] = telemetry.stats()
+    return jsonify(result)
+
+
+@app.route("/api/telemetry/stream")
+def telemetry_stream():
+    """Server-Sent Events: the newest telemetry values TELEMETRY_FEED_HZ times a second."""
+    ring = shared_ring()
+    if ring is None:
+        return jsonify(error="No telemetry recorded yet."), 404
+    return sse_response(live_feed(ring, TELEMETRY_FEED_HZ))
+
+
+@app.route("/api/plan/<filename>")
+def plan_route(filename):
+    """Predicted loop time, per-command durations and end pose of a motion file."""
     try:
-        ser = serial.Serial(PORT, BAUDRATE, timeout=2)
-        ser.write('s'.encode())  # Send emergency stop
-        ser.close()
-        print("✔ Emergency stop signal sent to OpenCR.")
-    except serial.SerialException as e:
-        print(f"Error sending stop signal to OpenCR: {e}")
-
-    # Kill the background thread
-    if execution_thread and execution_thread.is_alive():
-        kill_thread(execution_thread)
-        print("💥 Background thread forcefully terminated.")
+        program = load_program(os.path.join(UPLOAD_FOLDER, filename))
+    except FileNotFoundError:
+        return jsonify(error=f"File '{filename}' not found."), 404
+    except ScriptError as e:
+        return jsonify(error=str(e), errors=e.errors), 422
+    planned = trajectory.plan(program, trajectory.load_profile(PROFILE_FILE))
+    return jsonify(trajectory.plan_summary(planned))
 
-    flash("Emergency stop: motion halted immediately.", "warning")
-    return redirect(url_for('index'))
+
+@app.route("/path/<filename>.svg")
+def path_svg(filename):
+    """The planned path drawn as SVG (start green, end red)."""
+    try:
+        program = load_program(os.path.join(UPLOAD_FOLDER, filename))
+    except FileNotFoundError:
+        return jsonify(error=f"File '{filename}' not found."), 404
+    except ScriptError as e:
+        return jsonify(error=str(e), errors=e.errors), 422
+    planned = trajectory.plan(program, trajectory.load_profile(PROFILE_FILE))
+    return app.response_class(trajectory.render_svg(planned), mimetype='image/svg+xml')
+
+
+@app.route("/api/profile", methods=['GET'])
+def get_profile():
+    return jsonify(trajectory.load_profile(PROFILE_FILE))
 
 
+@app.route("/api/profile/learn", methods=['POST'])
+def learn_profile():
+    """Fit the speed profile to the Done round-trips of the current or last run."""
+    reader = executor.reader
+    if reader is None or not reader.history:
+        return jsonify(error="No completed moves to learn from yet."), 409
+    if executor.pipeline:
+        return jsonify(error="Round-trips from pipelined runs include queueing time."), 409
+    profile = trajectory.learn_profile(list(reader.history), trajectory.load_profile(PROFILE_FILE))
+    trajectory.save_profile(PROFILE_FILE, profile)
+    return jsonify(profile)
+
+
+# === App Factory & Startup ===
+def create_app():
+    """Return the app; the motion executor thread is started per run by /send.
+
+    Production (see serving.run_production):
+        python motion.py --production
+        gunicorn -w 1 --threads 8 -b 0.0.0.0:5000 'motion:create_app()'
+    """
+    return app
+
 # === Run App ===
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--production', action='store_true', help='multi-threaded server, no debug')
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    if args.production:
+        run_production(create_app(), 5000, args.threads)
+    else:
+        # The reloader would import this module twice: two bus sockets and two telemetry writers
+        create_app().run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)
 
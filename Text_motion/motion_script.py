@@ -0,0 +1,210 @@
+# === Motion Script Compiler ===
+# Turns an uploaded motion file into a flat, validated list of operations once,
+# instead of re-parsing the text on every loop. Syntax (one statement per line,
+# '#' starts a comment, indentation is optional):
+#
+#   turn: 90          -> a 90     (degrees, may be negative, at most 3600 either way)
+#   move: 1.5         -> d 1.5    (distance, may be negative, at most 100 either way)
+#   wait: 2           pause in seconds (at most an hour; a day in total per pass)
+#   repeat: 3         repeat the block up to the matching 'end'
+#   def: patrol       define a subroutine up to the matching 'end'
+#   call: patrol      expand a subroutine defined anywhere in the file
+#   end
+#   ad: promo.jpg     tell the ad player to show this ad now (robot has arrived)
+#   waypoint: door    announce a named waypoint
+#
+# All problems are collected and reported with line numbers. Compiled programs
+# are cached by the SHA-256 of the file, so re-sending an unchanged file is free.
+import hashlib
+import math
+import threading
+
+MAX_OPS = 100000  # guards against repeat/call blowing up a tiny file
+LIMITS = {'turn': 3600.0, 'move': 100.0}  # largest |value| per command: degrees, distance units
+MAX_WAIT = 3600.0  # seconds, one wait
+MAX_WAIT_TOTAL = 24 * 3600.0  # seconds of waits in one pass of the program
+
+
+class ScriptError(Exception):
+    def __init__(self, errors):
+        self.errors = errors  # [(line_number, message), ...]
+        super().__init__('; '.join(f"line {n}: {msg}" for n, msg in errors))
+
+
+class Program:
+    """ops: [(action, param, line_number)] with action 'move' (serial string), 'wait' (seconds)
+    or 'event' ((kind, value) published on the event bus)."""
+
+    def __init__(self, ops, sha256):
+        self.ops = ops
+        self.sha256 = sha256
+        self.moves = sum(1 for action, _, _ in ops if action == 'move')
+        self.wait_seconds = sum(param for action, param, _ in ops if action == 'wait')
+        self.next_ad = self._upcoming_ads(ops)
+
+    @staticmethod
+    def _upcoming_ads(ops):
+        """For each op, the ad the next 'ad:' event (wrapping into the next loop) will show."""
+        upcoming = [None] * len(ops)
+        ad = None
+        for _ in range(2):  # second pass carries the first ad over the loop boundary
+            for index in range(len(ops) - 1, -1, -1):
+                action, param, _ = ops[index]
+                if action == 'event' and param[0] == 'ad':
+                    ad = param[1]
+                upcoming[index] = ad
+        return upcoming
+
+
+def _number(value, line_number, errors, name):
+    try:
+        number = float(value)
+    except ValueError:
+        number = math.nan
+    if not math.isfinite(number):
+        errors.append((line_number, f"{name} needs a number, got '{value}'"))
+        return None
+    return number
+
+
+def _serial_value(number):
+    """A parsed number as plain decimal text the OpenCR firmware reads (no exponent, no '-0')."""
+    text = format(number, '.4f').rstrip('0').rstrip('.')
+    return '0' if text == '-0' else text
+
+
+def _parse(text, errors):
+    """Parse into a tree: statements are ('move', serial, n) / ('wait', s, n) /
+    ('repeat', count, n, body) / ('call', name, n); returns (main, subroutines)."""
+    main, subroutines = [], {}
+    stack = [('main', None, 0, main)]  # open blocks: (kind, name_or_count, line, body)
+
+    for line_number, raw in enumerate(text.splitlines(), 1):
+        line = raw.split('#', 1)[0].strip()
+        if not line:
+            continue
+        body = stack[-1][3]
+        if line.lower() == 'end':
+            if len(stack) == 1:
+                errors.append((line_number, "'end' without an open repeat or def"))
+                continue
+            kind, arg, opened, block = stack.pop()
+            if kind == 'repeat':
+                stack[-1][3].append(('repeat', arg, opened, block))
+            continue
+        if ':' not in line:
+            errors.append((line_number, f"expected 'command: value', got '{line}'"))
+            continue
+
+        cmd, value = (part.strip() for part in line.split(':', 1))
+        cmd = cmd.lower()
+        if cmd in ('turn', 'move'):
+            number = _number(value, line_number, errors, cmd)
+            if number is not None and abs(number) > LIMITS[cmd]:
+                errors.append((line_number, f"{cmd} must be between -{LIMITS[cmd]:g} and {LIMITS[cmd]:g}"))
+            elif number is not None:
+                # Send the parsed value, so '1_0', '1e1' and ' 10.' all reach the board as '10'
+                body.append(('move', f"{'a' if cmd == 'turn' else 'd'} {_serial_value(number)}", line_number))
+        elif cmd == 'wait':
+            number = _number(value, line_number, errors, cmd)
+            if number is not None and number < 0:
+                errors.append((line_number, "wait can't be negative"))
+            elif number is not None and number > MAX_WAIT:
+                errors.append((line_number, f"wait can't be longer than {MAX_WAIT:g} seconds"))
+            elif number is not None:
+                body.append(('wait', number, line_number))
+        elif cmd == 'repeat':
+            if not (value.isascii() and value.isdecimal()) or int(value) < 1:
+                errors.append((line_number, f"repeat needs a positive whole number, got '{value}'"))
+                value = '0'
+            stack.append(('repeat', int(value), line_number, []))
+        elif cmd == 'def':
+            if any(kind == 'def' for kind, _, _, _ in stack):
+                errors.append((line_number, "def can't be nested"))
+            elif not value.isidentifier():
+                errors.append((line_number, f"bad subroutine name '{value}'"))
+            elif value in subroutines:
+                errors.append((line_number, f"subroutine '{value}' is already defined"))
+            block = []
+            subroutines.setdefault(value, (line_number, block))
+            stack.append(('def', value, line_number, block))
+        elif cmd == 'call':
+            body.append(('call', value, line_number))
+        elif cmd in ('ad', 'waypoint'):
+            if not value:
+                errors.append((line_number, f"{cmd} needs a name"))
+            else:
+                body.append(('event', (cmd, value), line_number))
+        else:
+            errors.append((line_number, f"unknown command '{cmd}'"))
+
+    for kind, arg, opened, _ in stack[1:]:
+        errors.append((opened, f"'{kind}: {arg}' is never closed with 'end'"))
+    return main, subroutines
+
+
+def _flatten(statements, subroutines, ops, errors, calling=()):
+    """Append the expanded statements to ops; False as soon as they pass MAX_OPS."""
+    for statement in statements:
+        action, arg, line_number = statement[:3]
+        if action == 'repeat':
+            # Expand the body once and size the repeat before copying it
+            body = []
+            if not _flatten(statement[3], subroutines, body, errors, calling):
+                return False
+            if len(ops) + arg * len(body) > MAX_OPS:
+                return False
+            ops.extend(body * arg)
+        elif action == 'call':
+            if arg not in subroutines:
+                errors.append((line_number, f"call to undefined subroutine '{arg}'"))
+            elif arg in calling:
+                errors.append((line_number, f"subroutine '{arg}' calls itself"))
+            elif not _flatten(subroutines[arg][1], subroutines, ops, errors, calling + (arg,)):
+                return False
+        else:
+            ops.append(statement)
+        if len(ops) > MAX_OPS:
+            return False
+    return True
+
+
+def compile_script(text):
+    """Compile motion script text; raises ScriptError listing every problem."""
+    sha256 = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    errors = []
+    main, subroutines = _parse(text, errors)
+    ops = []
+    if not errors and not _flatten(main, subroutines, ops, errors):
+        errors.append((0, f"script expands to more than {MAX_OPS} commands"))
+    if errors:
+        # One report per line is enough (a bad call inside a repeat repeats itself)
+        raise ScriptError(sorted(set(errors)))
+    if not ops:
+        raise ScriptError([(0, "script has no commands")])
+    program = Program(ops, sha256)
+    if program.wait_seconds > MAX_WAIT_TOTAL:
+        raise ScriptError([(0, f"script waits longer than {MAX_WAIT_TOTAL:g} seconds in total")])
+    return program
+
+
+# === Compiled Program Cache ===
+_cache = {}
+_cache_lock = threading.Lock()
+CACHE_SIZE = 64
+
+
+def load_program(path):
+    """Compile the file at `path`, reusing the cached program if its content was compiled before."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    sha256 = hashlib.sha256(data).hexdigest()
+    with _cache_lock:
+        program = _cache.get(sha256)
+    if program is None:
+        program = compile_script(data.decode('utf-8', errors='replace'))
+        with _cache_lock:
+            if len(_cache) >= CACHE_SIZE:
+                _cache.pop(next(iter(_cache)))
+            _cache[sha256] = program
+    return program
@@ -0,0 +1,234 @@
+# === Trajectory Engine ===
+# Predicts what a compiled motion program will do before the robot runs it:
+#   - per-command durations from a speed profile (configured, or fitted to the
+#     send -> Done round-trips the protocol reader logged on real runs)
+#   - total loop time
+#   - the planned path as NumPy arrays t, x, y, heading sampled every dt
+#   - an SVG rendering of that path for the web UI
+#   - simulate(): the real MotionExecutor driving a virtual robot whose moves
+#     take profile time divided by `speedup`, to check a route without the Jetson
+#
+# Conventions: the robot starts at (0, 0) facing +x; a positive turn is
+# counter-clockwise in degrees; move distances are in the firmware's units.
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+DEFAULT_PROFILE = {
+    'turn': {'speed': 45.0, 'overhead_s': 0.1},  # degrees per second
+    'move': {'speed': 0.2, 'overhead_s': 0.1}  # distance units per second
+}
+LETTERS = {'a': 'turn', 'd': 'move'}
+
+
+# === Speed Profiles ===
+def load_profile(path):
+    profile = json.loads(json.dumps(DEFAULT_PROFILE))
+    try:
+        with open(path) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return profile
+    for kind in profile:
+        for key in ('speed', 'overhead_s'):
+            value = saved.get(kind, {}).get(key)
+            if isinstance(value, (int, float)) and value >= 0 and (key != 'speed' or value > 0):
+                profile[kind][key] = float(value)
+    return profile
+
+
+def save_profile(path, profile):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(profile, f, indent=2)
+    os.replace(tmp, path)
+
+
+def learn_profile(history, base=None):
+    """Fit duration = overhead + |value| / speed per command kind to [(line, rtt_ms)]
+    from non-pipelined runs; kinds without enough samples keep their base values."""
+    profile = json.loads(json.dumps(base or DEFAULT_PROFILE))
+    samples = {}
+    for line, rtt_ms in history:
+        parts = line.split()
+        if len(parts) == 2 and parts[0] in LETTERS:
+            try:
+                samples.setdefault(LETTERS[parts[0]], []).append((abs(float(parts[1])), rtt_ms / 1000.0))
+            except ValueError:
+                continue
+    fitted = {}
+    for kind, pairs in samples.items():
+        values, seconds = np.array(pairs).T
+        if len(np.unique(values)) >= 2:
+            slope, intercept = np.polyfit(values, seconds, 1)
+            if slope <= 0:
+                continue
+            profile[kind] = {'speed': round(float(1.0 / slope), 4), 'overhead_s': round(max(0.0, float(intercept)), 4)}
+        else:
+            overhead = profile[kind]['overhead_s']
+            moving = seconds.mean() - overhead
+            if values[0] == 0 or moving <= 0:
+                continue
+            profile[kind]['speed'] = round(float(values[0] / moving), 4)
+        fitted[kind] = len(pairs)
+    profile['learned_from'] = fitted
+    return profile
+
+
+# === Planning ===
+def _segments(program, profile):
+    """Per op: kind code (0 wait/event, 1 turn, 2 move), signed amount, duration in seconds."""
+    kinds, amounts, durations = [], [], []
+    for action, param, _ in program.ops:
+        if action != 'move':
+            kinds.append(0)
+            amounts.append(0.0)
+            durations.append(float(param) if action == 'wait' else 0.0)
+            continue
+        letter, value = param.split()
+        kind = LETTERS[letter]
+        value = float(value)
+        kinds.append(1 if kind == 'turn' else 2)
+        amounts.append(value)
+        durations.append(profile[kind]['overhead_s'] + abs(value) / profile[kind]['speed'])
+    return np.array(kinds), np.array(amounts), np.array(durations)
+
+
+def plan(program, profile, dt=0.05):
+    """Planned trajectory: dict with loop_time_s, per-op durations and arrays t/x/y/heading (degrees)."""
+    kinds, amounts, durations = _segments(program, profile)
+    starts = np.concatenate(([0.0], np.cumsum(durations)[:-1]))
+    total = float(durations.sum())
+
+    # Pose at the start of each op
+    turns = np.where(kinds == 1, amounts, 0.0)
+    heading_start = np.concatenate(([0.0], np.cumsum(turns)[:-1]))
+    dist = np.where(kinds == 2, amounts, 0.0)
+    rad = np.radians(heading_start)
+    x_start = np.concatenate(([0.0], np.cumsum(dist * np.cos(rad))[:-1]))
+    y_start = np.concatenate(([0.0], np.cumsum(dist * np.sin(rad))[:-1]))
+
+    # Sample every dt: which op is running and how far through it
+    t = np.append(np.arange(0.0, total, dt), total)
+    index = np.clip(np.searchsorted(starts, t, side='right') - 1, 0, len(starts) - 1)
+    safe = np.where(durations[index] > 0, durations[index], 1.0)
+    frac = np.clip((t - starts[index]) / safe, 0.0, 1.0)
+    heading = heading_start[index] + np.where(kinds[index] == 1, amounts[index] * frac, 0.0)
+    travelled = np.where(kinds[index] == 2, amounts[index] * frac, 0.0)
+    x = x_start[index] + travelled * np.cos(rad[index])
+    y = y_start[index] + travelled * np.sin(rad[index])
+
+    return {
+        'loop_time_s': round(total, 3),
+        'moves': program.moves,
+        'durations_s': [round(d, 3) for d in durations.tolist()],
+        'lines': [line for _, _, line in program.ops],
+        'end_pose': {'x': round(float(x[-1]), 4) + 0.0, 'y': round(float(y[-1]), 4) + 0.0,
+                     'heading': round(float(heading[-1]) % 360, 2)},
+        't': t, 'x': x, 'y': y, 'heading': heading,
+        'waypoints': np.column_stack((x_start, y_start))
+    }
+
+
+def plan_summary(planned):
+    """JSON-safe part of a plan (no sample arrays)."""
+    xs, ys = planned['x'], planned['y']
+    summary = {key: planned[key] for key in ('loop_time_s', 'moves', 'durations_s', 'lines', 'end_pose')}
+    summary['bounds'] = {'min_x': round(float(xs.min()), 4), 'max_x': round(float(xs.max()), 4),
+                         'min_y': round(float(ys.min()), 4), 'max_y': round(float(ys.max()), 4)}
+    summary['samples'] = len(planned['t'])
+    return summary
+
+
+def render_svg(planned, size=480, margin=24):
+    """SVG of the planned path: line, a dot per command start, start (green) and end (red)."""
+    xs, ys = planned['x'], planned['y']
+    span = max(float(xs.max() - xs.min()), float(ys.max() - ys.min()), 1e-6)
+    scale = (size - 2 * margin) / span
+
+    def point(x, y):
+        # SVG y grows downwards
+        return (margin + (x - xs.min()) * scale, size - margin - (y - ys.min()) * scale)
+
+    px, py = point(xs, ys)
+    polyline = ' '.join(f"{a:.1f},{b:.1f}" for a, b in zip(px.tolist(), py.tolist()))
+    wx, wy = point(planned['waypoints'][:, 0], planned['waypoints'][:, 1])
+    dots = ''.join(f'<circle cx="{a:.1f}" cy="{b:.1f}" r="3" fill="#6c757d"/>' for a, b in zip(wx.tolist(), wy.tolist()))
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" viewBox="0 0 {size} {size}">'
+            f'<rect width="100%" height="100%" fill="white"/>'
+            f'<polyline points="{polyline}" fill="none" stroke="#007bff" stroke-width="2"/>{dots}'
+            f'<circle cx="{px[0]:.1f}" cy="{py[0]:.1f}" r="6" fill="#28a745"/>'
+            f'<circle cx="{px[-1]:.1f}" cy="{py[-1]:.1f}" r="6" fill="#dc3545"/>'
+            f'<text x="{margin}" y="{margin - 6}" font-family="sans-serif" font-size="12">'
+            f'loop {planned["loop_time_s"]:.1f}s</text></svg>')
+
+
+# === Faster-Than-Real-Time Simulation ===
+def simulate(program, profile, loops=1, speedup=50.0):
+    """Run the program through MotionExecutor against a virtual robot; returns the
+    predicted vs simulated loop time and the pose the virtual robot ended in."""
+    from opencr.sim import FakeOpenCR, FakeSerial
+    from executor import MotionExecutor
+
+    class VirtualRobot(FakeOpenCR):
+        def __init__(self):
+            super().__init__()
+            self.x = self.y = self.heading = 0.0
+            self.sim_time = 0.0
+
+        def move_time(self, cmd, value):
+            kind = profile[LETTERS[cmd]]
+            seconds = kind['overhead_s'] + abs(value) / kind['speed']
+            self.sim_time += seconds
+            if cmd == 'a':
+                self.heading += value
+            else:
+                self.x += value * math.cos(math.radians(self.heading))
+                self.y += value * math.sin(math.radians(self.heading))
+            return seconds / speedup
+
+    robot = VirtualRobot()
+    executor = MotionExecutor(lambda timeout=1: FakeSerial(timeout=timeout, opencr=robot), time_scale=speedup)
+    started = time.monotonic()
+    executor.start('simulation', program, loops=loops)
+    executor.join()
+    wall = time.monotonic() - started
+    wait_time = program.wait_seconds * loops
+
+    return {
+        'loops': loops,
+        'speedup': speedup,
+        'predicted_loop_time_s': plan(program, profile)['loop_time_s'],
+        'simulated_time_s': round((robot.sim_time + wait_time) / loops, 3) if loops else None,
+        'wall_time_s': round(wall, 3),
+        'end_pose': {'x': round(robot.x, 4) + 0.0, 'y': round(robot.y, 4) + 0.0, 'heading': round(robot.heading % 360, 2)},
+        'messages': [message for _, message in executor.drain_messages()]
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from motion_script import load_program
+
+    parser = argparse.ArgumentParser(description='Plan or simulate a motion script')
+    parser.add_argument('script')
+    parser.add_argument('--profile', default='speed_profile.json')
+    parser.add_argument('--svg', help='write the planned path to this file')
+    parser.add_argument('--simulate', action='store_true')
+    parser.add_argument('--loops', type=int, default=1)
+    parser.add_argument('--speedup', type=float, default=50.0)
+    args = parser.parse_args()
+
+    program, profile = load_program(args.script), load_profile(args.profile)
+    planned = plan(program, profile)
+    print(json.dumps(plan_summary(planned), indent=2))
+    if args.svg:
+        with open(args.svg, 'w') as f:
+            f.write(render_svg(planned))
+    if args.simulate:
+        print(json.dumps(simulate(program, profile, args.loops, args.speedup), indent=2))
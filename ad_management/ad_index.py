@@ -0,0 +1,220 @@
+# === In-Memory Ad Catalog ===
+# One index of ADS_FOLDER shared by the /api/ads endpoint and the player thread.
+# Upload/delete routes update it directly; an inotify watcher (or a polling
+# fallback where inotify is unavailable) picks up files copied in out-of-band.
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import os
+import queue
+import select
+import struct
+import threading
+import time
+from datetime import datetime
+
+import cv2
+
+from previews import file_etag
+
+# inotify(7) event masks
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def probe_media(path, typ):
+    """Return (duration_seconds, width, height); unknown values are None."""
+    try:
+        if typ == 'image':
+            img = cv2.imread(path)
+            if img is None:
+                return None, None, None
+            h, w = img.shape[:2]
+            return None, w, h
+        cap = cv2.VideoCapture(path)
+        try:
+            if not cap.isOpened():
+                return None, None, None
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+            duration = round(frames / fps, 2) if fps and frames > 0 else None
+            return duration, int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) or None, int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) or None
+        finally:
+            cap.release()
+    except Exception as e:
+        print(f"Probe failed for {path}: {e}")
+        return None, None, None
+
+
+class AdCatalog:
+    """Filename -> metadata index with a pre-serialized, ETag'd listing."""
+
+    def __init__(self, folder, is_ad, get_type, poll_interval=5.0):
+        self.folder = folder
+        self.is_ad = is_ad
+        self.get_type = get_type
+        self.poll_interval = poll_interval
+        self.version = 0
+        self.watch_mode = None
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._listing = None
+        self._playlist = None
+        self._probe_queue = queue.Queue()
+        self._listeners = []
+
+    # --- updates ---
+    def subscribe(self, callback):
+        """Call callback(filename, entry_or_None) after every change."""
+        self._listeners.append(callback)
+
+    def _changed(self, filename, entry):
+        self.version += 1
+        self._listing = None
+        self._playlist = None
+        for callback in self._listeners:
+            try:
+                callback(filename, entry)
+            except Exception as e:
+                print(f"Catalog listener error: {e}")
+
+    def refresh(self, filename):
+        """Re-stat one file and update, add or drop its entry."""
+        if not self.is_ad(filename):
+            return None
+        path = os.path.join(self.folder, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.remove(filename)
+            return None
+
+        with self._lock:
+            old = self._entries.get(filename)
+            if old and old['size'] == stat.st_size and old['mtime'] == stat.st_mtime:
+                return old
+            entry = {
+                'filename': filename,
+                'type': self.get_type(filename),
+                'size': stat.st_size,
+                'size_mb': round(stat.st_size / (1024 * 1024), 2),
+                'mtime': stat.st_mtime,
+                'modified': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
+                'duration': None,
+                'width': None,
+                'height': None,
+                'etag': file_etag(stat),
+                'url': f'/api/ads/file/{filename}',
+                'thumb_url': f'/api/ads/thumb/{filename}?v={file_etag(stat)}'
+            }
+            self._entries[filename] = entry
+            self._changed(filename, entry)
+        self._probe_queue.put(filename)
+        return entry
+
+    def remove(self, filename):
+        with self._lock:
+            if self._entries.pop(filename, None) is not None:
+                self._changed(filename, None)
+
+    def scan(self):
+        """Full resync against the folder; used at startup and by the poller."""
+        try:
+            names = {f for f in os.listdir(self.folder) if self.is_ad(f)}
+        except OSError as e:
+            print(f"Catalog scan failed: {e}")
+            return
+        for f in set(self._entries) - names:
+            self.remove(f)
+        for f in names:
+            self.refresh(f)
+
+    # --- reads ---
+    def get(self, filename):
+        return self._entries.get(filename)
+
+    def listing(self):
+        """Return (etag, json_bytes, total_size) for the current version."""
+        with self._lock:
+            if self._listing is None:
+                ads = sorted(self._entries.values(), key=lambda a: a['mtime'], reverse=True)
+                ads = [{k: v for k, v in a.items() if k != 'mtime'} for a in ads]
+                payload = json.dumps({'success': True, 'ads': ads, 'total': len(ads)}).encode('utf-8')
+                etag = hashlib.sha1(payload).hexdigest()[:16]
+                self._listing = (etag, payload, sum(a['size'] for a in ads))
+            return self._listing
+
+    def playlist(self):
+        """Ad filenames in playback (alphabetical) order."""
+        with self._lock:
+            if self._playlist is None:
+                self._playlist = sorted(self._entries)
+            return self._playlist
+
+    # --- background workers ---
+    def _probe_worker(self):
+        while True:
+            filename = self._probe_queue.get()
+            entry = self._entries.get(filename)
+            if entry is None:
+                continue
+            duration, width, height = probe_media(os.path.join(self.folder, filename), entry['type'])
+            with self._lock:
+                if self._entries.get(filename) is entry:
+                    entry.update(duration=duration, width=width, height=height)
+                    self._changed(filename, entry)
+
+    def _watch_inotify(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        if libc.inotify_add_watch(fd, os.fsencode(os.path.abspath(self.folder)), WATCH_MASK) < 0:
+            os.close(fd)
+            raise OSError(ctypes.get_errno(), 'inotify_add_watch failed')
+
+        def loop():
+            poller = select.poll()
+            poller.register(fd, select.POLLIN)
+            while True:
+                poller.poll()
+                try:
+                    data = os.read(fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+                offset = 0
+                while offset < len(data):
+                    _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                    name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+                    offset += EVENT_HEADER.size + length
+                    if mask & IN_Q_OVERFLOW:
+                        self.scan()
+                    elif name:
+                        self.refresh(os.fsdecode(name))
+        return loop
+
+    def _watch_polling(self):
+        while True:
+            time.sleep(self.poll_interval)
+            self.scan()
+
+    def start(self):
+        """Initial scan plus the probe and watcher threads."""
+        self.scan()
+        threading.Thread(target=self._probe_worker, daemon=True).start()
+        try:
+            target = self._watch_inotify()
+            self.watch_mode = 'inotify'
+        except (OSError, AttributeError) as e:
+            print(f"⚠️ inotify unavailable ({e}), polling {self.folder} every {self.poll_interval}s")
+            target = self._watch_polling
+            self.watch_mode = 'polling'
+        threading.Thread(target=target, daemon=True).start()
@@ -6,21 +6,59 @@ os.environ["QT_X11_NO_MITSHM"] = "1"
 
 # === Imports ===
 import cv2
+import sys
 import time
-import numpy as np
-import subprocess
-from datetime import datetime
-from flask import Flask, render_template, request, jsonify, send_from_directory
+import mimetypes
+from datetime import datetime, date
+import json
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 from werkzeug.utils import secure_filename
 from werkzeug.exceptions import RequestEntityTooLarge
-from threading import Thread
+from threading import Thread, Lock, Event
+from frame_cache import FrameCache, resize_to_fullscreen
+from compositor import Compositor
+from blob_store import BlobStore, SyncError, SHA256_RE
+from impressions import ImpressionRecorder
+from ad_index import AdCatalog
+from playback_engine import create_engine
+from transcoder import Transcoder
+from uploads import UploadSessions, UploadError
+from previews import ThumbnailCache, send_ranged_file
+from scheduler import Scheduler
+from player_stats import PlayerStats, SystemMonitor
+from display import create_display
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from eventbus import Subscriber
+from serving import run_production, sse_response
 
 # === Flask App Configuration ===
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['ADS_FOLDER'] = 'advertisement'
+app.config['BLOB_FOLDER'] = 'blobs'  # content-addressed storage behind ADS_FOLDER; same filesystem for hardlinks
 app.config['SECRET_KEY'] = 'jetson-ad-manager-2024'
+app.config['SCREEN_WIDTH'] = 1080
+app.config['SCREEN_HEIGHT'] = 1920
+app.config['FRAME_CACHE_MB'] = int(os.environ.get('AD_FRAME_CACHE_MB', 256))
+app.config['CATALOG_POLL_INTERVAL'] = 5.0
+app.config['PLAYLIST_FILE'] = 'playlist.json'
+app.config['STATUS_PUSH_INTERVAL'] = 2.0
+app.config['DISPLAY_MODE'] = os.environ.get('AD_DISPLAY_MODE', 'x11')  # x11 | headless
+app.config['DISPLAY_TIMEOUT'] = 60.0
+app.config['VIDEO_DECODER'] = os.environ.get('AD_VIDEO_DECODER', 'auto')  # hardware | software | auto
+app.config['VIDEO_FLIP_METHOD'] = 3
+app.config['MAX_UPLOAD_SIZE'] = 100 * 1024 * 1024
+app.config['UPLOAD_CHUNK_SIZE'] = 4 * 1024 * 1024
+app.config['TRANSCODE_WORKERS'] = int(os.environ.get('AD_TRANSCODE_WORKERS', 1))
+app.config['CUE_HOLD_SECONDS'] = 10.0  # how long a waypoint image stays up without a configured duration
+app.config['OVERLAY_FILE'] = 'overlays.json'
+app.config['OVERLAY_FPS'] = 30  # refresh rate of clock/ticker overlays while an image is held
+app.config['SYNC_WORKERS'] = 4  # parallel blob downloads when pulling from another rover
+app.config['IMPRESSIONS_DB'] = 'impressions.db'  # proof-of-play log and hourly rollups (SQLite, WAL)
+app.config['SYNC_BANDWIDTH_KBPS'] = float(os.environ.get('AD_SYNC_BANDWIDTH_KBPS', 0)) or None
+IDLE_IMAGE = 'adrover.jpg'
 
 ALLOWED_EXTENSIONS = {
     'images': {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'},
@@ -29,6 +67,12 @@ ALLOWED_EXTENSIONS = {
 
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['ADS_FOLDER'], exist_ok=True)
+os.makedirs(app.config['BLOB_FOLDER'], exist_ok=True)
+
+frame_cache = FrameCache(app.config['SCREEN_WIDTH'], app.config['SCREEN_HEIGHT'],
+                         app.config['FRAME_CACHE_MB'] * 1024 * 1024)
+# Clock, ticker, QR and banner overlays on images; videos render straight to the overlay sink
+compositor = Compositor(app.config['SCREEN_WIDTH'], app.config['SCREEN_HEIGHT'], app.config['OVERLAY_FILE'])
 
 # === Helper Functions ===
 def allowed_file(filename):
@@ -49,75 +93,58 @@ def get_file_info(filepath):
     except:
         return {'size': 0, 'modified': 'Unknown', 'size_mb': 0}
 
-def resize_to_fullscreen(image, screen_width, screen_height):
-    h, w = image.shape[:2]
-    scale = min(screen_width / w, screen_height / h)
-    resized = cv2.resize(image, (int(w * scale), int(h * scale)))
-    bg = np.zeros((screen_height, screen_width, 3), dtype=np.uint8)
-    x, y = (screen_width - resized.shape[1]) // 2, (screen_height - resized.shape[0]) // 2
-    bg[y:y+resized.shape[0], x:x+resized.shape[1]] = resized
-    return bg
-
-def wait_for_display(max_attempts=15):
-    print("⏳ Checking for display availability...")
-
-    # Check for Xorg process first
-    for i in range(10):  # Try every 1s for 10s
-        if subprocess.run(['pgrep', '-x', 'Xorg'], capture_output=True).returncode == 0:
-            print("✅ Xorg is running")
-            break
-        print(f"Waiting for Xorg... ({i+1}/10)")
-        time.sleep(1)
-    else:
-        print("❌ Xorg not found. Skipping display wait.")
-        return False
-
-    # Now check xdpyinfo (i.e. X11 access is ready)
-    for attempt in range(max_attempts):
-        for xauth in [
-            '/home/jetson/.Xauthority',
-            f'/tmp/.X0-{os.getuid()}',
-            '/var/run/lightdm/jetson/xauthority'
-        ]:
-            if os.path.exists(xauth):
-                os.environ['XAUTHORITY'] = xauth
-                result = subprocess.run(['xdpyinfo'], env=os.environ.copy(), capture_output=True)
-                if result.returncode == 0:
-                    print(f"✅ Display ready after {attempt+1} attempts")
-                    return True
-        print(f"🔁 Waiting for X display... ({attempt+1}/{max_attempts})")
-        time.sleep(1)
-
-    print("⚠️ Timeout: Display not ready")
-    return False
-
-def initialize_fullscreen_window(name, width, height):
-    for attempt in range(5):
-        try:
-            print(f"Initializing fullscreen window (attempt {attempt+1})")
-            if attempt > 0:
-                try: cv2.destroyWindow(name)
-                except: pass
-                time.sleep(0.5)
-
-            cv2.namedWindow(name, cv2.WINDOW_NORMAL | cv2.WINDOW_GUI_EXPANDED)
-            time.sleep(1)
-            test_img = np.zeros((100, 100, 3), dtype=np.uint8)
-            cv2.imshow(name, test_img)
-            cv2.waitKey(1)
-
-            cv2.setWindowProperty(name, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
-            cv2.moveWindow(name, 0, 0)
-            time.sleep(0.5)
-
-            fullscreen_test = np.zeros((height, width, 3), dtype=np.uint8)
-            cv2.imshow(name, fullscreen_test)
-            cv2.waitKey(100)
-            return True
-        except Exception as e:
-            print(f"Attempt {attempt+1} failed: {e}")
-            time.sleep(2)
-    return False
+thumbnails = ThumbnailCache(app.config['ADS_FOLDER'])
+
+def on_catalog_change(fname, entry):
+    # Modified files get a new cache key by mtime; deleted ones free their memory here
+    if entry is None:
+        frame_cache.invalidate(os.path.join(app.config['ADS_FOLDER'], fname))
+        thumbnails.invalidate(fname)
+
+ad_catalog = AdCatalog(app.config['ADS_FOLDER'], allowed_file, get_file_type,
+                       app.config['CATALOG_POLL_INTERVAL'])
+ad_catalog.subscribe(on_catalog_change)
+blob_store = BlobStore(app.config['BLOB_FOLDER'], app.config['ADS_FOLDER'], allowed_file, on_change=ad_catalog.refresh)
+ad_catalog.subscribe(lambda fname, entry: blob_store.track(fname))
+scheduler = Scheduler(app.config['PLAYLIST_FILE'], type_of=get_file_type,
+                      duration_of=lambda fname: (ad_catalog.get(fname) or {}).get('duration'))
+ad_catalog.subscribe(scheduler.library_changed)
+video_engine = None
+display = create_display(app.config['DISPLAY_MODE'], "AdPlayer", app.config['SCREEN_WIDTH'],
+                         app.config['SCREEN_HEIGHT'], os.environ["DISPLAY"], app.config['DISPLAY_TIMEOUT'])
+player_stats = PlayerStats()
+impressions = ImpressionRecorder(app.config['IMPRESSIONS_DB'])
+system_monitor = SystemMonitor()
+
+def on_normalized(job):
+    ad_catalog.refresh(job['output'])
+    if job['type'] == 'image':
+        frame_cache.warm(os.path.join(app.config['ADS_FOLDER'], job['output']))
+
+# Videos are normalized to the decoder's frame size, i.e. the panel before the flip-method rotation
+transcoder = Transcoder(
+    app.config['UPLOAD_FOLDER'], app.config['ADS_FOLDER'],
+    video_size=(app.config['SCREEN_HEIGHT'], app.config['SCREEN_WIDTH']),
+    image_size=(app.config['SCREEN_WIDTH'], app.config['SCREEN_HEIGHT']),
+    workers=app.config['TRANSCODE_WORKERS'], on_done=on_normalized)
+upload_sessions = UploadSessions(app.config['ADS_FOLDER'], app.config['MAX_UPLOAD_SIZE'])
+
+def check_upload_name(filename):
+    """Return (secure name, error response or None) for a new upload."""
+    if not filename or not allowed_file(filename):
+        return None, (jsonify({'success': False, 'error': 'Invalid file'}), 400)
+    fname = secure_filename(filename)
+    output = Transcoder.output_name(fname, get_file_type(fname))
+    if os.path.exists(os.path.join(app.config['ADS_FOLDER'], output)) or transcoder.in_progress(output):
+        return fname, (jsonify({'success': False, 'error': f'File "{output}" already exists'}), 409)
+    return fname, None
+
+def staging_path(fname):
+    return os.path.join(app.config['UPLOAD_FOLDER'], f"{time.time_ns()}_{fname}")
+
+def queued_response(fname, job):
+    return jsonify({'success': True, 'message': f'File "{fname}" uploaded, processing',
+                    'job_id': job['id'], 'job': job, 'status_url': f"/api/jobs/{job['id']}"}), 202
 
 # === Flask Routes ===
 @app.route('/')
@@ -127,27 +154,37 @@ def index():
 @app.route('/api/ads', methods=['GET'])
 def get_ads():
     try:
-        ads = []
-        for f in os.listdir(app.config['ADS_FOLDER']):
-            if allowed_file(f):
-                path = os.path.join(app.config['ADS_FOLDER'], f)
-                ads.append({
-                    'filename': f,
-                    'type': get_file_type(f),
-                    'size': get_file_info(path)['size'],
-                    'size_mb': get_file_info(path)['size_mb'],
-                    'modified': get_file_info(path)['modified'],
-                    'url': f'/api/ads/file/{f}'
-                })
-        ads.sort(key=lambda x: x['modified'], reverse=True)
-        return jsonify({'success': True, 'ads': ads, 'total': len(ads)})
+        etag, payload, _ = ad_catalog.listing()
+        response = app.response_class(payload, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/ads/file/<filename>')
 def get_ad_file(filename):
+    fname = secure_filename(filename)
+    if not allowed_file(fname):
+        return jsonify({'error': 'File not found'}), 404
+    try:
+        path = os.path.join(app.config['ADS_FOLDER'], fname)
+        return send_ranged_file(request, path, mimetypes.guess_type(fname)[0] or 'application/octet-stream')
+    except FileNotFoundError:
+        return jsonify({'error': 'File not found'}), 404
+
+@app.route('/api/ads/thumb/<filename>')
+def get_ad_thumb(filename):
+    fname = secure_filename(filename)
+    if not allowed_file(fname):
+        return jsonify({'error': 'File not found'}), 404
     try:
-        return send_from_directory(app.config['ADS_FOLDER'], filename)
+        thumb = thumbnails.get(os.path.join(app.config['ADS_FOLDER'], fname), get_file_type(fname))
+        if thumb is None:
+            return jsonify({'error': 'Could not render preview'}), 415
+        # Versioned URLs from /api/ads change whenever the file does, so they never go stale
+        cache = 'public, max-age=31536000, immutable' if request.args.get('v') else 'public, no-cache'
+        return send_ranged_file(request, thumb, 'image/jpeg', cache)
     except FileNotFoundError:
         return jsonify({'error': 'File not found'}), 404
 
@@ -155,89 +192,530 @@ def get_ad_file(filename):
 def upload_ad():
     try:
         file = request.files.get('file')
-        if not file or file.filename == '' or not allowed_file(file.filename):
+        if not file:
             return jsonify({'success': False, 'error': 'Invalid file'}), 400
-        fname = secure_filename(file.filename)
-        fpath = os.path.join(app.config['ADS_FOLDER'], fname)
-        if os.path.exists(fpath):
-            return jsonify({'success': False, 'error': f'File "{fname}" already exists'}), 409
-        file.save(fpath)
-        return jsonify({'success': True, 'message': f'File "{fname}" uploaded', 'file': get_file_info(fpath)})
+        fname, error = check_upload_name(file.filename)
+        if error:
+            return error
+        staged = staging_path(fname)
+        file.save(staged)
+        return queued_response(fname, transcoder.submit(staged, fname, get_file_type(fname)))
     except RequestEntityTooLarge:
         return jsonify({'success': False, 'error': 'File too large'}), 413
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# --- Resumable chunked uploads: init / PUT chunk at offset / finalize ---
+def upload_error(e):
+    return jsonify({'success': False, 'error': str(e), **e.extra}), e.status
+
+@app.route('/api/uploads', methods=['POST'])
+def init_upload():
+    data = request.get_json(silent=True) or {}
+    fname, error = check_upload_name(data.get('filename'))
+    if error:
+        return error
+    try:
+        session = upload_sessions.create(fname, data.get('size'), data.get('sha256'))
+    except UploadError as e:
+        return upload_error(e)
+    return jsonify({'success': True, 'chunk_size': app.config['UPLOAD_CHUNK_SIZE'], **session}), 201
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    try:
+        return jsonify({'success': True, **upload_sessions.status(upload_id)})
+    except UploadError as e:
+        return upload_error(e)
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    try:
+        offset = int(request.args.get('offset', request.headers.get('Upload-Offset', -1)))
+        new_offset = upload_sessions.write(upload_id, offset, request.stream)
+        return jsonify({'success': True, 'offset': new_offset})
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid offset'}), 400
+    except UploadError as e:
+        return upload_error(e)
+    except RequestEntityTooLarge:
+        return jsonify({'success': False, 'error': 'Chunk too large'}), 413
+
+@app.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_upload(upload_id):
+    data = request.get_json(silent=True) or {}
+    try:
+        fname = upload_sessions.status(upload_id)['filename']
+        # Another upload may have taken the name since init; the session stays for a retry or abort
+        _, error = check_upload_name(fname)
+        if error:
+            return error
+        staged = staging_path(fname)
+        upload_sessions.finalize(upload_id, staged, data.get('sha256'))
+        return queued_response(fname, transcoder.submit(staged, fname, get_file_type(fname)))
+    except UploadError as e:
+        return upload_error(e)
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def abort_upload(upload_id):
+    upload_sessions.abort(upload_id)
+    return jsonify({'success': True})
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    job = transcoder.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/api/jobs')
+def list_jobs():
+    return jsonify({'success': True, 'jobs': transcoder.jobs()})
+
+# --- Status & telemetry ---
+def build_status():
+    _, _, total_size = ad_catalog.listing()
+    return {
+        'total_ads': len(ad_catalog.playlist()),
+        'total_size_mb': round(total_size / (1024 * 1024), 2),
+        'player': player_stats.snapshot(),
+        'display': display.status(),
+        'video': video_engine.stats() if video_engine else None,
+        'frame_cache': frame_cache.stats(),
+        'store': blob_store.stats(),
+        'impressions': impressions.stats(),
+        'compositor': compositor.stats(),
+        'catalog': {'version': ad_catalog.version, 'watch_mode': ad_catalog.watch_mode},
+        'system': system_monitor.read(),
+        'timestamp': time.time()
+    }
+
+@app.route('/api/status')
+def get_status():
+    try:
+        return jsonify({'success': True, 'status': build_status()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/status/stream')
+def stream_status():
+    # Server-Sent Events: one status frame every STATUS_PUSH_INTERVAL seconds
+    def frames():
+        while True:
+            yield {'success': True, 'status': build_status()}
+            time.sleep(app.config['STATUS_PUSH_INTERVAL'])
+    return sse_response(frames())
+
+# --- Playlist scheduling ---
+@app.route('/api/playlist', methods=['GET'])
+def get_playlist():
+    ads = {f: scheduler.settings_for(f) for f in sorted(scheduler.library)}
+    return jsonify({'success': True, 'ads': ads})
+
+@app.route('/api/playlist/<filename>', methods=['PUT'])
+def update_playlist_entry(filename):
+    fname = secure_filename(filename)
+    if ad_catalog.get(fname) is None:
+        return jsonify({'success': False, 'error': 'File not found'}), 404
+    try:
+        settings = scheduler.update(fname, request.get_json(silent=True) or {})
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'filename': fname, 'settings': settings})
+
+def requested_date():
+    return date.fromisoformat(request.args['date']) if request.args.get('date') else date.today()
+
+@app.route('/api/playlist/timeline')
+def get_timeline():
+    try:
+        day = requested_date()
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid date'}), 400
+    slots = [{'start': s, 'end': e, 'filename': f} for s, e, f in scheduler.timeline(day)]
+    return jsonify({'success': True, 'date': day.isoformat(), 'slots': slots})
+
+@app.route('/api/playlist/simulate')
+def simulate_playlist():
+    try:
+        day = requested_date()
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid date'}), 400
+    return jsonify({'success': True, **scheduler.simulate(day)})
+
+def new_name_for(fname):
+    """Validate the 'new_name' of a rename/copy request: (new name, error response or None)."""
+    data = request.get_json(silent=True) or {}
+    new = secure_filename(data.get('new_name') or '')
+    if ad_catalog.get(fname) is None:
+        return None, (jsonify({'success': False, 'error': 'File not found'}), 404)
+    if not allowed_file(new) or get_file_type(new) != get_file_type(fname):
+        return None, (jsonify({'success': False, 'error': 'Invalid new name'}), 400)
+    if os.path.exists(os.path.join(app.config['ADS_FOLDER'], new)) or transcoder.in_progress(new):
+        return None, (jsonify({'success': False, 'error': f'File "{new}" already exists'}), 409)
+    return new, None
+
+@app.route('/api/ads/<filename>/rename', methods=['POST'])
+def rename_ad(filename):
+    fname = secure_filename(filename)
+    new, error = new_name_for(fname)
+    if error:
+        return error
+    try:
+        blob_store.rename(fname, new)
+    except OSError as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    scheduler.rename(fname, new)
+    ad_catalog.remove(fname)
+    ad_catalog.refresh(new)
+    return jsonify({'success': True, 'filename': new})
+
+@app.route('/api/ads/<filename>/copy', methods=['POST'])
+def copy_ad(filename):
+    fname = secure_filename(filename)
+    new, error = new_name_for(fname)
+    if error:
+        return error
+    try:
+        blob_store.duplicate(fname, new)
+    except OSError as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    scheduler.rename(fname, new, keep_old=True)
+    ad_catalog.refresh(new)
+    return jsonify({'success': True, 'filename': new}), 201
+
+# --- Multi-rover sync: manifest + blobs served here, pulled from a peer ---
+@app.route('/api/sync/manifest')
+def sync_manifest():
+    manifest = blob_store.manifest()
+    response = jsonify(manifest)
+    response.set_etag(f"{manifest['rover']}-{manifest['version']}")
+    return response.make_conditional(request)
+
+@app.route('/api/sync/blobs/<sha256>')
+def sync_blob(sha256):
+    if not SHA256_RE.match(sha256) or not blob_store.has_blob(sha256):
+        return jsonify({'error': 'Blob not found'}), 404
+    # Content-addressed: a blob URL never changes content
+    return send_ranged_file(request, blob_store.blob_path(sha256), 'application/octet-stream',
+                            'public, max-age=31536000, immutable')
+
+@app.route('/api/sync/pull', methods=['POST'])
+def start_pull():
+    data = request.get_json(silent=True) or {}
+    if not data.get('peer'):
+        return jsonify({'success': False, 'error': 'peer URL required'}), 400
+    kbps = data.get('bandwidth_kbps', app.config['SYNC_BANDWIDTH_KBPS'])
+    try:
+        job = blob_store.pull(data['peer'], int(data.get('workers', app.config['SYNC_WORKERS'])),
+                              float(kbps) * 1024 if kbps else None, bool(data.get('mirror')))
+    except SyncError as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Invalid workers or bandwidth_kbps'}), 400
+    return jsonify({'success': True, 'job': job, 'status_url': '/api/sync/pull'}), 202
+
+@app.route('/api/sync/pull', methods=['GET'])
+def pull_status():
+    return jsonify({'success': True, 'job': blob_store.pull_status()})
+
+@app.route('/api/sync/pull', methods=['DELETE'])
+def cancel_pull():
+    return jsonify({'success': blob_store.cancel_pull()})
+
+# --- Proof-of-play reports ---
+@app.route('/api/reports/impressions')
+def impression_report():
+    """Plays and airtime per ad by hour or day: ?period=day&start=2024-05-01&end=2024-06-01&ad=promo.mp4"""
+    try:
+        rows = impressions.report(request.args.get('period', 'day'), request.args.get('start'),
+                                  request.args.get('end'), request.args.get('ad'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'rows': rows})
+
+@app.route('/api/reports/impressions.csv')
+def export_impressions():
+    """Every impression as CSV, streamed; start/end are local dates (end exclusive)."""
+    try:
+        start, end = (time.mktime(date.fromisoformat(request.args[key]).timetuple()) if request.args.get(key) else None
+                      for key in ('start', 'end'))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid date'}), 400
+    return Response(stream_with_context(impressions.export_csv(start, end, request.args.get('ad'))),
+                    mimetype='text/csv', headers={'Content-Disposition': 'attachment; filename=impressions.csv'})
+
+# --- Overlays ---
+@app.route('/api/overlays', methods=['GET'])
+def get_overlays():
+    return jsonify({'success': True, 'overlays': compositor.settings})
+
+@app.route('/api/overlays', methods=['PUT'])
+def update_overlays():
+    try:
+        overlays = compositor.update(request.get_json(silent=True) or {})
+    except (TypeError, ValueError, RuntimeError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    display_wake.set()
+    return jsonify({'success': True, 'overlays': overlays})
+
 @app.route('/api/ads/<filename>', methods=['DELETE'])
 def delete_ad(filename):
     try:
-        path = os.path.join(app.config['ADS_FOLDER'], secure_filename(filename))
+        fname = secure_filename(filename)
+        path = os.path.join(app.config['ADS_FOLDER'], fname)
         if not os.path.exists(path):
             return jsonify({'success': False, 'error': 'File not found'}), 404
         os.remove(path)
+        ad_catalog.remove(fname)
         return jsonify({'success': True, 'message': f'File "{filename}" deleted'})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# === Waypoint Ads (robot event bus) ===
+# motion.py publishes 'preload' while the robot heads to a waypoint and 'ad'
+# when it arrives; the player warms the ad then cuts to it within one frame.
+cue = {'pending': None}
+robot = {'waypoint': None, 'x': None, 'y': None}  # last known position, stored with each impression
+cue_lock = Lock()
+display_wake = Event()  # set by a cue or an overlay change; ends the current hold()
+
+def on_robot_event(event):
+    topic = event.get('topic')
+    if topic == 'motion':
+        compositor.set_moving(event.get('state') == 'running')
+        display_wake.set()
+        return
+    if topic == 'waypoint':
+        player_stats.waypoint(event.get('name'))
+        robot['waypoint'] = event.get('name')
+        return
+    if topic == 'pose':
+        robot['x'], robot['y'] = event.get('x'), event.get('y')
+        return
+    fname = secure_filename(event.get('ad') or '')
+    entry = ad_catalog.get(fname)
+    if entry is None:
+        print(f"⚠️ Robot asked for unknown ad '{event.get('ad')}'")
+        return
+    path = os.path.join(app.config['ADS_FOLDER'], fname)
+    if topic == 'preload':
+        if entry['type'] == 'image':
+            frame_cache.warm(path)
+        else:
+            preload_file(path)
+    elif topic == 'ad':
+        with cue_lock:
+            cue['pending'] = (fname, entry['type'], event.get('t', time.time()))
+        display_wake.set()
+        if video_engine is not None and player_stats.snapshot()['current_type'] == 'video':
+            video_engine.interrupt()
+
+def preload_file(path):
+    """Ask the kernel to read a video into the page cache ahead of time."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+    except (OSError, AttributeError):
+        pass
+
+def cue_pending():
+    with cue_lock:
+        return cue['pending'] is not None
+
+def take_cue():
+    """The slot for a pending waypoint ad, or None."""
+    with cue_lock:
+        pending, cue['pending'] = cue['pending'], None
+        display_wake.clear()
+    if pending is None:
+        return None
+    fname, typ, published = pending
+    duration = scheduler.settings_for(fname).get('duration')
+    if duration is None:
+        duration = (ad_catalog.get(fname) or {}).get('duration') if typ == 'video' else None
+    return {'filename': fname, 'type': typ, 'starts_at': time.time(),
+            'duration': duration or app.config['CUE_HOLD_SECONDS'], 'cue_published': published}
+
+def hold(seconds):
+    """Keep the current frame up until `seconds` pass or a waypoint cue arrives; returns the key pressed.
+
+    With overlays configured the frame is recomposed every 1/OVERLAY_FPS s, and
+    shown again only when an overlay actually changed."""
+    deadline = time.monotonic() + seconds
+    while True:
+        remaining = int((deadline - time.monotonic()) * 1000)
+        if remaining <= 0:
+            return 0xFF
+        if compositor.active():
+            remaining = min(remaining, 1000 // app.config['OVERLAY_FPS'])
+        key = display.wait_key(remaining, wake=display_wake)
+        if key != 0xFF:
+            return key
+        display_wake.clear()  # before the check, so a cue arriving now still wakes the next wait
+        with cue_lock:
+            if cue['pending'] is not None:
+                return 0xFF
+        frame = compositor.refresh()
+        if frame is not None:
+            display.show(frame)
+
 # === Fullscreen Display Thread ===
 def play_ads_fullscreen():
-    wait_for_display()
-    time.sleep(1)
-    width, height = 1080, 1920
-    window_name = "AdPlayer"
+    global video_engine
+    video_engine = create_engine(app.config['VIDEO_DECODER'], flip_method=app.config['VIDEO_FLIP_METHOD'])
+    queued = {}  # filename -> PlaybackItem already handed to the running pipeline
 
-    if not initialize_fullscreen_window(window_name, width, height):
-        print("Fullscreen initialization failed")
-        return
+    # Decode the first ad while X is still coming up, so it is the first thing on screen
+    slot = scheduler.next()
+    if slot and slot['type'] == 'image':
+        first = frame_cache.warm(os.path.join(app.config['ADS_FOLDER'], slot['filename']))
+    idle_img = frame_cache.get(IDLE_IMAGE)
 
-    idle_img = cv2.imread('adrover.jpg')
+    def first_frame():
+        if slot and slot['type'] == 'image':
+            first.join()
+            return frame_cache.get(os.path.join(app.config['ADS_FOLDER'], slot['filename']))
+        return idle_img
+
+    while not display.bring_up(first_frame):
+        print("Display not ready, retrying")
     print("Ad display loop started")
 
     while True:
         try:
-            ads = sorted([f for f in os.listdir(app.config['ADS_FOLDER']) if allowed_file(f)])
-            if not ads:
+            if slot is None:
+                player_stats.idle()
                 if idle_img is not None:
-                    cv2.imshow(window_name, resize_to_fullscreen(idle_img, width, height))
-                    if cv2.waitKey(5000) & 0xFF == ord('q'): break
-                continue
-
-            for f in ads:
-                path = os.path.join(app.config['ADS_FOLDER'], f)
-                typ = get_file_type(f)
-                print(f"Playing: {f} ({typ})")
-
-                if typ == 'image':
-                    img = cv2.imread(path)
-                    if img is not None:
-                        cv2.imshow(window_name, resize_to_fullscreen(img, width, height))
-                        if cv2.waitKey(15000) & 0xFF == ord('q'): return
-                    else:
-                        print(f"Could not load image: {f}")
-                elif typ == 'video':
-                    try:
-                        # Show idle image between transitions to avoid previous frame flash
-                        if idle_img is not None:
-                            cv2.imshow(window_name, resize_to_fullscreen(idle_img, width, height))
-                            cv2.waitKey(1)
-
-                        subprocess.run([
-                            "gst-launch-1.0", "filesrc", f"location={path}", "!", "qtdemux", "name=demux",
-                            "demux.video_0", "!", "queue", "!", "h264parse", "!", "nvv4l2decoder",
-                            "!", "nvvidconv", "flip-method=3", "!", "nvoverlaysink", "sync=false"
-                        ], check=True)
-                    except subprocess.CalledProcessError as e:
-                        print("GStreamer error:", e)
+                    display.show(compositor.present(idle_img))
+                    if hold(5) == ord('q'): break
+                else:
+                    time.sleep(5)
+            else:
+                if play_slot(slot, queued, idle_img) == ord('q'):
+                    return
         except Exception as e:
             print("Display loop error:", e)
             try:
-                cv2.destroyAllWindows()
                 time.sleep(2)
-                initialize_fullscreen_window(window_name, width, height)
+                display.recover()
             except: pass
+        slot = take_cue()
+        if slot is not None:
+            queued.clear()  # the cue interrupted the engine, so these items were cancelled
+        else:
+            slot = scheduler.next()
+
+def play_slot(slot, queued, idle_img):
+    """Show one scheduled ad; returns the key pressed while it was on screen, if any."""
+    transition_start = time.perf_counter()
+    f, typ = slot['filename'], slot['type']
+    path = os.path.join(app.config['ADS_FOLDER'], f)
+    print(f"Playing: {f} ({typ})")
+
+    # Decode the next image while this ad is on screen (waypoint cues have no schedule position)
+    nxt = scheduler.following(slot) if 'index' in slot else None
+    if nxt and nxt['filename'] != f and nxt['type'] == 'image':
+        frame_cache.warm(os.path.join(app.config['ADS_FOLDER'], nxt['filename']))
+
+    if typ == 'image':
+        # The library changed under a queued video; let it finish first
+        for item in queued.values():
+            video_engine.wait(item)
+        queued.clear()
+        img = frame_cache.get(path)
+        if img is None:
+            print(f"Could not load image: {f}")
+            return None
+        display.show(compositor.present(img))
+        shown_at = time.time()
+        if 'cue_published' in slot:
+            player_stats.cue_shown(f, (time.time() - slot['cue_published']) * 1000)
+        display.wait_key(1)
+        display.first_frame_shown()
+        player_stats.ad_started(f, typ, (time.perf_counter() - transition_start) * 1000)
+        # Hold until the slot ends; a late start never cuts an ad below 1s
+        key = hold(max(1.0, slot['starts_at'] + slot['duration'] - time.time()))
+        record_impression(slot, shown_at, time.time(),
+                          'stopped' if key == ord('q') else 'interrupted' if cue_pending() else 'completed')
+        return key
+
+    if typ == 'video':
+        item = queued.pop(f, None)
+        if item is None:
+            video_engine.clear_queue()
+            queued.clear()
+            # Show idle image between transitions to avoid previous frame flash
+            if idle_img is not None:
+                display.show(idle_img)
+                display.wait_key(1)
+            item = video_engine.play(path)
+
+        # Hand a following video to the running pipeline so it starts gaplessly
+        if nxt and nxt['type'] == 'video' and nxt['filename'] not in queued:
+            queued[nxt['filename']] = video_engine.play(os.path.join(app.config['ADS_FOLDER'], nxt['filename']))
+
+        player_stats.ad_started(f, typ)
+        video_engine.wait(item)
+        # An engine that can't see frames still knows when the item started
+        shown = item.first_frame if item.first_frame is not None else item.started
+        if 'cue_published' in slot and shown is not None:
+            first_frame_at = time.time() - (time.monotonic() - shown)
+            player_stats.cue_shown(f, (first_frame_at - slot['cue_published']) * 1000)
+        if shown is not None:
+            player_stats.record_transition(round((shown - item.requested) * 1000, 1))
+            display.first_frame_shown()
+        if item.error:
+            print("GStreamer error:", item.error)
+        if shown is not None:
+            now, mono = time.time(), time.monotonic()
+            record_impression(slot, now - (mono - shown), now - (mono - (item.finished or mono)),
+                              'completed' if not item.error else 'interrupted' if item.error == 'interrupted' else 'error')
+    return None
+
+def record_impression(slot, started, ended, status):
+    f = slot['filename']
+    impressions.record(f, started, ended, status, sha256=blob_store.sha256_of(f), type=slot['type'],
+                       source='cue' if 'cue_published' in slot else 'schedule', **robot)
+
+# === App Factory & Startup ===
+_background_started = False
+_background_lock = Lock()
+
+def create_app():
+    """Return the app, starting the catalog watcher and display thread once per process.
+
+    Production (see serving.run_production):
+        python ad_manager.py --production
+        gunicorn -w 1 --threads 8 -b 0.0.0.0:5002 'ad_manager:create_app()'
+    """
+    global _background_started
+    with _background_lock:
+        if not _background_started:
+            blob_store.start()
+            impressions.start()
+            ad_catalog.start()
+            try:
+                Subscriber('ad_manager', topics={'preload', 'ad', 'waypoint', 'motion', 'pose'}).listen(on_robot_event)
+            except OSError as e:
+                print(f"⚠️ Robot event bus unavailable: {e}")
+            Thread(target=play_ads_fullscreen, daemon=True).start()
+            _background_started = True
+    return app
 
-# === Startup ===
-Thread(target=play_ads_fullscreen, daemon=True).start()
 if __name__ == '__main__':
-    print("Starting Flask server...")
-    app.run(host='0.0.0.0', port=5002, debug=True, use_reloader=False)
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--production', action='store_true', help='multi-threaded server, no debug')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--port', type=int, default=5002, help='e.g. several rovers on one machine for sync tests')
+    args = parser.parse_args()
+
+    if args.production:
+        run_production(create_app(), args.port, args.threads)
+    else:
+        print("Starting Flask server...")
+        create_app().run(host='0.0.0.0', port=args.port, debug=True, use_reloader=False)
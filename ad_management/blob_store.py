@@ -0,0 +1,496 @@
+# === Content-Addressed Ad Store ===
+# Every ad's bytes live once in BLOB_FOLDER under their SHA-256; a manifest maps
+# display names to hashes, and each name in ADS_FOLDER is a hardlink to its
+# blob. The catalog, frame cache and player keep reading ADS_FOLDER as before,
+# but a rename is a rename(2), a duplicate is a link(2), and an upload whose
+# bytes are already stored collapses onto the existing blob.
+#
+# Files that appear in ADS_FOLDER by any route (transcoder, sync, cp) are
+# hashed on a background thread and adopted by linking them into the store.
+# Blobs are made read-only because writing to a name in place would write to
+# every name that shares it; writers must replace files, as the transcoder does.
+#
+# Rovers sync by manifest: a peer (another rover, or any ad_manager acting as a
+# hub) serves its manifest and its blobs with Range support, and pull() fetches
+# only the hashes missing here, in parallel, resuming partial downloads, under
+# a shared bandwidth limit, then links the peer's names into ADS_FOLDER.
+#
+#     python blob_store.py pull http://rover-1:5002 --ads advertisement --blobs blobs --kbps 2000
+import hashlib
+import http.client
+import json
+import os
+import queue
+import re
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+BLOCK_SIZE = 1024 * 1024
+SAVE_INTERVAL = 1.0  # the adoption worker writes the manifest at most this often while busy
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+class SyncError(Exception):
+    pass
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _same_file(a, b):
+    try:
+        return os.path.samefile(a, b)
+    except OSError:
+        return False
+
+
+class RateLimiter:
+    """Token bucket shared by all download threads; rate in bytes per second, None for unlimited."""
+
+    def __init__(self, rate=None):
+        self.rate = rate
+        self._allowance = 0.0
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, n):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            # At most one second of burst
+            self._allowance = min(self.rate, self._allowance + (now - self._last) * self.rate) - n
+            self._last = now
+            wait = -self._allowance / self.rate if self._allowance < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+
+class BlobStore:
+    def __init__(self, blob_folder, ads_folder, is_ad, on_change=None):
+        self.blob_folder = blob_folder
+        self.ads_folder = ads_folder
+        self.is_ad = is_ad
+        self.on_change = on_change  # callable(name) after the store changed a name in ads_folder
+        self.manifest_path = os.path.join(blob_folder, 'manifest.json')
+        self.partial_folder = os.path.join(blob_folder, '.partial')
+        self.rover = socket.gethostname()
+        self.version = 0
+        self.ads = {}  # name -> {'sha256', 'size'}
+        self.adopted = 0
+        self.deduplicated_bytes = 0
+        self._lock = threading.RLock()
+        self._queue = queue.Queue()
+        self._dirty = False  # adoptions not yet in manifest.json (reconcile() re-tracks them after a crash)
+        self._saved_at = 0.0
+        self._job = None
+        os.makedirs(self.partial_folder, exist_ok=True)
+        self._load()
+
+    # --- manifest ---
+    def _load(self):
+        try:
+            with open(self.manifest_path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            print(f"⚠️ Ignoring unreadable manifest {self.manifest_path}: {e}")
+            return
+        self.version = data.get('version', 0)
+        self.ads = {name: entry for name, entry in data.get('ads', {}).items()
+                    if SHA256_RE.match(entry.get('sha256', ''))}
+
+    def _save(self):
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self.version += 1
+        tmp = self.manifest_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'version': self.version, 'ads': self.ads}, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.manifest_path)
+
+    def manifest(self):
+        with self._lock:
+            return {'rover': self.rover, 'version': self.version,
+                    'ads': {name: dict(entry) for name, entry in self.ads.items()}}
+
+    # --- blobs ---
+    def blob_path(self, sha256):
+        return os.path.join(self.blob_folder, sha256[:2], sha256)
+
+    def sha256_of(self, name):
+        entry = self.ads.get(name)
+        return entry['sha256'] if entry else None
+
+    def has_blob(self, sha256):
+        return os.path.exists(self.blob_path(sha256))
+
+    def _link(self, sha256, name):
+        """Point ads_folder/name at the blob atomically (link to a temp name, then rename over)."""
+        dest = os.path.join(self.ads_folder, name)
+        if _same_file(self.blob_path(sha256), dest):
+            return False
+        tmp = os.path.join(self.ads_folder, f'.link-{uuid.uuid4().hex}.tmp')
+        os.link(self.blob_path(sha256), tmp)
+        os.replace(tmp, dest)
+        return True
+
+    def _release(self, sha256):
+        """Delete a blob no name refers to any more."""
+        if sha256 and not any(entry['sha256'] == sha256 for entry in self.ads.values()):
+            try:
+                os.remove(self.blob_path(sha256))
+            except FileNotFoundError:
+                pass
+
+    def _store_file(self, path, sha256):
+        """Make `path` the blob for sha256 by linking it into the store (copying across filesystems)."""
+        blob = self.blob_path(sha256)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        try:
+            os.link(path, blob)
+        except OSError as e:
+            print(f"⚠️ Can't hardlink into {self.blob_folder} ({e}), storing a copy")
+            tmp = blob + '.tmp'
+            with open(path, 'rb') as src, open(tmp, 'wb') as dst:
+                for block in iter(lambda: src.read(BLOCK_SIZE), b''):
+                    dst.write(block)
+            os.replace(tmp, blob)
+        os.chmod(blob, 0o444)
+
+    # --- tracking ads_folder ---
+    def track(self, name):
+        """Queue a name in ads_folder to be (re)checked against the store; cheap, never blocks."""
+        self._queue.put(name)
+
+    def _worker(self):
+        while True:
+            name = self._queue.get()
+            try:
+                self._adopt(name)
+            except OSError as e:
+                print(f"⚠️ Blob store could not adopt {name}: {e}")
+            finally:
+                # One manifest write per burst, not per file: importing a folder stays linear
+                if self._dirty and (self._queue.empty() or time.monotonic() - self._saved_at >= SAVE_INTERVAL):
+                    with self._lock:
+                        self._save()
+                self._queue.task_done()
+
+    def wait_idle(self):
+        """Block until every queued name has been checked."""
+        self._queue.join()
+
+    def _adopt(self, name):
+        path = os.path.join(self.ads_folder, name)
+        with self._lock:
+            entry = self.ads.get(name)
+            if not os.path.exists(path):
+                if entry is not None:
+                    del self.ads[name]
+                    self._release(entry['sha256'])
+                    self._dirty = True
+                return
+            if entry is not None and _same_file(self.blob_path(entry['sha256']), path):
+                return
+        if not self.is_ad(name):
+            return
+
+        before = os.stat(path)
+        sha256 = file_sha256(path)  # outside the lock: can take seconds for a large video
+        changed = False
+        with self._lock:
+            after = os.stat(path)
+            if (after.st_ino, after.st_size, after.st_mtime_ns) != (before.st_ino, before.st_size, before.st_mtime_ns):
+                self.track(name)  # replaced while we were hashing: check the new file
+                return
+            size = after.st_size
+            if self.has_blob(sha256):
+                # Same bytes are already stored (a re-upload or copy): collapse onto that blob
+                changed = self._link(sha256, name)
+                if changed:
+                    self.deduplicated_bytes += size
+            else:
+                self._store_file(path, sha256)
+                self.adopted += 1
+            old = self.ads.get(name)
+            self.ads[name] = {'sha256': sha256, 'size': size}
+            if old is not None and old['sha256'] != sha256:
+                self._release(old['sha256'])
+            self._dirty = True
+        if changed and self.on_change:
+            self.on_change(name)
+
+    def reconcile(self):
+        """Startup pass: link manifest names that are missing from ads_folder, queue everything else."""
+        restored = []
+        with self._lock:
+            for name, entry in list(self.ads.items()):
+                if os.path.exists(os.path.join(self.ads_folder, name)):
+                    continue
+                if self.has_blob(entry['sha256']):
+                    self._link(entry['sha256'], name)
+                    restored.append(name)
+                else:
+                    del self.ads[name]
+            self._save()
+        for name in sorted(os.listdir(self.ads_folder)):
+            if self.is_ad(name):
+                self.track(name)
+        return restored
+
+    def start(self):
+        threading.Thread(target=self._worker, daemon=True).start()
+        for name in self.reconcile():
+            if self.on_change:
+                self.on_change(name)
+
+    # --- names ---
+    def rename(self, old, new):
+        """Rename an ad; costs one rename(2) whatever the file size."""
+        with self._lock:
+            os.rename(os.path.join(self.ads_folder, old), os.path.join(self.ads_folder, new))
+            if old in self.ads:
+                self.ads[new] = self.ads.pop(old)
+                self._save()
+            else:
+                self.track(new)
+
+    def duplicate(self, name, new):
+        """Give an ad a second name; both share the blob."""
+        with self._lock:
+            os.link(os.path.join(self.ads_folder, name), os.path.join(self.ads_folder, new))
+            if name in self.ads:
+                self.ads[new] = dict(self.ads[name])
+                self._save()
+            else:
+                self.track(new)
+
+    def stats(self):
+        with self._lock:
+            sizes = {}
+            for entry in self.ads.values():
+                sizes[entry['sha256']] = entry['size']
+            return {
+                'names': len(self.ads),
+                'blobs': len(sizes),
+                'logical_mb': round(sum(entry['size'] for entry in self.ads.values()) / (1024 * 1024), 2),
+                'stored_mb': round(sum(sizes.values()) / (1024 * 1024), 2),
+                'version': self.version,
+                'adopted': self.adopted,
+                'deduplicated_mb': round(self.deduplicated_bytes / (1024 * 1024), 2),
+                'pending_checks': self._queue.qsize()
+            }
+
+    # === Sync ===
+    def pull(self, peer, workers=4, bandwidth=None, mirror=False):
+        """Start pulling a peer's manifest in the background; returns the job dict.
+
+        peer: base URL of an ad_manager (e.g. http://10.0.0.12:5002)
+        bandwidth: bytes per second across all workers, None for unlimited
+        mirror: also remove local ads the peer doesn't have"""
+        with self._lock:
+            if self._job is not None and self._job['state'] == 'running':
+                raise SyncError('A pull is already running')
+            job = {'id': uuid.uuid4().hex[:12], 'peer': peer.rstrip('/'), 'state': 'running',
+                   'mirror': mirror, 'bandwidth': bandwidth, 'workers': workers,
+                   'blobs_total': 0, 'blobs_done': 0, 'bytes_total': 0, 'bytes_done': 0,
+                   'bytes_resumed': 0, 'added': [], 'updated': [], 'removed': [],
+                   'error': None, 'started': time.time(), 'finished': None}
+            self._job = job
+            self._cancel = threading.Event()
+        threading.Thread(target=self._run_pull, args=(job, self._cancel), daemon=True).start()
+        return dict(job)
+
+    def cancel_pull(self):
+        with self._lock:
+            if self._job is not None and self._job['state'] == 'running':
+                self._cancel.set()
+                return True
+        return False
+
+    def pull_status(self):
+        with self._lock:
+            return dict(self._job) if self._job else None
+
+    def _run_pull(self, job, cancel):
+        try:
+            remote = self._fetch_json(job['peer'] + '/api/sync/manifest')
+            if not isinstance(remote, dict) or not isinstance(remote.get('ads', {}), dict):
+                raise SyncError(f"{job['peer']} sent a malformed manifest")
+            wanted = {}
+            for name, entry in remote.get('ads', {}).items():
+                sha256 = entry.get('sha256') if isinstance(entry, dict) else None
+                size = entry.get('size', 0) if isinstance(entry, dict) else None
+                if os.path.basename(name) != name or name.startswith('.') or not self.is_ad(name) \
+                        or not isinstance(sha256, str) or not SHA256_RE.match(sha256) \
+                        or type(size) is not int or size < 0:
+                    print(f"⚠️ Skipping manifest entry {name!r} from {job['peer']}")
+                    continue
+                wanted[name] = {'sha256': sha256, 'size': size}
+
+            missing = {}
+            for entry in wanted.values():
+                if not self.has_blob(entry['sha256']):
+                    missing[entry['sha256']] = entry['size']
+            job['blobs_total'] = len(missing)
+            job['bytes_total'] = sum(missing.values())
+            limiter = RateLimiter(job['bandwidth'])
+            progress = threading.Lock()
+
+            def fetch(sha256):
+                self._fetch_blob(job, sha256, missing[sha256], limiter, cancel, progress)
+                with progress:
+                    job['blobs_done'] += 1
+
+            with ThreadPoolExecutor(max_workers=max(1, job['workers']), thread_name_prefix='sync') as pool:
+                for future in [pool.submit(fetch, sha256) for sha256 in sorted(missing, key=missing.get)]:
+                    future.result()  # re-raises the first failure
+            if cancel.is_set():
+                job['state'] = 'cancelled'
+                return
+            self._apply(job, wanted)
+            job['state'] = 'done'
+            print(f"✅ Pulled from {job['peer']}: {len(job['added'])} added, {len(job['updated'])} updated, "
+                  f"{len(job['removed'])} removed, {job['bytes_done'] / (1024 * 1024):.1f}MB fetched")
+        except (SyncError, OSError, ValueError) as e:
+            job['state'] = 'cancelled' if cancel.is_set() else 'failed'
+            job['error'] = str(e)
+            print(f"❌ Pull from {job['peer']} {job['state']}: {e}")
+        finally:
+            if job['state'] == 'running':
+                job['state'] = 'failed'  # anything unexpected still ends the job
+                job['error'] = job['error'] or 'unexpected error'
+            job['finished'] = time.time()
+
+    @staticmethod
+    def _fetch_json(url):
+        try:
+            with urllib.request.urlopen(url, timeout=30) as resp:
+                return json.loads(resp.read().decode('utf-8'))
+        except urllib.error.URLError as e:
+            raise SyncError(f'{url}: {e}')
+
+    def _fetch_blob(self, job, sha256, size, limiter, cancel, progress):
+        """Download one blob into .partial, resuming from what is already there, then verify it."""
+        part = os.path.join(self.partial_folder, sha256 + '.part')
+        digest = hashlib.sha256()
+        offset = 0
+        if os.path.exists(part):
+            with open(part, 'rb') as f:
+                for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+                    digest.update(block)
+                    offset += len(block)
+            with progress:
+                job['bytes_resumed'] += offset
+                job['bytes_done'] += offset
+
+        if offset < size or size == 0:
+            req = urllib.request.Request(f"{job['peer']}/api/sync/blobs/{sha256}")
+            if offset:
+                req.add_header('Range', f'bytes={offset}-')
+            try:
+                resp = urllib.request.urlopen(req, timeout=30)
+            except urllib.error.URLError as e:
+                raise SyncError(f'blob {sha256[:12]}: {e}')
+            with resp, open(part, 'ab') as f:
+                if offset and resp.status != 206:
+                    # Peer ignored the range: start over
+                    f.truncate(0)
+                    digest = hashlib.sha256()
+                    with progress:
+                        job['bytes_done'] -= offset
+                    offset = 0
+                try:
+                    while not cancel.is_set():
+                        block = resp.read(64 * 1024)
+                        if not block:
+                            break
+                        limiter.consume(len(block))
+                        f.write(block)
+                        digest.update(block)
+                        offset += len(block)
+                        with progress:
+                            job['bytes_done'] += len(block)
+                except (OSError, http.client.HTTPException) as e:
+                    raise SyncError(f'blob {sha256[:12]} interrupted at {offset}/{size} bytes: {e}')
+            if cancel.is_set():
+                raise SyncError('cancelled')
+            if offset < size:
+                # Connection dropped mid-body: keep the .part so the next pull resumes from it
+                raise SyncError(f'blob {sha256[:12]} interrupted at {offset}/{size} bytes')
+
+        if digest.hexdigest() != sha256:
+            os.remove(part)
+            raise SyncError(f'blob {sha256[:12]} failed verification')
+        with self._lock:
+            blob = self.blob_path(sha256)
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            os.chmod(part, 0o444)
+            os.replace(part, blob)
+
+    def _apply(self, job, wanted):
+        """Link the peer's names into ads_folder; with mirror, drop the names it doesn't have."""
+        changed = []
+        with self._lock:
+            for name, entry in sorted(wanted.items()):
+                old = self.ads.get(name)
+                if old is not None and old['sha256'] == entry['sha256'] and \
+                        _same_file(self.blob_path(entry['sha256']), os.path.join(self.ads_folder, name)):
+                    continue
+                self._link(entry['sha256'], name)
+                self.ads[name] = dict(entry)
+                if old is not None:
+                    self._release(old['sha256'])
+                job['updated' if old is not None else 'added'].append(name)
+                changed.append(name)
+            if job['mirror']:
+                for name in sorted(set(self.ads) - set(wanted)):
+                    entry = self.ads.pop(name)
+                    try:
+                        os.remove(os.path.join(self.ads_folder, name))
+                    except FileNotFoundError:
+                        pass
+                    self._release(entry['sha256'])
+                    job['removed'].append(name)
+                    changed.append(name)
+            self._save()
+        for name in changed:
+            if self.on_change:
+                self.on_change(name)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Pull ads from another rover into a local store')
+    parser.add_argument('command', choices=['pull'])
+    parser.add_argument('peer')
+    parser.add_argument('--ads', default='advertisement')
+    parser.add_argument('--blobs', default='blobs')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--kbps', type=float, help='bandwidth limit in kilobytes per second')
+    parser.add_argument('--mirror', action='store_true', help='also delete ads the peer does not have')
+    args = parser.parse_args()
+
+    ad_extensions = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp', 'mp4', 'avi', 'mov', 'mkv', 'webm', 'flv'}
+    os.makedirs(args.ads, exist_ok=True)
+    store = BlobStore(args.blobs, args.ads, lambda f: '.' in f and f.rsplit('.', 1)[1].lower() in ad_extensions)
+    store.start()
+    store.wait_idle()  # adopt local files first so their blobs aren't downloaded again
+    store.pull(args.peer, args.workers, args.kbps * 1024 if args.kbps else None, args.mirror)
+    while store.pull_status()['state'] == 'running':
+        time.sleep(0.5)
+    status = store.pull_status()
+    print(json.dumps(status, indent=2))
@@ -0,0 +1,449 @@
+# === Overlay Compositor ===
+# Puts live content (clock, price ticker, QR code, "robot moving" banner) on
+# top of the current ad without allocating per frame:
+#   - two preallocated panel-sized buffers; frames are composed into the back
+#     one and swapped, so the buffer last handed to imshow is never written
+#   - each buffer keeps its own list of dirty rectangles; only those are
+#     restored from the ad and redrawn, so a clock tick touches 0.1% of a frame
+#   - text is drawn from a cache of rasterised character glyphs and QR codes
+#     from a cache of rendered symbols, so changing a price or the minute only
+#     copies cached pixels into a layer's preallocated mask
+#   - ads that are not panel-sized are letterboxed straight into a
+#     preallocated buffer with cv2.resize(dst=...), unlike resize_to_fullscreen
+# With no overlay enabled present() hands the ad frame through untouched.
+#
+# Overlays use OpenCV's Hershey fonts, which only cover ASCII; other
+# characters are drawn as '?'.
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+FONT = cv2.FONT_HERSHEY_DUPLEX
+DEFAULT_OVERLAYS = {
+    'clock': {'enabled': False, 'format': '%H:%M'},
+    'ticker': {'enabled': False, 'text': '', 'speed': 120},  # pixels per second
+    'qr': {'enabled': False, 'data': '', 'size': 240},
+    'moving_banner': {'enabled': False, 'text': 'Robot moving - please stand clear'}
+}
+MAX_TICKER_SPEED = 2000  # pixels per second
+MAX_QR_BYTES = 1024  # UTF-8 payload; well inside what a version 40 symbol holds
+
+
+def validate_overlays(settings):
+    """Return a clean overlay settings dict or raise ValueError."""
+    clean = json.loads(json.dumps(DEFAULT_OVERLAYS))
+    for name, values in settings.items():
+        if name not in clean:
+            raise ValueError(f'Unknown overlay "{name}"')
+        for key, value in values.items():
+            if key not in clean[name]:
+                raise ValueError(f'Unknown setting "{name}.{key}"')
+            clean[name][key] = value
+    for name in clean:
+        clean[name]['enabled'] = bool(clean[name]['enabled'])
+    for name, key in (('clock', 'format'), ('ticker', 'text'), ('qr', 'data'), ('moving_banner', 'text')):
+        clean[name][key] = str(clean[name][key])
+    clean['ticker']['speed'] = float(clean['ticker']['speed'])
+    if not (math.isfinite(clean['ticker']['speed']) and 0 <= clean['ticker']['speed'] <= MAX_TICKER_SPEED):
+        raise ValueError(f'ticker.speed must be between 0 and {MAX_TICKER_SPEED}')
+    try:
+        qr_bytes = len(clean['qr']['data'].encode('utf-8'))
+    except UnicodeEncodeError:
+        raise ValueError('qr.data is not valid text')  # lone surrogates crash the encoder
+    if qr_bytes > MAX_QR_BYTES:
+        raise ValueError(f'qr.data must be at most {MAX_QR_BYTES} bytes')
+    clean['qr']['size'] = int(clean['qr']['size'])
+    if not 64 <= clean['qr']['size'] <= 1024:
+        raise ValueError('qr.size must be between 64 and 1024')
+    time.strftime(clean['clock']['format'])
+    return clean
+
+
+def letterbox(image, out):
+    """Scale image to fit `out` (h, w, 3) uint8, centred on black, writing only into `out`."""
+    screen_height, screen_width = out.shape[:2]
+    h, w = image.shape[:2]
+    if (w, h) == (screen_width, screen_height):
+        np.copyto(out, image)
+        return out
+    scale = min(screen_width / w, screen_height / h)
+    new_w, new_h = int(w * scale), int(h * scale)
+    x, y = (screen_width - new_w) // 2, (screen_height - new_h) // 2
+    out[:y] = 0
+    out[y + new_h:] = 0
+    out[y:y + new_h, :x] = 0
+    out[y:y + new_h, x + new_w:] = 0
+    cv2.resize(image, (new_w, new_h), dst=out[y:y + new_h, x:x + new_w])
+    return out
+
+
+def _intersect(a, b):
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    return (x0, y0, x1 - x0, y1 - y0) if x1 > x0 and y1 > y0 else None
+
+
+# === Glyph & Symbol Caches ===
+class GlyphCache:
+    """Masks (uint8, 0 or 255) of single characters, rasterised once per (char, height)."""
+
+    def __init__(self, thickness=2):
+        self.thickness = thickness
+        self.misses = 0
+        self._glyphs = {}
+        self._lock = threading.Lock()
+
+    def glyph(self, ch, height):
+        key = (ch, height)
+        glyph = self._glyphs.get(key)
+        if glyph is None:
+            glyph = self._render(ch if ' ' <= ch <= '~' else '?', height)
+            with self._lock:
+                self._glyphs[key] = glyph
+                self.misses += 1
+        return glyph
+
+    def _render(self, ch, height):
+        # Size the font so ascender + descender fill `height`; every glyph has that height
+        scale = cv2.getFontScaleFromHeight(FONT, int(height * 0.7), self.thickness)
+        (width, _), _ = cv2.getTextSize(ch, FONT, scale, self.thickness)
+        canvas = np.zeros((height, max(width, 1)), np.uint8)
+        cv2.putText(canvas, ch, (0, int(height * 0.78)), FONT, scale, 255, self.thickness, cv2.LINE_8)
+        return canvas
+
+    def width(self, text, height):
+        return sum(self.glyph(ch, height).shape[1] for ch in text)
+
+    def draw(self, text, mask, x=0):
+        """Copy the glyphs of text into the 2-D `mask` from column x; returns the end column."""
+        height, limit = mask.shape
+        for ch in text:
+            glyph = self.glyph(ch, height)
+            w = min(glyph.shape[1], limit - x)
+            if w <= 0:
+                break
+            np.copyto(mask[:, x:x + w], glyph[:, :w])
+            x += w
+        return x
+
+
+class QRCache:
+    """Rendered QR symbols (BGR, with the quiet zone) keyed by (data, size)."""
+
+    def __init__(self, capacity=16):
+        self.capacity = capacity
+        self._symbols = OrderedDict()
+        self._encoder = cv2.QRCodeEncoder.create() if hasattr(cv2, 'QRCodeEncoder') else None
+
+    def symbol(self, data, size):
+        key = (data, size)
+        symbol = self._symbols.get(key)
+        if symbol is not None:
+            self._symbols.move_to_end(key)
+            return symbol
+        if self._encoder is None:
+            raise RuntimeError('this OpenCV build has no QRCodeEncoder')
+        try:
+            modules = self._encoder.encode(data)
+        except cv2.error:
+            modules = None
+        if modules is None or modules.size == 0:
+            raise ValueError(f'could not encode "{data}" as a QR code')
+        modules = cv2.copyMakeBorder(modules, 4, 4, 4, 4, cv2.BORDER_CONSTANT, value=255)
+        symbol = cv2.cvtColor(cv2.resize(modules, (size, size), interpolation=cv2.INTER_NEAREST), cv2.COLOR_GRAY2BGR)
+        self._symbols[key] = symbol
+        while len(self._symbols) > self.capacity:
+            self._symbols.popitem(last=False)
+        return symbol
+
+
+glyphs = GlyphCache()
+qr_codes = QRCache()
+
+
+# === Layers ===
+class Layer:
+    """A rectangle of the panel drawn as `pixels` where `mask` is set, optionally
+    over a translucent panel. Buffers are allocated once, at construction."""
+
+    def __init__(self, name, rect, color=(255, 255, 255), panel=None, opacity=0.6):
+        self.name = name
+        self.rect = rect  # (x, y, w, h) in panel coordinates
+        self.visible = True
+        self.changed = True
+        x, y, w, h = rect
+        self.pixels = np.empty((h, w, 3), np.uint8)
+        self.pixels[:] = color
+        self.mask = np.zeros((h, w), np.uint8)
+        self.panel = None
+        self.opacity = opacity
+        if panel is not None:
+            self.panel = np.empty((h, w, 3), np.uint8)
+            self.panel[:] = panel
+
+    def tick(self, now):
+        """Advance time-driven content; sets self.changed when pixels moved."""
+
+    def source(self):
+        return self.pixels, self.mask
+
+    def draw(self, dst, region):
+        """Draw the part of this layer inside `region` (panel coordinates) onto dst."""
+        x, y, w, h = region
+        lx, ly = x - self.rect[0], y - self.rect[1]
+        out = dst[y:y + h, x:x + w]
+        if self.panel is not None:
+            cv2.addWeighted(out, 1.0 - self.opacity, self.panel[ly:ly + h, lx:lx + w], self.opacity, 0, dst=out)
+        pixels, mask = self.source()
+        cv2.copyTo(pixels[ly:ly + h, lx:lx + w], mask[ly:ly + h, lx:lx + w], dst=out)
+
+
+class TextLayer(Layer):
+    def __init__(self, name, rect, text='', align='left', **kwargs):
+        super().__init__(name, rect, **kwargs)
+        self.align = align
+        self.text = None
+        self.set_text(text)
+
+    def set_text(self, text):
+        if text == self.text:
+            return
+        self.text = text
+        self.mask[:] = 0
+        height, width = self.mask.shape[:2]
+        text_width = glyphs.width(text, height)
+        if text_width > width:  # shrink to fit, vertically centred
+            shrunk = max(8, height * width // text_width)
+            top = (height - shrunk) // 2
+            height, text_width = shrunk, glyphs.width(text, shrunk)
+        else:
+            top = 0
+        mask = self.mask[top:top + height]
+        start = {'left': 0, 'right': width - text_width, 'center': (width - text_width) // 2}[self.align]
+        glyphs.draw(text, mask, max(0, start))
+        self.changed = True
+
+
+class ClockLayer(TextLayer):
+    def __init__(self, name, rect, fmt='%H:%M', **kwargs):
+        self.fmt = fmt
+        self._second = None
+        super().__init__(name, rect, time.strftime(fmt), **kwargs)
+
+    def tick(self, now):
+        second = int(now)
+        if second != self._second:  # strftime at most once a second
+            self._second = second
+            self.set_text(time.strftime(self.fmt, time.localtime(now)))
+
+
+class TickerLayer(Layer):
+    """Text scrolling right to left. The text is rasterised once into a strip
+    that repeats its start, so every scroll position is a view into it."""
+
+    def __init__(self, name, rect, text, speed=120.0, **kwargs):
+        super().__init__(name, rect, **kwargs)
+        self.speed = speed
+        h, w = self.mask.shape[:2]
+        gap = h  # blank space between repetitions
+        self.period = glyphs.width(text, h) + gap
+        self.strip = np.zeros((h, self.period + w), np.uint8)
+        glyphs.draw(text, self.strip)
+        for start in range(self.period, self.period + w, self.period):
+            width = min(self.period, self.period + w - start)
+            np.copyto(self.strip[:, start:start + width], self.strip[:, :width])
+        self.offset = -1
+        self._started = None
+
+    def tick(self, now):
+        if self._started is None:
+            self._started = now
+        offset = int((now - self._started) * self.speed) % self.period
+        if offset != self.offset:
+            self.offset = offset
+            self.changed = True
+
+    def source(self):
+        return self.pixels, self.strip[:, self.offset:self.offset + self.rect[2]]
+
+
+class ImageLayer(Layer):
+    def __init__(self, name, rect, image, **kwargs):
+        super().__init__(name, rect, **kwargs)
+        np.copyto(self.pixels, image)
+        self.mask[:] = 255
+
+
+# === Compositor ===
+class Compositor:
+    def __init__(self, width, height, settings_path=None):
+        self.width = width
+        self.height = height
+        self.settings_path = settings_path
+        self.settings = validate_overlays({})
+        self.layers = []  # bottom to top
+        self.moving = False
+        self.stale = False
+        self.buffers = [np.zeros((height, width, 3), np.uint8) for _ in range(2)]
+        self._fitted = np.zeros((height, width, 3), np.uint8)  # letterboxed ad when it isn't panel-sized
+        self._base = None
+        self._back = 0
+        self._full = [True, True]  # buffer needs the whole frame redrawn
+        self._dirty = [[], []]  # per buffer: rects to restore and redraw
+        self._lock = threading.Lock()
+        self.frames = 0
+        self.compose_seconds = 0.0
+        self.last_dirty_pixels = 0
+        self.load()
+
+    # --- persisted overlay settings ---
+    def load(self):
+        if not self.settings_path:
+            return self.configure({})
+        try:
+            with open(self.settings_path) as f:
+                data = json.load(f)
+            return self.configure(data)
+        except FileNotFoundError:
+            return self.configure({})
+        except ValueError as e:
+            print(f"⚠️ Ignoring unreadable overlay settings {self.settings_path}: {e}")
+            return self.configure({})
+
+    def save(self):
+        tmp = self.settings_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.settings, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.settings_path)
+
+    def update(self, changes):
+        """Merge per-overlay changes into the settings, rebuild the layers and persist."""
+        if not isinstance(changes, dict):
+            raise ValueError('Overlay settings must be an object')
+        merged = json.loads(json.dumps(self.settings))
+        for name, values in changes.items():
+            if not isinstance(values, dict):
+                raise ValueError(f'Settings for "{name}" must be an object')
+            merged.setdefault(name, {}).update(values)
+        settings = self.configure(merged)
+        if self.settings_path:
+            self.save()
+        return settings
+
+    def configure(self, settings):
+        """Build the overlay layers for settings; returns the clean settings."""
+        clean = validate_overlays(settings)
+        w, h = self.width, self.height
+        margin = w // 36
+        ticker_h = h // 24
+        layers = []
+        if clean['qr']['enabled'] and clean['qr']['data']:
+            size = clean['qr']['size']
+            symbol = qr_codes.symbol(clean['qr']['data'], size)
+            layers.append(ImageLayer('qr', (w - size - margin, h - size - ticker_h - 2 * margin, size, size), symbol))
+        if clean['clock']['enabled']:
+            layers.append(ClockLayer('clock', (w // 2, margin, w // 2 - margin, h // 24),
+                                     clean['clock']['format'], align='right'))
+        if clean['ticker']['enabled'] and clean['ticker']['text']:
+            layers.append(TickerLayer('ticker', (0, h - ticker_h - margin, w, ticker_h), clean['ticker']['text'],
+                                      clean['ticker']['speed'], panel=(0, 0, 0), opacity=0.6))
+        if clean['moving_banner']['enabled']:
+            banner = TextLayer('moving_banner', (0, h // 12, w, h // 20), clean['moving_banner']['text'],
+                               align='center', panel=(0, 0, 170), opacity=0.75)
+            banner.visible = self.moving
+            layers.append(banner)
+        with self._lock:
+            self.settings = clean
+            self.stale = not layers and bool(self.layers)  # the bare ad must go back up
+            self.layers = layers
+            self._full = [True, True]
+        return clean
+
+    def set_moving(self, moving):
+        """Show or hide the 'robot moving' banner."""
+        with self._lock:
+            self.moving = moving
+            for layer in self.layers:
+                if layer.name == 'moving_banner' and layer.visible != moving:
+                    layer.visible = moving
+                    layer.changed = True
+
+    def active(self):
+        """True when any overlay is configured, so holds must keep refreshing."""
+        return bool(self.layers)
+
+    # --- frames ---
+    def present(self, frame, now=None):
+        """Make `frame` (any size) the ad under the overlays and return the frame to show."""
+        with self._lock:
+            if frame.shape[:2] == (self.height, self.width):
+                self._base = frame
+            else:
+                self._base = letterbox(frame, self._fitted)
+            if not self.layers:
+                self.stale = False
+                return self._base
+            self._full = [True, True]
+            return self._compose(time.time() if now is None else now)
+
+    def refresh(self, now=None):
+        """Advance animated overlays; the new frame to show, or None when nothing changed."""
+        with self._lock:
+            if self._base is None:
+                return None
+            if not self.layers:
+                stale, self.stale = self.stale, False
+                return self._base if stale else None
+            return self._compose(time.time() if now is None else now, skip_unchanged=True)
+
+    def _compose(self, now, skip_unchanged=False):
+        started = time.perf_counter()
+        for layer in self.layers:
+            layer.tick(now)
+            if layer.changed:
+                layer.changed = False
+                self._dirty[0].append(layer.rect)
+                self._dirty[1].append(layer.rect)
+        back = self._back
+        if skip_unchanged and not self._full[back] and not self._dirty[back]:
+            return None
+
+        buffer = self.buffers[back]
+        if self._full[back]:
+            regions = [(0, 0, self.width, self.height)]
+            self._full[back] = False
+        else:
+            regions = self._dirty[back]
+        dirty_pixels = 0
+        for region in regions:
+            x, y, w, h = region
+            np.copyto(buffer[y:y + h, x:x + w], self._base[y:y + h, x:x + w])
+            dirty_pixels += w * h
+            for layer in self.layers:
+                if layer.visible:
+                    clip = _intersect(region, layer.rect)
+                    if clip is not None:
+                        layer.draw(buffer, clip)
+        self._dirty[back].clear()
+
+        self._back = 1 - back
+        self.frames += 1
+        self.compose_seconds += time.perf_counter() - started
+        self.last_dirty_pixels = dirty_pixels
+        return buffer
+
+    def stats(self):
+        with self._lock:
+            return {
+                'layers': [{'name': layer.name, 'visible': layer.visible} for layer in self.layers],
+                'frames': self.frames,
+                'avg_compose_ms': round(self.compose_seconds * 1000 / self.frames, 3) if self.frames else None,
+                'last_dirty_pixels': self.last_dirty_pixels,
+                'glyphs_rendered': glyphs.misses
+            }
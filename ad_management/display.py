@@ -0,0 +1,234 @@
+# === Display Bring-Up ===
+# State machine that gets the fullscreen AdPlayer window up as fast as X allows:
+#   waiting_x -> creating_window -> ready   (or -> failed on timeout)
+# X availability is checked in-process instead of forking pgrep/xdpyinfo: a
+# socket connect first, then a real XOpenDisplay through libX11 so a server we
+# aren't authorized for (wrong XAUTHORITY) counts as not ready rather than
+# aborting inside namedWindow. Retries back off exponentially instead of sleeping
+# a fixed second, and the first frame shown is a real ad rather than a black
+# test image. Phase timings are kept for /api/status.
+#
+# HeadlessDisplay has the same show()/wait_key() surface with no X at all, for
+# tests and CI (AD_DISPLAY_MODE=headless).
+import ctypes
+import ctypes.util
+import os
+import socket
+import threading
+import time
+
+import cv2
+import numpy as np
+
+PUMP_INTERVAL_MS = 50  # how often a hold lets HighGUI handle X events and keys
+
+XAUTHORITY_CANDIDATES = [
+    '/home/jetson/.Xauthority',
+    f'/tmp/.X0-{os.getuid()}',
+    '/var/run/lightdm/jetson/xauthority'
+]
+
+
+def backoff(initial=0.05, maximum=2.0, factor=2.0):
+    delay = initial
+    while True:
+        yield delay
+        delay = min(maximum, delay * factor)
+
+
+def x_socket_address(display):
+    """(family, address) of the X server for a DISPLAY value such as ':0' or 'host:0.0'."""
+    host, _, rest = display.rpartition(':')
+    number = int(rest.split('.')[0] or 0)
+    if host in ('', 'unix'):
+        return socket.AF_UNIX, f'/tmp/.X11-unix/X{number}'
+    return socket.AF_INET, (host, 6000 + number)
+
+
+def _load_xlib():
+    try:
+        xlib = ctypes.CDLL(ctypes.util.find_library('X11') or 'libX11.so.6')
+    except OSError:
+        return None
+    xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+    xlib.XOpenDisplay.restype = ctypes.c_void_p
+    xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+    return xlib
+
+
+_xlib = _load_xlib()
+
+
+def x_available(display):
+    """True once the X server accepts connections and lets us open the display."""
+    try:
+        family, address = x_socket_address(display)
+    except ValueError:
+        return False
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.settimeout(0.5)
+        try:
+            sock.connect(address)
+        except OSError:
+            return False
+    if _xlib is None:
+        return True  # no libX11 to ask; the socket is the best we know
+    # XOpenDisplay reads XAUTHORITY on every call, so a fixed-up path is picked up
+    handle = _xlib.XOpenDisplay(display.encode())
+    if not handle:
+        print(f"⚠️ X server on {display} refused the connection (check XAUTHORITY)")
+        return False
+    _xlib.XCloseDisplay(handle)
+    return True
+
+
+class _PhaseClock:
+    def __init__(self):
+        self.state = 'starting'
+        self.started = time.monotonic()
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def enter(self, state):
+        with self._lock:
+            self.state = state
+            self.phases[state] = round((time.monotonic() - self.started) * 1000, 1)
+
+    def snapshot(self):
+        with self._lock:
+            return {'state': self.state, 'phase_ms': dict(self.phases)}
+
+
+class WindowDisplay:
+    """The real fullscreen OpenCV window on the X server."""
+
+    mode = 'x11'
+
+    def __init__(self, window_name, width, height, display=':0', timeout=60.0):
+        self.window_name = window_name
+        self.width = width
+        self.height = height
+        self.display = display
+        self.timeout = timeout
+        self.clock = _PhaseClock()
+
+    def _pick_xauthority(self):
+        if os.environ.get('XAUTHORITY') and os.path.exists(os.environ['XAUTHORITY']):
+            return
+        for path in XAUTHORITY_CANDIDATES:
+            if os.path.exists(path):
+                os.environ['XAUTHORITY'] = path
+                return
+
+    def _wait_for_x(self, deadline):
+        self.clock.enter('waiting_x')
+        for delay in backoff():
+            self._pick_xauthority()
+            if x_available(self.display):
+                print(f"✅ X server on {self.display} is accepting connections")
+                return True
+            if time.monotonic() + delay > deadline:
+                return False
+            time.sleep(delay)
+
+    def _create_window(self, first_frame, deadline):
+        self.clock.enter('creating_window')
+        for delay in backoff(0.1):
+            try:
+                cv2.namedWindow(self.window_name, cv2.WINDOW_NORMAL | cv2.WINDOW_GUI_EXPANDED)
+                cv2.setWindowProperty(self.window_name, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
+                cv2.moveWindow(self.window_name, 0, 0)
+                self.show(first_frame)
+                cv2.waitKey(1)
+                return True
+            except cv2.error as e:
+                print(f"Window creation failed: {e}")
+                try: cv2.destroyWindow(self.window_name)
+                except cv2.error: pass
+            if time.monotonic() + delay > deadline:
+                return False
+            time.sleep(delay)
+
+    def _resolve(self, first_frame):
+        # A callable lets the caller decode the first ad while we wait for X
+        frame = first_frame() if callable(first_frame) else first_frame
+        return frame if frame is not None else np.zeros((self.height, self.width, 3), dtype=np.uint8)
+
+    def bring_up(self, first_frame=None):
+        """Block until the window shows first_frame (or a black frame); False on timeout."""
+        deadline = time.monotonic() + self.timeout
+        if self._wait_for_x(deadline) and self._create_window(self._resolve(first_frame), deadline):
+            self.clock.enter('ready')
+            return True
+        self.clock.enter('failed')
+        print("⚠️ Timeout: display not ready")
+        return False
+
+    def recover(self):
+        try:
+            cv2.destroyAllWindows()
+        except cv2.error:
+            pass
+        return self.bring_up()
+
+    def first_frame_shown(self):
+        if 'first_ad' not in self.clock.phases:
+            self.clock.enter('first_ad')
+
+    def show(self, frame):
+        cv2.imshow(self.window_name, frame)
+
+    def wait_key(self, ms, wake=None):
+        """cv2.waitKey(ms); with a threading.Event `wake`, return early (0xFF) once it is set."""
+        if wake is None:
+            return cv2.waitKey(ms) & 0xFF
+        deadline = time.monotonic() + ms / 1000.0
+        while True:
+            # Sleep on the event itself, so a cue ends the hold at once and an idle
+            # hold only wakes to pump the window (~20 times a second)
+            remaining = deadline - time.monotonic()
+            if wake.wait(max(0.0, min(PUMP_INTERVAL_MS / 1000.0, remaining))):
+                return 0xFF
+            key = cv2.waitKey(1) & 0xFF
+            if key != 0xFF or remaining <= PUMP_INTERVAL_MS / 1000.0:
+                return key
+
+    def status(self):
+        return {'mode': self.mode, **self.clock.snapshot()}
+
+
+class HeadlessDisplay(WindowDisplay):
+    """Virtual display: frames are kept in memory and wait_key just sleeps."""
+
+    mode = 'headless'
+
+    def __init__(self, window_name, width, height, **kwargs):
+        super().__init__(window_name, width, height)
+        self.last_frame = None
+        self.frames_shown = 0
+
+    def bring_up(self, first_frame=None):
+        self.show(self._resolve(first_frame))
+        self.clock.enter('ready')
+        return True
+
+    def recover(self):
+        return True
+
+    def show(self, frame):
+        self.last_frame = frame
+        self.frames_shown += 1
+
+    def wait_key(self, ms, wake=None):
+        if wake is None:
+            time.sleep(max(ms, 1) / 1000.0)
+        else:
+            wake.wait(max(ms, 1) / 1000.0)
+        return 0xFF
+
+
+def create_display(mode, window_name, width, height, display=':0', timeout=60.0):
+    if mode == 'headless':
+        print("Display: headless (virtual) mode")
+        return HeadlessDisplay(window_name, width, height)
+    return WindowDisplay(window_name, width, height, display, timeout)
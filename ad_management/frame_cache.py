@@ -0,0 +1,131 @@
+# === Display-Ready Frame Cache ===
+# Holds ads already decoded and letterboxed to the panel resolution so that an
+# image transition in the player loop is a single cv2.imshow of a cached buffer.
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+def resize_to_fullscreen(image, screen_width, screen_height):
+    h, w = image.shape[:2]
+    if (w, h) == (screen_width, screen_height):
+        return image  # already normalized at upload time
+    scale = min(screen_width / w, screen_height / h)
+    resized = cv2.resize(image, (int(w * scale), int(h * scale)))
+    bg = np.zeros((screen_height, screen_width, 3), dtype=np.uint8)
+    x, y = (screen_width - resized.shape[1]) // 2, (screen_height - resized.shape[0]) // 2
+    bg[y:y+resized.shape[0], x:x+resized.shape[1]] = resized
+    return bg
+
+
+class FrameCache:
+    """LRU cache of display-ready frames bounded by a memory budget in bytes.
+
+    Entries are keyed by (path, mtime, size, width, height), so a file that is
+    replaced on disk is never served stale: its new stat gives a new key.
+    """
+
+    def __init__(self, width, height, budget_bytes=256 * 1024 * 1024):
+        self.width = width
+        self.height = height
+        self.budget_bytes = budget_bytes
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.load_seconds = 0.0
+        self.last_load_ms = None
+        self._frames = OrderedDict()
+        self._keys_by_path = {}
+        self._lock = threading.Lock()
+
+    def _key(self, path):
+        stat = os.stat(path)
+        return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, self.width, self.height)
+
+    def _load(self, path):
+        started = time.perf_counter()
+        img = cv2.imread(path)
+        if img is None:
+            return None
+        frame = resize_to_fullscreen(img, self.width, self.height)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.loads += 1
+            self.load_seconds += elapsed
+            self.last_load_ms = round(elapsed * 1000, 1)
+        return frame
+
+    def get(self, path):
+        """Return the display-ready frame for path, decoding it on a miss."""
+        try:
+            key = self._key(path)
+        except OSError:
+            return None
+
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None:
+                self._frames.move_to_end(key)
+                self.hits += 1
+                return frame
+            self.misses += 1
+
+        frame = self._load(path)
+        if frame is not None:
+            self._store(key, frame)
+        return frame
+
+    def _store(self, key, frame):
+        if frame.nbytes > self.budget_bytes:
+            return
+        with self._lock:
+            # Drop any older version of the same file first
+            old_key = self._keys_by_path.get(key[0])
+            if old_key is not None and old_key != key:
+                self._evict(old_key)
+            if key in self._frames:
+                self._frames.move_to_end(key)
+                return
+            self._frames[key] = frame
+            self._keys_by_path[key[0]] = key
+            self.used_bytes += frame.nbytes
+            while self.used_bytes > self.budget_bytes and self._frames:
+                self._evict(next(iter(self._frames)))
+
+    def _evict(self, key):
+        frame = self._frames.pop(key, None)
+        if frame is not None:
+            self.used_bytes -= frame.nbytes
+        if self._keys_by_path.get(key[0]) == key:
+            del self._keys_by_path[key[0]]
+
+    def warm(self, path):
+        """Decode path into the cache without blocking the caller."""
+        thread = threading.Thread(target=self.get, args=(path,), daemon=True)
+        thread.start()
+        return thread
+
+    def invalidate(self, path):
+        with self._lock:
+            key = self._keys_by_path.get(os.path.abspath(path))
+            if key is not None:
+                self._evict(key)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._frames),
+                'used_mb': round(self.used_bytes / (1024 * 1024), 2),
+                'budget_mb': round(self.budget_bytes / (1024 * 1024), 2),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+                'last_decode_resize_ms': self.last_load_ms,
+                'avg_decode_resize_ms': round(self.load_seconds * 1000 / self.loads, 1) if self.loads else None
+            }
@@ -0,0 +1,213 @@
+# === Impression Recorder ===
+# Proof of play for advertisers: every time an ad is on screen the player calls
+# record() with when it started and ended, the content hash, how it ended and
+# where the robot was. record() only puts a dict on an in-memory queue; one
+# writer thread drains the queue in batches into SQLite (WAL mode), so the
+# render thread never waits on disk and readers never block the writer.
+#
+# Each batch also updates rollup_hourly and rollup_daily (local hour/day x ad
+# -> plays, completed plays, airtime) in the same transaction. Reports read the
+# rollups, so they stay fast over months of data; an impression counts towards
+# the hour it started in. The raw table is indexed by start time for exports.
+#
+# Plain INSERT + UPDATE is used instead of UPSERT, which needs SQLite 3.24.
+import csv
+import io
+import queue
+import sqlite3
+import threading
+import time
+
+COLUMNS = ('ad', 'sha256', 'type', 'started', 'ended', 'duration', 'status', 'source', 'waypoint', 'x', 'y')
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS impressions (
+    id INTEGER PRIMARY KEY,
+    ad TEXT NOT NULL,
+    sha256 TEXT,
+    type TEXT,
+    started REAL NOT NULL,
+    ended REAL NOT NULL,
+    duration REAL NOT NULL,
+    status TEXT NOT NULL,   -- completed | interrupted | stopped | error
+    source TEXT,            -- schedule | cue
+    waypoint TEXT,
+    x REAL,
+    y REAL
+);
+CREATE INDEX IF NOT EXISTS impressions_started ON impressions (started);
+CREATE INDEX IF NOT EXISTS impressions_ad_started ON impressions (ad, started);
+"""
+ROLLUP = """
+CREATE TABLE IF NOT EXISTS {table} (
+    {period} TEXT NOT NULL,
+    ad TEXT NOT NULL,
+    plays INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0,
+    airtime REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY ({period}, ad)
+);
+"""
+PERIODS = {  # period -> (rollup table, local time bucket format)
+    'hour': ('rollup_hourly', '%Y-%m-%d %H'),
+    'day': ('rollup_daily', '%Y-%m-%d')
+}
+
+
+class ImpressionRecorder:
+    def __init__(self, db_path, batch_size=500, flush_interval=1.0, max_queued=100000):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.last_batch_ms = None
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._thread = None
+        db = self._connect()
+        try:
+            db.executescript(SCHEMA + ''.join(ROLLUP.format(table=table, period=period)
+                                              for period, (table, _) in PERIODS.items()))
+        finally:
+            db.close()
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, timeout=30)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')  # WAL + NORMAL: durable across app crashes, fast commits
+        return db
+
+    # --- render thread side ---
+    def record(self, ad, started, ended, status, **fields):
+        """Queue one impression; never blocks. Extra fields: sha256, type, source, waypoint, x, y."""
+        row = dict.fromkeys(COLUMNS)
+        row.update(fields, ad=ad, started=started, ended=ended, duration=max(0.0, ended - started), status=status)
+        try:
+            self._queue.put_nowait(row)
+            self.recorded += 1
+        except queue.Full:
+            self.dropped += 1
+
+    # --- writer thread ---
+    def start(self):
+        self._thread = threading.Thread(target=self._writer, daemon=True)
+        self._thread.start()
+        return self
+
+    def flush(self, timeout=10.0):
+        """Wait until everything recorded so far is committed (for shutdown and tests)."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _writer(self):
+        db = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            # Collect until the batch is full or flush_interval passed since its first row
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(db, batch)
+            except sqlite3.Error as e:
+                print(f"⚠️ Could not write {len(batch)} impressions: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, db, batch):
+        started = time.perf_counter()
+        rollups = {period: {} for period in PERIODS}
+        for row in batch:
+            local = time.localtime(row['started'])
+            for period, (_, fmt) in PERIODS.items():
+                rollup = rollups[period]
+                key = (time.strftime(fmt, local), row['ad'])
+                plays, completed, airtime = rollup.get(key, (0, 0, 0.0))
+                rollup[key] = (plays + 1, completed + (row['status'] == 'completed'), airtime + row['duration'])
+        with db:
+            db.executemany(f"INSERT INTO impressions ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                           [tuple(row[c] for c in COLUMNS) for row in batch])
+            for period, rollup in rollups.items():
+                table = PERIODS[period][0]
+                db.executemany(f'INSERT OR IGNORE INTO {table} ({period}, ad) VALUES (?, ?)', list(rollup))
+                db.executemany(f'UPDATE {table} SET plays = plays + ?, completed = completed + ?, '
+                               f'airtime = airtime + ? WHERE {period} = ? AND ad = ?',
+                               [values + key for key, values in rollup.items()])
+        self.written += len(batch)
+        self.batches += 1
+        self.last_batch_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    # --- reports ---
+    def report(self, period='day', start=None, end=None, ad=None):
+        """Plays, completed plays and airtime per ad and hour/day; start/end are local
+        'YYYY-MM-DD' (or 'YYYY-MM-DD HH' for hours) bounds, end exclusive."""
+        if period not in PERIODS:
+            raise ValueError(f'period must be one of {sorted(PERIODS)}')
+        where, params = [], []
+        if start:
+            where.append(f'{period} >= ?')
+            params.append(start)
+        if end:
+            where.append(f'{period} < ?')
+            params.append(end)
+        if ad:
+            where.append('ad = ?')
+            params.append(ad)
+        sql = (f"SELECT {period}, ad, plays, completed, airtime FROM {PERIODS[period][0]} "
+               f"{'WHERE ' + ' AND '.join(where) if where else ''} ORDER BY {period}, ad")
+        db = self._connect()
+        try:
+            rows = db.execute(sql, params).fetchall()
+        finally:
+            db.close()
+        return [{period: b, 'ad': a, 'plays': p, 'completed': c, 'airtime_s': round(t, 1)} for b, a, p, c, t in rows]
+
+    def export_csv(self, start=None, end=None, ad=None, chunk=1000):
+        """Yield the raw impressions as CSV text, a chunk of rows at a time; start/end are timestamps."""
+        where, params = [], []
+        if start is not None:
+            where.append('started >= ?')
+            params.append(start)
+        if end is not None:
+            where.append('started < ?')
+            params.append(end)
+        if ad:
+            where.append('ad = ?')
+            params.append(ad)
+        sql = (f"SELECT {', '.join(COLUMNS)} FROM impressions {'WHERE ' + ' AND '.join(where) if where else ''} "
+               f"ORDER BY started")
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(COLUMNS)
+        db = self._connect()
+        try:
+            cursor = db.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(chunk)
+                if not rows:
+                    break
+                writer.writerows(rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue()
+        finally:
+            db.close()
+
+    def stats(self):
+        return {
+            'recorded': self.recorded,
+            'written': self.written,
+            'queued': self._queue.qsize(),
+            'dropped': self.dropped,
+            'batches': self.batches,
+            'last_batch_ms': self.last_batch_ms
+        }
@@ -0,0 +1,335 @@
+# === Video Playback Engine ===
+# Keeps one GStreamer playbin alive for all video ads and feeds the next file
+# into it from about-to-finish, so consecutive videos play back to back without
+# a new gst-launch process, pipeline negotiation or decoder init per ad.
+#
+# Hardware mode renders through nvv4l2decoder/nvvidconv/nvoverlaysink on the
+# Jetson. Software mode forces avdec_h264 into a fakesink (or any sink given as
+# a launch description) so the engine runs on a plain Linux box:
+#
+#     python playback_engine.py --software a.mp4 b.mp4
+import os
+import subprocess
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+
+try:
+    import gi
+    gi.require_version('Gst', '1.0')
+    from gi.repository import Gst
+    Gst.init(None)
+except (ImportError, ValueError):
+    Gst = None
+
+HARDWARE_SINK = 'nvvidconv flip-method={flip} ! nvoverlaysink sync=false'
+SOFTWARE_SINK = 'videoconvert ! fakesink sync=true'
+PLAY_FLAG_VIDEO = 0x1
+PREROLL_MARKERS = (b'PREROLLED', b'does not need PREROLL')  # gst-launch: first buffer reached the sink
+
+
+class PlaybackItem:
+    """One queued ad and what happened when it played."""
+
+    def __init__(self, path):
+        self.path = path
+        self.requested = time.monotonic()
+        self.started = None
+        self.first_frame = None
+        self.finished = None
+        self.dropped_frames = 0  # None when the engine can't count them
+        self.rendered_frames = 0
+        self.error = None
+        self.done = threading.Event()
+
+    @property
+    def startup_latency_ms(self):
+        if self.first_frame is None:
+            return None
+        return round((self.first_frame - self.requested) * 1000, 1)
+
+    def to_dict(self):
+        return {
+            'file': os.path.basename(self.path),
+            'startup_latency_ms': self.startup_latency_ms,
+            'dropped_frames': self.dropped_frames,
+            'rendered_frames': self.rendered_frames,
+            'duration_s': round(self.finished - self.started, 2) if self.finished and self.started else None,
+            'error': self.error
+        }
+
+
+class _EngineBase(ABC):
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self.current = None
+        self.history = deque(maxlen=50)
+
+    @abstractmethod
+    def play(self, path):
+        """Queue path for playback and return its PlaybackItem immediately."""
+
+    def wait(self, item, timeout=None):
+        item.done.wait(timeout)
+        return item
+
+    @abstractmethod
+    def interrupt(self):
+        """Drop the queue and end the current item right away (e.g. for a waypoint ad)."""
+
+    def clear_queue(self):
+        """Drop queued items that have not started yet."""
+        with self._cond:
+            while self._pending:
+                item = self._pending.popleft()
+                item.error = 'cancelled'
+                item.done.set()
+
+    def _finish(self, item, error=None):
+        if item is None or item.done.is_set():
+            return
+        item.finished = time.monotonic()
+        item.error = item.error or error
+        self.history.append(item)
+        item.done.set()
+        if error:
+            print(f"Video playback error ({os.path.basename(item.path)}): {error}")
+        else:
+            dropped = 'n/a' if item.dropped_frames is None else item.dropped_frames
+            print(f"🎬 {os.path.basename(item.path)}: startup {item.startup_latency_ms} ms, {dropped} dropped frames")
+
+    def stats(self):
+        with self._cond:
+            recent = [i.to_dict() for i in self.history]
+            current = self.current.to_dict() if self.current else None
+        latencies = [i['startup_latency_ms'] for i in recent if i['startup_latency_ms'] is not None]
+        dropped = [i['dropped_frames'] for i in recent if i['dropped_frames'] is not None]
+        return {
+            'engine': self.name,
+            'current': current,
+            'queued': len(self._pending),
+            'recent': recent[-10:],
+            'avg_startup_latency_ms': round(sum(latencies) / len(latencies), 1) if latencies else None,
+            'dropped_frames': sum(dropped) if dropped or not recent else None
+        }
+
+
+class GstEngine(_EngineBase):
+    """Single long-lived playbin with gapless about-to-finish queueing."""
+
+    name = 'gstreamer'
+
+    def __init__(self, software=False, sink=None, flip_method=3):
+        super().__init__()
+        self.software = software
+        self._next = None
+        self._set_decoder_ranks(software)
+
+        self.playbin = Gst.ElementFactory.make('playbin', 'adplayer')
+        self.playbin.set_property('flags', PLAY_FLAG_VIDEO)
+        sink_desc = sink or (SOFTWARE_SINK if software else HARDWARE_SINK.format(flip=flip_method))
+        self.sink = Gst.parse_bin_from_description(sink_desc, True)
+        self.playbin.set_property('video-sink', self.sink)
+        self.playbin.connect('about-to-finish', self._on_about_to_finish)
+        self.sink.get_static_pad('sink').add_probe(
+            Gst.PadProbeType.BUFFER | Gst.PadProbeType.EVENT_DOWNSTREAM, self._on_sink_data)
+        self.playbin.set_state(Gst.State.READY)
+        threading.Thread(target=self._bus_loop, daemon=True).start()
+
+    @staticmethod
+    def _set_decoder_ranks(software):
+        registry = Gst.Registry.get()
+        hw = registry.lookup_feature('nvv4l2decoder')
+        sw = registry.lookup_feature('avdec_h264')
+        if software and hw:
+            hw.set_rank(Gst.Rank.NONE)
+        elif hw:
+            hw.set_rank(Gst.Rank.PRIMARY + 1)
+        if sw:
+            sw.set_rank(Gst.Rank.PRIMARY + (1 if software else 0))
+
+    def play(self, path):
+        item = PlaybackItem(os.path.abspath(path))
+        with self._cond:
+            idle = self.current is None
+            if idle:
+                self.current = item
+            else:
+                self._pending.append(item)
+        if idle:
+            self._start(item)
+        return item
+
+    def _start(self, item):
+        # State changes wait on the streaming thread, so never hold _cond here
+        self.playbin.set_state(Gst.State.READY)
+        self.playbin.set_property('uri', Gst.filename_to_uri(item.path))
+        self.playbin.set_state(Gst.State.PLAYING)
+
+    def interrupt(self):
+        self.clear_queue()
+        with self._cond:
+            item, self.current, self._next = self.current, None, None
+            self._finish(item, 'interrupted')
+        self.playbin.set_state(Gst.State.READY)
+
+    def _on_about_to_finish(self, playbin):
+        # Streaming thread: hand playbin the next uri so it switches without a gap
+        with self._cond:
+            if self._pending and self._next is None:
+                self._next = self._pending.popleft()
+                self._next.requested = time.monotonic()
+                playbin.set_property('uri', Gst.filename_to_uri(self._next.path))
+
+    def _on_sink_data(self, pad, info):
+        # Runs in the streaming thread, in order with the frames it describes
+        if info.type & Gst.PadProbeType.EVENT_DOWNSTREAM:
+            if info.get_event().type == Gst.EventType.STREAM_START:
+                with self._cond:
+                    if self._next is not None:
+                        # Gapless switch: the previous item ends where the next one starts
+                        self._finish(self.current)
+                        self.current, self._next = self._next, None
+                    if self.current:
+                        self.current.started = time.monotonic()
+            return Gst.PadProbeReturn.OK
+        item = self.current
+        if item is not None:
+            if item.first_frame is None:
+                item.first_frame = time.monotonic()
+            item.rendered_frames += 1
+        return Gst.PadProbeReturn.OK
+
+    def _bus_loop(self):
+        bus = self.playbin.get_bus()
+        mask = Gst.MessageType.EOS | Gst.MessageType.ERROR | Gst.MessageType.QOS
+        while True:
+            msg = bus.timed_pop_filtered(Gst.SECOND, mask)
+            if msg is None:
+                continue
+            with self._cond:
+                if msg.type == Gst.MessageType.QOS:
+                    _, _, dropped = msg.parse_qos_stats()
+                    if self.current and dropped > 0:
+                        self.current.dropped_frames = dropped
+                    continue
+                error = None
+                if msg.type == Gst.MessageType.ERROR:
+                    err, _ = msg.parse_error()
+                    error = err.message
+                self._finish(self.current, error)
+                self._next = None
+                self.current = self._pending.popleft() if self._pending else None
+                item = self.current
+            if item is not None:
+                item.requested = time.monotonic()
+                self._start(item)
+            else:
+                self.playbin.set_state(Gst.State.READY)
+
+
+class LaunchEngine(_EngineBase):
+    """Fallback without PyGObject: one gst-launch-1.0 process per ad, run in order.
+
+    Startup latency runs to the PREROLLED line gst-launch prints once the first
+    buffer reaches the sink; dropped frames aren't visible from outside (None)."""
+
+    name = 'gst-launch'
+
+    def __init__(self, software=False, sink=None, flip_method=3):
+        super().__init__()
+        decoder = 'avdec_h264' if software else 'nvv4l2decoder'
+        sink_desc = sink or (SOFTWARE_SINK if software else HARDWARE_SINK.format(flip=flip_method))
+        self.pipeline = ['queue', '!', 'h264parse', '!', decoder, '!'] + sink_desc.split()
+        self._proc = None
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def play(self, path):
+        item = PlaybackItem(os.path.abspath(path))
+        item.dropped_frames = None
+        with self._cond:
+            self._pending.append(item)
+            self._cond.notify()
+        return item
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                item = self.current = self._pending.popleft()
+            item.requested = item.started = time.monotonic()
+            try:
+                proc = subprocess.Popen(["gst-launch-1.0", "filesrc", f"location={item.path}", "!", "qtdemux",
+                                         "name=demux", "demux.video_0", "!"] + self.pipeline,
+                                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                with self._cond:
+                    self._proc = proc
+                tail, errors = deque(maxlen=5), deque(maxlen=3)
+                for line in proc.stdout:
+                    if item.first_frame is None and any(marker in line for marker in PREROLL_MARKERS):
+                        item.first_frame = time.monotonic()
+                    (errors if line.startswith(b'ERROR') else tail).append(line)
+                proc.wait()
+                if proc.returncode == 0 and item.first_frame is None:
+                    item.first_frame = item.started  # played, but the marker never showed up
+                error = None if proc.returncode == 0 else (b''.join(errors or tail).decode(errors='ignore').strip()[-200:]
+                                                           or f"gst-launch exited with {proc.returncode}")
+            except OSError as e:
+                error = str(e)
+            with self._cond:
+                self._proc = None
+                self._finish(item, error)
+                self.current = None
+
+    def interrupt(self):
+        self.clear_queue()
+        with self._cond:
+            proc = self._proc
+            if self.current is not None:
+                self.current.error = 'interrupted'
+        if proc is not None:
+            proc.terminate()
+
+
+def _launch_has(element):
+    try:
+        return subprocess.run(['gst-inspect-1.0', '--exists', element], timeout=10,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+
+def create_engine(mode='auto', sink=None, flip_method=3):
+    """mode is 'hardware', 'software' or 'auto' (hardware when nvv4l2decoder exists)."""
+    if Gst is None:
+        # 'auto' asks gst-inspect for nvv4l2decoder and falls back to software when it can't tell
+        software = mode == 'software' or (mode == 'auto' and not _launch_has('nvv4l2decoder'))
+        print(f"⚠️ PyGObject/GStreamer bindings not found, using gst-launch per video "
+              f"({'software' if software else 'hardware'} decode)")
+        return LaunchEngine(software, sink, flip_method)
+    if mode == 'auto':
+        software = Gst.ElementFactory.find('nvv4l2decoder') is None
+    else:
+        software = mode == 'software'
+    print(f"Video engine: playbin ({'software' if software else 'hardware'} decode)")
+    return GstEngine(software, sink, flip_method)
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Play video ads back to back and report timings')
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--software', action='store_true', help='avdec_h264 + fakesink instead of the Jetson path')
+    parser.add_argument('--sink', help='custom sink launch description, e.g. "videoconvert ! filesink location=out.raw"')
+    args = parser.parse_args()
+
+    engine = create_engine('software' if args.software else 'auto', args.sink)
+    items = [engine.play(f) for f in args.files]
+    for item in items:
+        engine.wait(item)
+    print(json.dumps(engine.stats(), indent=2))
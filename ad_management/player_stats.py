@@ -0,0 +1,147 @@
+# === Playback & System Telemetry ===
+# In-process counters updated by the player loop plus Jetson readings from
+# /proc and /sys, combined into the /api/status payload. Every reading degrades
+# to None when the file behind it does not exist (e.g. on a dev laptop).
+import glob
+import os
+import threading
+import time
+
+GPU_LOAD_PATHS = ['/sys/devices/gpu.0/load', '/sys/devices/platform/gpu.0/load']
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+class SystemMonitor:
+    """CPU/GPU load, memory and thermal zones; CPU load is the delta between calls."""
+
+    def __init__(self):
+        self._last_cpu = None
+        self._lock = threading.Lock()
+
+    def _cpu_percent(self):
+        line = _read('/proc/stat')
+        if not line:
+            return None
+        fields = [int(v) for v in line.splitlines()[0].split()[1:]]
+        idle, total = fields[3] + (fields[4] if len(fields) > 4 else 0), sum(fields)
+        with self._lock:
+            last, self._last_cpu = self._last_cpu, (idle, total)
+        if last is None or total == last[1]:
+            return None
+        return round(100.0 * (1 - (idle - last[0]) / (total - last[1])), 1)
+
+    @staticmethod
+    def _gpu_percent():
+        for path in GPU_LOAD_PATHS:
+            value = _read(path)
+            if value and value.isdigit():
+                return round(int(value) / 10.0, 1)  # reported in per-mille
+        return None
+
+    @staticmethod
+    def _memory():
+        text = _read('/proc/meminfo')
+        if not text:
+            return None
+        info = {}
+        for line in text.splitlines():
+            key, _, value = line.partition(':')
+            info[key] = int(value.split()[0])
+        total, available = info.get('MemTotal'), info.get('MemAvailable')
+        if not total or available is None:
+            return None
+        return {'total_mb': round(total / 1024), 'used_mb': round((total - available) / 1024),
+                'percent': round(100.0 * (total - available) / total, 1)}
+
+    @staticmethod
+    def _temperatures():
+        temps = {}
+        for zone in sorted(glob.glob('/sys/class/thermal/thermal_zone*')):
+            name, value = _read(os.path.join(zone, 'type')), _read(os.path.join(zone, 'temp'))
+            if name and value and value.lstrip('-').isdigit():
+                temps[name] = round(int(value) / 1000.0, 1)
+        return temps or None
+
+    def read(self):
+        return {
+            'cpu_percent': self._cpu_percent(),
+            'gpu_percent': self._gpu_percent(),
+            'memory': self._memory(),
+            'temperatures_c': self._temperatures()
+        }
+
+
+class PlayerStats:
+    """What the player is doing right now and how fast it got there."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.current = None
+        self.current_type = None
+        self.current_since = None
+        self.plays = 0
+        self.loops = 0
+        self.last_transition_ms = None
+        self._transition_total = 0.0
+        self._transitions = 0
+        self._seen = set()
+        self.cues = 0
+        self.last_cue_ms = None
+        self.last_waypoint = None
+        self._lock = threading.Lock()
+
+    def ad_started(self, filename, typ, transition_ms=None):
+        with self._lock:
+            if filename in self._seen:
+                # Every ad in the rotation has been on screen once: a new loop begins
+                self.loops += 1
+                self._seen.clear()
+            self._seen.add(filename)
+            self.plays += 1
+            self.current, self.current_type, self.current_since = filename, typ, time.time()
+        if transition_ms is not None:
+            self.record_transition(transition_ms)
+
+    def record_transition(self, transition_ms):
+        """Time from picking an ad to its first frame on screen."""
+        with self._lock:
+            self.last_transition_ms = round(transition_ms, 1)
+            self._transition_total += transition_ms
+            self._transitions += 1
+
+    def cue_shown(self, filename, cue_ms):
+        """A robot 'ad' event cut in: cue_ms is event published -> first frame on screen."""
+        with self._lock:
+            self.cues += 1
+            self.last_cue_ms = round(cue_ms, 2)
+
+    def waypoint(self, name):
+        with self._lock:
+            self.last_waypoint = {'name': name, 'at': time.time()}
+
+    def idle(self):
+        with self._lock:
+            self.current, self.current_type, self.current_since = None, None, None
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'uptime_s': round(time.time() - self.started, 1),
+                'current_ad': self.current,
+                'current_type': self.current_type,
+                'time_into_ad_s': round(time.time() - self.current_since, 1) if self.current_since else None,
+                'plays': self.plays,
+                'loops': self.loops,
+                'last_transition_ms': self.last_transition_ms,
+                'avg_transition_ms': round(self._transition_total / self._transitions, 1) if self._transitions else None,
+                'waypoint_cues': self.cues,
+                'last_cue_ms': self.last_cue_ms,
+                'last_waypoint': self.last_waypoint
+            }
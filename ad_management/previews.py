@@ -0,0 +1,125 @@
+# === Dashboard Preview Serving ===
+# Byte-range file responses with strong ETags (handed to the server's
+# wsgi.file_wrapper so gunicorn & co. can use sendfile), and an on-disk cache of
+# small JPEG posters so listing the ads costs kilobytes instead of whole videos.
+import os
+import threading
+
+import cv2
+from flask import Response
+from werkzeug.http import http_date
+
+THUMB_SIZE = (240, 426)
+BLOCK_SIZE = 256 * 1024
+
+
+def file_etag(stat):
+    """Strong validator derived from the file's size and mtime."""
+    return f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
+
+
+def _read_range(f, length):
+    while length > 0:
+        block = f.read(min(BLOCK_SIZE, length))
+        if not block:
+            break
+        length -= len(block)
+        yield block
+    f.close()
+
+
+def send_ranged_file(request, path, mimetype, cache_control='public, no-cache'):
+    """send_file replacement that serves single byte ranges without reading the rest of the file."""
+    stat = os.stat(path)
+    etag = file_etag(stat)
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': cache_control,
+        'ETag': f'"{etag}"',
+        'Last-Modified': http_date(stat.st_mtime)
+    }
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+
+    start, end, status = 0, stat.st_size, 200
+    byte_range = request.range
+    range_valid = 'If-Range' not in request.headers or request.if_range.etag == etag
+    if byte_range and len(byte_range.ranges) == 1 and range_valid:
+        bounds = byte_range.range_for_length(stat.st_size)
+        if bounds is None:
+            headers['Content-Range'] = f'bytes */{stat.st_size}'
+            return Response(status=416, headers=headers)
+        start, end = bounds
+        status = 206
+        headers['Content-Range'] = f'bytes {start}-{end - 1}/{stat.st_size}'
+
+    f = open(path, 'rb')
+    f.seek(start)
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    if file_wrapper is not None:
+        # Servers with sendfile support send Content-Length bytes from the current offset
+        body = file_wrapper(f, BLOCK_SIZE)
+    else:
+        body = _read_range(f, end - start)
+    response = Response(body, status=status, mimetype=mimetype, headers=headers, direct_passthrough=True)
+    response.content_length = end - start
+    return response
+
+
+class ThumbnailCache:
+    """JPEG posters in <folder>/.thumbs, named after the source's size and mtime."""
+
+    def __init__(self, folder, size=THUMB_SIZE):
+        self.folder = os.path.join(folder, '.thumbs')
+        self.size = size
+        self._lock = threading.Lock()
+        os.makedirs(self.folder, exist_ok=True)
+
+    def _thumb_path(self, filename, stat):
+        return os.path.join(self.folder, f'{filename}.{file_etag(stat)}.jpg')
+
+    def get(self, path, typ):
+        """Return the poster path for path, rendering it on first request."""
+        stat = os.stat(path)
+        filename = os.path.basename(path)
+        thumb = self._thumb_path(filename, stat)
+        if os.path.exists(thumb):
+            return thumb
+        with self._lock:
+            if os.path.exists(thumb):
+                return thumb
+            frame = self._render(path, typ)
+            if frame is None:
+                return None
+            self.invalidate(filename)
+            ok, data = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
+            if not ok:
+                return None
+            tmp = thumb + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(data.tobytes())
+            os.replace(tmp, thumb)
+            return thumb
+
+    def _render(self, path, typ):
+        if typ == 'video':
+            # The first decodable frame of a video is its first keyframe
+            cap = cv2.VideoCapture(path)
+            ok, frame = cap.read()
+            cap.release()
+            if not ok:
+                return None
+        else:
+            frame = cv2.imread(path, cv2.IMREAD_REDUCED_COLOR_2)
+            if frame is None:
+                return None
+        h, w = frame.shape[:2]
+        scale = min(self.size[0] / w, self.size[1] / h, 1.0)
+        return cv2.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+
+    def invalidate(self, filename):
+        """Remove every cached poster of filename."""
+        prefix = filename + '.'
+        for name in os.listdir(self.folder):
+            if name.startswith(prefix) and name.count('.') == filename.count('.') + 2:
+                os.remove(os.path.join(self.folder, name))
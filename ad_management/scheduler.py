@@ -0,0 +1,350 @@
+# === Playlist Scheduler ===
+# Turns the ad library plus per-ad settings (duration, weight, date range,
+# time-of-day windows, priority) into a precomputed timeline for each day.
+# The player asks for the slot covering "now" with a bisect over the slot start
+# times, so picking the next ad is O(log n) and touches no files.
+#
+# A day is cut into segments wherever any ad's window starts or ends. Inside a
+# segment the eligible ads are fixed: the highest priority present wins and its
+# ads share airtime by smooth weighted round-robin. Segment fills are memoized
+# on their inputs, and a change to one ad (settings or library) only marks the
+# spans it covers stale: the next lookup recomputes the segments overlapping
+# them and keeps every other segment of the day as it was.
+#
+#     python scheduler.py --simulate playlist.json a.jpg b.mp4
+import bisect
+import json
+import os
+import threading
+import time
+from datetime import date, datetime
+
+DAY_SECONDS = 24 * 3600
+DEFAULT_IMAGE_DURATION = 15.0
+DEFAULT_VIDEO_DURATION = 30.0
+DEFAULTS = {
+    'duration': None,  # seconds; None = 15s for images, the probed length for videos
+    'weight': 1,
+    'priority': 0,
+    'start_date': None,  # 'YYYY-MM-DD', inclusive
+    'end_date': None,
+    'windows': [],  # [['HH:MM', 'HH:MM'], ...]; empty = all day
+    'enabled': True
+}
+
+
+def parse_clock(value):
+    """'HH:MM' or 'HH:MM:SS' -> seconds since midnight ('24:00' is allowed)."""
+    if not isinstance(value, str):
+        raise ValueError(f'Invalid time {value!r}')
+    parts = [int(p) for p in value.split(':')]
+    if len(parts) not in (2, 3) or not 0 <= parts[0] <= 24 or not all(0 <= p < 60 for p in parts[1:]):
+        raise ValueError(f'Invalid time "{value}"')
+    seconds = parts[0] * 3600 + parts[1] * 60 + (parts[2] if len(parts) == 3 else 0)
+    if seconds > DAY_SECONDS:
+        raise ValueError(f'Invalid time "{value}"')
+    return seconds
+
+
+def validate_settings(settings):
+    """Return a clean settings dict or raise ValueError."""
+    clean = dict(DEFAULTS)
+    for key, value in settings.items():
+        if key not in DEFAULTS:
+            raise ValueError(f'Unknown setting "{key}"')
+        clean[key] = value
+    if clean['duration'] is not None and float(clean['duration']) <= 0:
+        raise ValueError('duration must be positive')
+    if clean['duration'] is not None:
+        clean['duration'] = float(clean['duration'])
+    if int(clean['weight']) < 1:
+        raise ValueError('weight must be at least 1')
+    clean['weight'] = int(clean['weight'])
+    clean['priority'] = int(clean['priority'])
+    for key in ('start_date', 'end_date'):
+        if clean[key]:
+            date.fromisoformat(clean[key])
+    windows = []
+    for window in clean['windows']:
+        if not isinstance(window, (list, tuple)) or len(window) != 2:
+            raise ValueError(f'Window must be [start, end], got {window}')
+        start, end = parse_clock(window[0]), parse_clock(window[1])
+        if start == end:
+            raise ValueError(f'Empty window {window}')
+        windows.append([window[0], window[1]])
+    clean['windows'] = windows
+    clean['enabled'] = bool(clean['enabled'])
+    return clean
+
+
+def window_spans(windows):
+    """Windows as (start, end) second ranges; overnight windows are split at midnight."""
+    spans = []
+    for start, end in windows:
+        start, end = parse_clock(start), parse_clock(end)
+        if start < end:
+            spans.append((start, end))
+        else:
+            spans += [(start, DAY_SECONDS), (0, end)]
+    return spans or [(0, DAY_SECONDS)]
+
+
+def fill_segment(start, end, candidates):
+    """Smooth weighted round-robin over (filename, weight, duration) for [start, end)."""
+    slots = []
+    current = {name: 0 for name, _, _ in candidates}
+    total = sum(weight for _, weight, _ in candidates)
+    t = start
+    while t < end:
+        for name, weight, _ in candidates:
+            current[name] += weight
+        name, _, duration = max(candidates, key=lambda c: current[c[0]])
+        current[name] -= total
+        slots.append((t, min(t + duration, end), name))
+        t += duration
+    return slots
+
+
+class Scheduler:
+    def __init__(self, playlist_path, duration_of=None, type_of=None, clock=time.time):
+        self.playlist_path = playlist_path
+        self.duration_of = duration_of or (lambda filename: None)
+        self.type_of = type_of or (lambda filename: 'image')
+        self.clock = clock
+        self.settings = {}
+        self.library = set()
+        self.rebuilds = 0
+        self._lock = threading.Lock()
+        self._day = None
+        self._stale = []  # (start, end) spans of _day to recompute
+        self._segments = []  # (start, end, key, slots) for _day
+        self._starts = []
+        self._slots = []
+        self._last = None
+        self._segment_cache = {}
+        self.load()
+
+    # --- persisted playlist model ---
+    def load(self):
+        try:
+            with open(self.playlist_path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            print(f"⚠️ Ignoring unreadable playlist {self.playlist_path}: {e}")
+            return
+        for filename, settings in data.get('ads', {}).items():
+            try:
+                self.settings[filename] = validate_settings(settings)
+            except ValueError as e:
+                print(f"⚠️ Ignoring playlist settings for {filename}: {e}")
+
+    def save(self):
+        tmp = self.playlist_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'ads': self.settings}, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.playlist_path)
+
+    def settings_for(self, filename):
+        return self.settings.get(filename, DEFAULTS)
+
+    def update(self, filename, settings):
+        clean = validate_settings({**self.settings_for(filename), **settings})
+        with self._lock:
+            before = self._spans_today(filename)
+            self.settings[filename] = clean
+            self.save()
+            self._invalidate(before + self._spans_today(filename))
+        return clean
+
+    def rename(self, old, new, keep_old=False):
+        """Carry an ad's settings over to a new name (for a copy, keep them on the old name too)."""
+        with self._lock:
+            if old not in self.settings:
+                return
+            before = self._spans_today(old)
+            self.settings[new] = validate_settings(self.settings[old])
+            if not keep_old:
+                del self.settings[old]
+            self.save()
+            self._invalidate(before + self._spans_today(new))
+
+    def set_library(self, filenames):
+        with self._lock:
+            self.library = set(filenames)
+            self._day, self._stale = None, []
+
+    def library_changed(self, filename, entry):
+        """AdCatalog listener: add, update or drop one ad."""
+        with self._lock:
+            # Spans are taken while the ad is in the library, before a removal or after an add
+            spans = self._spans_today(filename) if entry is None else []
+            if entry is None:
+                self.library.discard(filename)
+            else:
+                self.library.add(filename)
+                spans = self._spans_today(filename)
+            self._invalidate(spans)
+
+    def _spans_today(self, filename):
+        """Where filename can take part in the current day's timeline; [] if it can't at all."""
+        if self._day is None or filename not in self.library or not self._is_eligible(filename, self._day.isoformat()):
+            return []
+        return window_spans(self.settings_for(filename)['windows'])
+
+    def _invalidate(self, spans):
+        if self._day is not None:
+            self._stale += spans
+
+    # --- timeline ---
+    def _duration(self, filename):
+        duration = self.settings_for(filename)['duration']
+        if duration:
+            return duration
+        if self.type_of(filename) == 'video':
+            return self.duration_of(filename) or DEFAULT_VIDEO_DURATION
+        return DEFAULT_IMAGE_DURATION
+
+    def _is_eligible(self, filename, iso):
+        s = self.settings_for(filename)
+        return s['enabled'] and not (s['start_date'] and iso < s['start_date']) and not (s['end_date'] and iso > s['end_date'])
+
+    def _eligible(self, day):
+        iso = day.isoformat()
+        return [(f, self.settings_for(f), window_spans(self.settings_for(f)['windows']))
+                for f in sorted(self.library) if self._is_eligible(f, iso)]
+
+    def build(self, day, stale=None):
+        """Precompute the slot list for day. With stale spans (same day), only the
+        segments overlapping them are recomputed; the others are kept as they are."""
+        ads = self._eligible(day)
+        bounds = {0, DAY_SECONDS}
+        for _, _, spans in ads:
+            for start, end in spans:
+                bounds.update((start, end))
+        bounds = sorted(bounds)
+
+        # A changed ad only adds or removes bounds at the edges of its own spans,
+        # so a segment clear of every stale span keeps its bounds and candidates
+        keep = {}
+        if stale is not None and day == self._day:
+            keep = {(start, end): (key, segment) for start, end, key, segment in self._segments
+                    if not any(a < end and start < b for a, b in stale)}
+        segments, slots, used = [], [], {}
+        for start, end in zip(bounds, bounds[1:]):
+            key, segment = keep.get((start, end), (None, None))
+            if segment is None:
+                present = [(f, s) for f, s, spans in ads if any(a <= start and end <= b for a, b in spans)]
+                if present:
+                    top = max(s['priority'] for _, s in present)
+                    candidates = tuple((f, s['weight'], self._duration(f)) for f, s in present if s['priority'] == top)
+                    key = (start, end, candidates)
+                    segment = self._segment_cache.get(key) or fill_segment(start, end, candidates)
+                else:
+                    segment = []
+            if key is not None:
+                used[key] = segment
+            segments.append((start, end, key, segment))
+            slots += segment
+        self._segment_cache = used
+        self._segments = segments
+        self._day, self._stale = day, []
+        self._slots = slots
+        self._starts = [slot[0] for slot in slots]
+        self.rebuilds += 1
+
+    def _ensure(self, day):
+        if self._day != day:
+            self.build(day)
+        elif self._stale:
+            self.build(day, self._stale)
+
+    def _item(self, index, midnight):
+        start, end, filename = self._slots[index]
+        return {'filename': filename, 'type': self.type_of(filename), 'duration': end - start,
+                'starts_at': midnight + start, 'index': index}
+
+    def _locate(self, now):
+        moment = datetime.fromtimestamp(now)
+        midnight = datetime.combine(moment.date(), datetime.min.time()).timestamp()
+        return moment.date(), midnight, now - midnight
+
+    def next(self, now=None):
+        """The slot covering now (or the following one if it was just played); None when idle."""
+        now = self.clock() if now is None else now
+        with self._lock:
+            day, midnight, seconds = self._locate(now)
+            self._ensure(day)
+            index = bisect.bisect_right(self._starts, seconds) - 1
+            if index < 0 or self._slots[index][1] <= seconds:
+                return None  # between segments: nothing is scheduled right now
+            # Survives rebuilds: slots are identified by day, start and ad, not list index
+            if self._last == (day,) + self._slots[index][::2]:
+                index += 1
+                if index >= len(self._slots) or self._slots[index][0] != self._slots[index - 1][1]:
+                    return None
+            self._last = (day,) + self._slots[index][::2]
+            return self._item(index, midnight)
+
+    def following(self, item):
+        """Peek at the slot after item without consuming it."""
+        with self._lock:
+            index = item['index'] + 1
+            if index < len(self._slots) and self._slots[index][0] == self._slots[item['index']][1]:
+                midnight = item['starts_at'] - self._slots[item['index']][0]
+                return self._item(index, midnight)
+        return None
+
+    def timeline(self, day):
+        with self._lock:
+            self._ensure(day)
+            return list(self._slots)
+
+    # --- simulation ---
+    def simulate(self, day=None):
+        """Play a whole day against a virtual clock; returns per-ad plays and airtime."""
+        day = day or date.today()
+        with self._lock:
+            # Work on a copy so the live player's position is untouched
+            sim = Scheduler.__new__(Scheduler)
+            sim.__dict__.update(self.__dict__)
+            sim.settings, sim.library = dict(self.settings), set(self.library)
+            sim._segment_cache = dict(self._segment_cache)
+            sim._lock, sim._day, sim._last, sim._stale = threading.Lock(), None, None, []
+
+        midnight = datetime.combine(day, datetime.min.time()).timestamp()
+        now = midnight
+        report, idle = {}, 0.0
+        while now < midnight + DAY_SECONDS - 1e-6:
+            item = sim.next(now)
+            if item is None:
+                # Jump to the next scheduled start (or the end of the day)
+                i = bisect.bisect_right(sim._starts, now - midnight)
+                target = midnight + (sim._starts[i] if i < len(sim._starts) else DAY_SECONDS)
+                idle += target - now
+                now = target
+                continue
+            stats = report.setdefault(item['filename'], {'plays': 0, 'airtime': 0.0})
+            stats['plays'] += 1
+            stats['airtime'] += item['duration']
+            now = item['starts_at'] + item['duration']
+        return {'date': day.isoformat(), 'ads': report, 'idle_seconds': round(idle, 1), 'slots': len(sim._slots)}
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Simulate a day of the ad schedule')
+    parser.add_argument('--simulate', metavar='PLAYLIST', required=True)
+    parser.add_argument('--date', default=date.today().isoformat())
+    parser.add_argument('ads', nargs='+')
+    args = parser.parse_args()
+
+    videos = {'mp4', 'avi', 'mov', 'mkv', 'webm', 'flv'}
+    scheduler = Scheduler(args.simulate, type_of=lambda f: 'video' if f.rsplit('.', 1)[-1].lower() in videos else 'image')
+    scheduler.set_library(args.ads)
+    started = time.perf_counter()
+    result = scheduler.simulate(date.fromisoformat(args.date))
+    result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    print(json.dumps(result, indent=2))
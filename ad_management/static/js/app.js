@@ -1,6 +1,7 @@
 // Jetson Ad Manager - Frontend JavaScript
 class AdManager {
     constructor() {
+        this.adsEtag = null;
         this.init();
     }
 
@@ -8,6 +9,7 @@ class AdManager {
         this.setupEventListeners();
         this.loadAds();
         this.loadStatus();
+        this.subscribeStatus();
     }
 
     setupEventListeners() {
@@ -94,41 +96,94 @@ class AdManager {
         this.loadStatus();
     }
 
-    uploadSingleFile(file, progressCallback) {
-        return new Promise((resolve, reject) => {
-            const formData = new FormData();
-            formData.append('file', file);
-
-            const xhr = new XMLHttpRequest();
-
-            xhr.upload.addEventListener('progress', (e) => {
-                if (e.lengthComputable) {
-                    const progress = (e.loaded / e.total) * 100;
-                    progressCallback(progress);
-                }
+    async uploadSingleFile(file, progressCallback) {
+        // Resumable chunked upload: a dropped connection only costs the current chunk
+        const resumeKey = `upload:${file.name}:${file.size}:${file.lastModified}`;
+        let session = null;
+        const savedId = localStorage.getItem(resumeKey);
+        if (savedId) {
+            const response = await fetch(`/api/uploads/${savedId}`);
+            if (response.ok) {
+                session = await response.json();
+            }
+        }
+        if (!session) {
+            session = await this.requestJson('/api/uploads', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({filename: file.name, size: file.size})
             });
+            localStorage.setItem(resumeKey, session.upload_id);
+        }
 
-            xhr.addEventListener('load', () => {
-                if (xhr.status === 200) {
-                    const response = JSON.parse(xhr.responseText);
-                    if (response.success) {
-                        resolve(response);
-                    } else {
-                        reject(new Error(response.error));
-                    }
-                } else {
-                    const response = JSON.parse(xhr.responseText);
-                    reject(new Error(response.error || 'Upload failed'));
+        const chunkSize = session.chunk_size || 4 * 1024 * 1024;
+        let offset = session.offset;
+        let retries = 0;
+        while (offset < file.size) {
+            try {
+                const chunk = file.slice(offset, offset + chunkSize);
+                const response = await fetch(`/api/uploads/${session.upload_id}?offset=${offset}`, {
+                    method: 'PUT',
+                    headers: {'Content-Type': 'application/octet-stream'},
+                    body: chunk
+                });
+                const data = await response.json();
+                if (!data.success && data.offset === undefined) {
+                    throw new Error(data.error);
                 }
-            });
-
-            xhr.addEventListener('error', () => {
-                reject(new Error('Network error'));
-            });
+                offset = data.offset;  // on an offset mismatch the server tells us where to resume
+                retries = 0;
+                progressCallback((offset / file.size) * 100);
+            } catch (error) {
+                if (++retries > 10) {
+                    throw error;
+                }
+                await new Promise(r => setTimeout(r, Math.min(30000, 500 * 2 ** retries)));
+                const status = await fetch(`/api/uploads/${session.upload_id}`).then(r => r.json()).catch(() => null);
+                if (status && status.success) {
+                    offset = status.offset;
+                }
+            }
+        }
 
-            xhr.open('POST', '/api/upload');
-            xhr.send(formData);
+        const result = await this.requestJson(`/api/uploads/${session.upload_id}/finalize`, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({})
         });
+        localStorage.removeItem(resumeKey);
+        return this.waitForJob(result.job_id, progressCallback);
+    }
+
+    async requestJson(url, options) {
+        const response = await fetch(url, options);
+        const data = await response.json();
+        if (!data.success) {
+            throw new Error(data.error || 'Request failed');
+        }
+        return data;
+    }
+
+    async waitForJob(jobId, progressCallback) {
+        // Uploads are normalized in the background; poll until the ad is ready to play
+        const progressText = document.getElementById('progressText');
+        while (true) {
+            const response = await fetch(`/api/jobs/${jobId}`);
+            const data = await response.json();
+            if (!data.success) {
+                throw new Error(data.error);
+            }
+            const job = data.job;
+            if (job.state === 'done') {
+                return job;
+            }
+            if (job.state === 'failed') {
+                throw new Error(job.error || 'Processing failed');
+            }
+            progressText.textContent = `Processing ${job.filename} (${Math.round(job.progress * 100)}%)...`;
+            progressCallback(job.progress * 100);
+            await new Promise(r => setTimeout(r, 1000));
+        }
     }
 
     async loadAds() {
@@ -137,14 +192,21 @@ class AdManager {
         const emptyState = document.getElementById('emptyState');
 
         loading.style.display = 'block';
-        adsGrid.innerHTML = '';
-        emptyState.style.display = 'none';
 
         try {
-            const response = await fetch('/api/ads');
+            // The server answers 304 when the catalog hasn't changed since our last listing
+            const headers = this.adsEtag ? {'If-None-Match': this.adsEtag} : {};
+            const response = await fetch('/api/ads', {headers, cache: 'no-store'});
+            if (response.status === 304) {
+                return;
+            }
             const data = await response.json();
 
+            adsGrid.innerHTML = '';
+            emptyState.style.display = 'none';
+
             if (data.success) {
+                this.adsEtag = response.headers.get('ETag');
                 if (data.ads.length === 0) {
                     emptyState.style.display = 'block';
                 } else {
@@ -204,10 +266,10 @@ class AdManager {
     }
 
     createPreview(ad) {
-        if (ad.type === 'image') {
-            return `<img src="${ad.url}" alt="${ad.filename}" loading="lazy">`;
-        } else if (ad.type === 'video') {
-            return `<video src="${ad.url}" muted></video>`;
+        // Posters are small cached JPEGs; the full file is only fetched by the preview modal
+        if (ad.type === 'image' || ad.type === 'video') {
+            const badge = ad.type === 'video' ? '<span class="play-badge">▶</span>' : '';
+            return `<img src="${ad.thumb_url}" alt="${ad.filename}" loading="lazy">${badge}`;
         } else {
             return `<div class="file-icon">📄</div>`;
         }
@@ -221,7 +283,7 @@ class AdManager {
         if (type === 'image') {
             content = `<img src="/api/ads/file/${filename}" alt="${filename}">`;
         } else if (type === 'video') {
-            content = `<video src="/api/ads/file/${filename}" controls autoplay muted>
+            content = `<video src="/api/ads/file/${filename}" controls autoplay muted preload="metadata">
                 Your browser does not support the video tag.
             </video>`;
         }
@@ -268,14 +330,34 @@ class AdManager {
             const data = await response.json();
 
             if (data.success) {
-                const statusText = document.getElementById('status-text');
-                statusText.textContent = `${data.status.total_ads} ads • ${data.status.total_size_mb} MB`;
+                this.renderStatus(data.status);
             }
         } catch (error) {
             console.error('Failed to load status:', error);
         }
     }
 
+    subscribeStatus() {
+        // Pushed updates replace polling; EventSource reconnects on its own after drops
+        if (!window.EventSource) return;
+        const source = new EventSource('/api/status/stream');
+        source.onmessage = (e) => {
+            const data = JSON.parse(e.data);
+            if (data.success) {
+                this.renderStatus(data.status);
+            }
+        };
+    }
+
+    renderStatus(status) {
+        const statusText = document.getElementById('status-text');
+        let text = `${status.total_ads} ads • ${status.total_size_mb} MB`;
+        if (status.player && status.player.current_ad) {
+            text += ` • ▶ ${status.player.current_ad}`;
+        }
+        statusText.textContent = text;
+    }
+
     showToast(message, type = 'success') {
         const container = document.getElementById('toastContainer');
         const toast = document.createElement('div');
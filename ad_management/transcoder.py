@@ -0,0 +1,192 @@
+# === Upload-Time Normalization ===
+# New uploads are staged in UPLOAD_FOLDER and handed to a small worker pool that
+# turns them into the one format the display path is fast at:
+#   videos -> H.264 MP4 (yuv420p, no audio, faststart) letterboxed to the frame
+#             size the GStreamer pipeline expects before its flip-method rotation
+#   images -> a letterboxed copy at the panel resolution
+# Finished files are renamed into ADS_FOLDER atomically, so the player only ever
+# sees complete, hardware-decodable ads.
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from frame_cache import resize_to_fullscreen
+
+MAX_JOBS_KEPT = 100
+
+
+def probe_video(path):
+    """ffprobe summary of the first video stream, or None if ffprobe is unavailable."""
+    try:
+        result = subprocess.run([
+            'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+            '-show_entries', 'format=format_name,duration:stream=codec_name,width,height,pix_fmt:stream_tags=rotate:stream_side_data=rotation',
+            '-of', 'json', path
+        ], capture_output=True, text=True, check=True)
+    except FileNotFoundError:
+        return None
+    info = json.loads(result.stdout or '{}')
+    streams = info.get('streams') or [{}]
+    stream, fmt = streams[0], info.get('format', {})
+    rotation = stream.get('tags', {}).get('rotate')
+    for side_data in stream.get('side_data_list', []):
+        rotation = side_data.get('rotation', rotation)
+    return {
+        'container': fmt.get('format_name', ''),
+        'duration': float(fmt.get('duration') or 0),
+        'codec': stream.get('codec_name'),
+        'width': stream.get('width'),
+        'height': stream.get('height'),
+        'pix_fmt': stream.get('pix_fmt'),
+        'rotation': int(float(rotation or 0)) % 360
+    }
+
+
+class Transcoder:
+    """Background pool of normalization jobs with pollable progress."""
+
+    def __init__(self, staging_folder, output_folder, video_size, image_size, workers=1, on_done=None):
+        self.staging_folder = staging_folder
+        self.output_folder = output_folder
+        self.video_size = video_size  # (width, height) of decoded frames before display rotation
+        self.image_size = image_size  # (width, height) of the panel
+        self.on_done = on_done
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='transcode')
+
+    @staticmethod
+    def output_name(filename, typ):
+        stem, ext = os.path.splitext(filename)
+        if typ == 'video':
+            return stem + '.mp4'
+        return stem + ('.jpg' if ext.lower() in ('.jpg', '.jpeg') else '.png')
+
+    def in_progress(self, output_name):
+        with self._lock:
+            return any(j['output'] == output_name and j['state'] in ('queued', 'running') for j in self._jobs.values())
+
+    def submit(self, staged_path, filename, typ):
+        """Queue a staged upload; returns the job dict (poll it with get())."""
+        job = {
+            'id': uuid.uuid4().hex[:12],
+            'filename': filename,
+            'output': self.output_name(filename, typ),
+            'type': typ,
+            'state': 'queued',
+            'action': None,
+            'progress': 0.0,
+            'error': None,
+            'warning': None,
+            'created': time.time(),
+            'finished': None
+        }
+        with self._lock:
+            self._jobs[job['id']] = job
+            while len(self._jobs) > MAX_JOBS_KEPT:
+                oldest = next(iter(self._jobs))
+                if self._jobs[oldest]['state'] in ('queued', 'running'):
+                    break
+                del self._jobs[oldest]
+        self._pool.submit(self._run, job, staged_path)
+        return dict(job)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def jobs(self):
+        with self._lock:
+            return [dict(j) for j in self._jobs.values()]
+
+    def _run(self, job, staged_path):
+        job['state'] = 'running'
+        tmp_path = os.path.join(self.output_folder, f".{job['id']}.part")
+        try:
+            if job['type'] == 'video':
+                self._normalize_video(job, staged_path, tmp_path)
+            else:
+                self._normalize_image(job, staged_path, tmp_path)
+            os.replace(tmp_path, os.path.join(self.output_folder, job['output']))
+            job['state'] = 'done'
+            job['progress'] = 1.0
+            print(f"✅ Normalized {job['filename']} -> {job['output']} ({job['action']})")
+        except Exception as e:
+            job['state'] = 'failed'
+            job['error'] = str(e)
+            print(f"❌ Normalizing {job['filename']} failed: {e}")
+        finally:
+            job['finished'] = time.time()
+            for path in (tmp_path, staged_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        if job['state'] == 'done' and self.on_done:
+            self.on_done(job)
+
+    def _normalize_image(self, job, src, dst):
+        img = cv2.imread(src)
+        if img is None:
+            # OpenCV builds without GIF support can still read the first frame this way
+            cap = cv2.VideoCapture(src)
+            ok, img = cap.read()
+            cap.release()
+            if not ok:
+                raise ValueError('Unreadable image')
+        width, height = self.image_size
+        job['action'] = 'letterbox'
+        frame = resize_to_fullscreen(img, width, height)
+        ext = os.path.splitext(job['output'])[1]
+        ok, data = cv2.imencode(ext, frame, [cv2.IMWRITE_JPEG_QUALITY, 92] if ext == '.jpg' else [])
+        if not ok:
+            raise ValueError('Could not encode image')
+        with open(dst, 'wb') as f:
+            f.write(data.tobytes())
+
+    def _normalize_video(self, job, src, dst):
+        info = probe_video(src)
+        if info is None:
+            job['action'] = 'copy'
+            job['warning'] = 'ffprobe/ffmpeg not found, stored as uploaded'
+            shutil.copyfile(src, dst)
+            return
+        if not info['codec']:
+            raise ValueError('No video stream found')
+
+        width, height = self.video_size
+        canonical_stream = (info['codec'] == 'h264' and info['pix_fmt'] == 'yuv420p' and info['rotation'] == 0
+                            and (info['width'], info['height']) == (width, height))
+        if canonical_stream and 'mp4' in info['container']:
+            job['action'] = 'copy'
+            shutil.copyfile(src, dst)
+            return
+
+        cmd = ['ffmpeg', '-y', '-v', 'error', '-nostats', '-progress', 'pipe:1', '-i', src, '-an']
+        if canonical_stream:
+            job['action'] = 'remux'
+            cmd += ['-c:v', 'copy']
+        else:
+            job['action'] = 'transcode'
+            cmd += [
+                '-vf', f'scale={width}:{height}:force_original_aspect_ratio=decrease,'
+                       f'pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,format=yuv420p',
+                '-c:v', 'libx264', '-preset', 'veryfast', '-profile:v', 'high', '-level', '4.1', '-crf', '20'
+            ]
+        cmd += ['-movflags', '+faststart', '-f', 'mp4', dst]
+
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        for line in proc.stdout:
+            key, _, value = line.strip().partition('=')
+            if key == 'out_time_us' and info['duration'] > 0 and value.isdigit():
+                job['progress'] = min(0.99, int(value) / 1e6 / info['duration'])
+        stderr = proc.stderr.read()
+        if proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed: {stderr.strip()[-300:]}")
@@ -0,0 +1,166 @@
+# === Resumable Chunked Uploads ===
+# init -> PUT chunks at explicit offsets -> finalize with checksum.
+# Chunks are streamed straight into a hidden ".upload-<id>.part" file in
+# ADS_FOLDER (ignored by the catalog and player) in fixed-size blocks, so memory
+# use does not depend on file size. Session metadata sits next to the part file,
+# which lets an upload resume after a dropped connection or a server restart.
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+BLOCK_SIZE = 1024 * 1024
+SESSION_TTL = 24 * 3600
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+class UploadSessions:
+    def __init__(self, folder, max_size):
+        self.folder = folder
+        self.max_size = max_size
+        self._sessions = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _part_path(self, upload_id):
+        return os.path.join(self.folder, f'.upload-{upload_id}.part')
+
+    def _meta_path(self, upload_id):
+        return os.path.join(self.folder, f'.upload-{upload_id}.json')
+
+    def _load(self):
+        """Pick up sessions left by a previous run and drop expired ones."""
+        for name in os.listdir(self.folder):
+            if not (name.startswith('.upload-') and name.endswith('.json')):
+                continue
+            upload_id = name[len('.upload-'):-len('.json')]
+            try:
+                with open(self._meta_path(upload_id)) as f:
+                    session = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if time.time() - session.get('updated', 0) > SESSION_TTL:
+                self._discard(upload_id)
+            else:
+                self._sessions[upload_id] = session
+                self._locks[upload_id] = threading.Lock()
+
+    def _save(self, session):
+        session['updated'] = time.time()
+        tmp = self._meta_path(session['id']) + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(session, f)
+        os.replace(tmp, self._meta_path(session['id']))
+
+    def _discard(self, upload_id):
+        for path in (self._part_path(upload_id), self._meta_path(upload_id)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _get(self, upload_id):
+        session = self._sessions.get(upload_id)
+        if session is None:
+            raise UploadError('Upload not found', 404)
+        return session
+
+    def offset(self, upload_id):
+        self._get(upload_id)
+        try:
+            return os.path.getsize(self._part_path(upload_id))
+        except OSError:
+            return 0
+
+    def status(self, upload_id):
+        session = self._get(upload_id)
+        return {'upload_id': upload_id, 'filename': session['filename'], 'size': session['size'],
+                'offset': self.offset(upload_id)}
+
+    @staticmethod
+    def _checksum(sha256):
+        """A client-supplied SHA-256 as lowercase hex, or None when it wasn't given."""
+        if sha256 is None or sha256 == '':
+            return None
+        if not isinstance(sha256, str) or not re.fullmatch(r'[0-9a-fA-F]{64}', sha256):
+            raise UploadError('sha256 must be 64 hex digits')
+        return sha256.lower()
+
+    def create(self, filename, size, sha256=None):
+        try:
+            size = int(size)
+        except (TypeError, ValueError, OverflowError):
+            raise UploadError('Upload size required')
+        if size <= 0:
+            raise UploadError('Upload size required')
+        if size > self.max_size:
+            raise UploadError('File too large', 413)
+        session = {'id': uuid.uuid4().hex, 'filename': filename, 'size': size,
+                   'sha256': self._checksum(sha256), 'created': time.time()}
+        open(self._part_path(session['id']), 'wb').close()
+        self._save(session)
+        with self._lock:
+            self._sessions[session['id']] = session
+            self._locks[session['id']] = threading.Lock()
+        return self.status(session['id'])
+
+    def write(self, upload_id, offset, stream):
+        """Append the request body at offset; returns the new offset."""
+        session = self._get(upload_id)
+        lock = self._locks[upload_id]
+        if not lock.acquire(blocking=False):
+            raise UploadError('Another chunk for this upload is in progress', 409)
+        try:
+            current = self.offset(upload_id)
+            if offset != current:
+                raise UploadError('Offset mismatch', 409, offset=current)
+            with open(self._part_path(upload_id), 'r+b') as f:
+                f.seek(offset)
+                while True:
+                    block = stream.read(BLOCK_SIZE)
+                    if not block:
+                        break
+                    if offset + len(block) > session['size']:
+                        f.truncate(offset)
+                        raise UploadError('Chunk exceeds declared size', 400, offset=offset)
+                    f.write(block)
+                    offset += len(block)
+            self._save(session)
+            return offset
+        finally:
+            lock.release()
+
+    def finalize(self, upload_id, dest_path, sha256=None):
+        """Verify size and checksum, then atomically move the file to dest_path."""
+        session = self._get(upload_id)
+        with self._locks[upload_id]:
+            part = self._part_path(upload_id)
+            size = self.offset(upload_id)
+            if size != session['size']:
+                raise UploadError('Upload incomplete', 409, offset=size)
+            expected = self._checksum(sha256) or self._checksum(session.get('sha256'))
+            digest = hashlib.sha256()
+            with open(part, 'rb') as f:
+                for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+                    digest.update(block)
+            if expected and digest.hexdigest() != expected:
+                raise UploadError('Checksum mismatch', 422, sha256=digest.hexdigest())
+            with open(part, 'rb') as f:
+                os.fsync(f.fileno())
+            os.replace(part, dest_path)
+            self.abort(upload_id)
+            return digest.hexdigest()
+
+    def abort(self, upload_id):
+        with self._lock:
+            self._sessions.pop(upload_id, None)
+            self._locks.pop(upload_id, None)
+        self._discard(upload_id)
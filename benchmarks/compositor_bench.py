@@ -0,0 +1,122 @@
+# === Compositor Microbenchmark ===
+# Compares resize_to_fullscreen (a new canvas and a new resized array per call)
+# with the compositor's preallocated buffers, for ad transitions and for
+# frames with live overlays. Each variant runs in its own process so its peak
+# RSS is not hidden by an earlier one; tracemalloc reports what the timed loop
+# itself allocated.
+#
+#     python benchmarks/compositor_bench.py --frames 300
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'ad_management'))
+
+import cv2
+import numpy as np
+
+from load_test import percentile
+
+WIDTH, HEIGHT = 1080, 1920
+SOURCES = [(1280, 720), (1920, 1080), (3840, 2160)]  # ads that were not normalized at upload
+OVERLAYS = {
+    'clock': {'enabled': True, 'format': '%H:%M:%S'},
+    'ticker': {'enabled': True, 'text': 'Coffee $2.50 | Bagel $1.80 | Smoothie $4.20'},
+    'qr': {'enabled': True, 'data': 'https://example.com/menu'},
+    'moving_banner': {'enabled': True}
+}
+VARIANTS = ['resize_to_fullscreen', 'compositor_present', 'overlay_redraw', 'compositor_refresh']
+
+
+def sources():
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 255, (h, w, 3), dtype=np.uint8) for w, h in SOURCES]
+
+
+def naive_overlay_frame(ad, now, qr):
+    """What drawing the same overlays looks like without the compositor: copy, then draw everything."""
+    frame = ad.copy()
+    cv2.putText(frame, time.strftime('%H:%M:%S', time.localtime(now)), (WIDTH - 330, 100),
+                cv2.FONT_HERSHEY_DUPLEX, 2.2, (255, 255, 255), 2)
+    band = frame[HEIGHT - 140:HEIGHT - 60]
+    band[:] = cv2.addWeighted(band, 0.4, np.zeros_like(band), 0.6, 0)
+    cv2.putText(frame, OVERLAYS['ticker']['text'], (WIDTH - int(now * 120) % 2000, HEIGHT - 80),
+                cv2.FONT_HERSHEY_DUPLEX, 1.8, (255, 255, 255), 2)
+    frame[HEIGHT - 440:HEIGHT - 200, WIDTH - 270:WIDTH - 30] = qr
+    return frame
+
+
+def run_variant(name, frames):
+    from compositor import Compositor, qr_codes
+    from frame_cache import resize_to_fullscreen
+
+    images = sources()
+    ad = np.full((HEIGHT, WIDTH, 3), 90, np.uint8)
+    compositor = Compositor(WIDTH, HEIGHT)
+    if name in ('overlay_redraw', 'compositor_refresh'):
+        compositor.configure(OVERLAYS)
+        compositor.set_moving(True)
+        compositor.present(ad)
+    qr = qr_codes.symbol(OVERLAYS['qr']['data'], 240)
+
+    def step(i, now):
+        if name == 'resize_to_fullscreen':
+            return resize_to_fullscreen(images[i % len(images)], WIDTH, HEIGHT)
+        if name == 'compositor_present':
+            return compositor.present(images[i % len(images)])
+        if name == 'overlay_redraw':
+            return naive_overlay_frame(ad, now, qr)
+        return compositor.refresh(now)
+
+    start = time.time()
+    for i in range(10):  # warm caches and lazy allocations
+        step(i, start + i / 30.0)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    timings = []
+    for i in range(frames):
+        started = time.perf_counter()
+        step(i, start + (10 + i) / 30.0)  # simulated 30fps clock
+        timings.append((time.perf_counter() - started) * 1000)
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    timings.sort()
+    return {
+        'variant': name,
+        'frames': frames,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'max_ms': round(timings[-1], 3),
+        'traced_peak_kb': round(traced_peak / 1024, 1),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'rss_growth_mb': round((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024, 1)
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compositor vs resize_to_fullscreen')
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--variant', choices=VARIANTS, help='run one variant in this process')
+    args = parser.parse_args()
+
+    if args.variant:
+        print(json.dumps(run_variant(args.variant, args.frames)))
+        sys.exit(0)
+
+    report = {}
+    for variant in VARIANTS:
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), '--variant', variant,
+                              '--frames', str(args.frames)], check=True, capture_output=True, text=True)
+        report[variant] = json.loads(out.stdout.strip().splitlines()[-1])
+    print(json.dumps(report, indent=2))
+    for old, new in (('resize_to_fullscreen', 'compositor_present'), ('overlay_redraw', 'compositor_refresh')):
+        print(f"{new}: p50 {report[new]['p50_ms']}ms vs {report[old]['p50_ms']}ms, "
+              f"loop allocations {report[new]['traced_peak_kb']}KB vs {report[old]['traced_peak_kb']}KB, "
+              f"peak RSS {report[new]['peak_rss_mb']}MB vs {report[old]['peak_rss_mb']}MB")
@@ -0,0 +1,87 @@
+# === Impression Recorder Benchmark ===
+# Feeds months of synthetic plays through ImpressionRecorder and reports what
+# the render thread pays per record() call, how fast the batched writer drains,
+# how long hourly/daily reports take over the whole range, and how much memory
+# a streamed CSV export of everything needs.
+#
+#     python benchmarks/impressions_bench.py --days 180 --plays-per-hour 240
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'ad_management'))
+
+from impressions import ImpressionRecorder
+from load_test import percentile
+
+
+def run(days=180, plays_per_hour=240, ads=20):
+    db_path = os.path.join(tempfile.mkdtemp(prefix='impressions-bench-'), 'impressions.db')
+    step = 3600.0 / plays_per_hour
+    first = time.time() - days * 86400
+    total = int(days * 24 * plays_per_hour)
+    # Months of plays arrive in seconds here, so let the queue hold all of them
+    recorder = ImpressionRecorder(db_path, max_queued=total + 1).start()
+
+    calls = []
+    started = time.perf_counter()
+    for i in range(total):
+        t = first + i * step
+        before = time.perf_counter()
+        recorder.record(f'ad{i % ads:02d}.jpg', t, t + step, 'completed' if i % 50 else 'interrupted',
+                        type='image', source='schedule', waypoint=f'wp{i % 7}', x=float(i % 13), y=float(i % 5))
+        calls.append((time.perf_counter() - before) * 1e6)
+    record_s = time.perf_counter() - started
+    recorder.flush(timeout=600)
+    drain_s = time.perf_counter() - started
+    calls.sort()
+
+    def timed(fn):
+        before = time.perf_counter()
+        result = fn()
+        return result, round((time.perf_counter() - before) * 1000, 2)
+
+    days_rows, day_ms = timed(lambda: recorder.report('day'))
+    last_day = time.strftime('%Y-%m-%d', time.localtime(first + (days - 1) * 86400))
+    hour_rows, hour_ms = timed(lambda: recorder.report('hour', start=last_day))
+    one_ad, ad_ms = timed(lambda: recorder.report('day', ad='ad03.jpg'))
+
+    before = time.perf_counter()
+    exported = sum(len(chunk) for chunk in recorder.export_csv())
+    export_s = time.perf_counter() - before
+    tracemalloc.start()  # second pass: tracing slows the export down several times
+    for _ in recorder.export_csv():
+        pass
+    _, export_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'impressions': total,
+        'record_us': {'p50': round(percentile(calls, 50), 2), 'p99': round(percentile(calls, 99), 2),
+                      'max': round(calls[-1], 1)},
+        'record_loop_s': round(record_s, 2),
+        'written_per_s': round(total / drain_s),
+        'recorder': recorder.stats(),
+        'report_day_ms': day_ms, 'report_day_rows': len(days_rows),
+        'report_hour_last_day_ms': hour_ms, 'report_hour_rows': len(hour_rows),
+        'report_one_ad_ms': ad_ms, 'report_one_ad_rows': len(one_ad),
+        'csv_mb': round(exported / (1024 * 1024), 1),
+        'csv_export_s': round(export_s, 2),
+        'csv_export_peak_kb': round(export_peak / 1024, 1),
+        'db_mb': round(os.path.getsize(db_path) / (1024 * 1024), 1)
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Impression recording, reporting and export')
+    parser.add_argument('--days', type=int, default=180)
+    parser.add_argument('--plays-per-hour', type=int, default=240)
+    parser.add_argument('--ads', type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(run(args.days, args.plays_per_hour, args.ads), indent=2))
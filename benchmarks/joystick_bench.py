@@ -0,0 +1,87 @@
+# === Joystick Setpoint Benchmark ===
+# Drives joystick.py with a virtual stick sweeping at a high update rate from
+# several clients, against a pty-backed fake OpenCR, and reports:
+#   - /move request latency (should not depend on serial I/O)
+#   - serial write rate and how many updates were coalesced away
+#
+#     python benchmarks/joystick_bench.py --clients 4 --duration 5 --send-rate 20
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'Joystick'))
+
+from opencr.sim import PtyOpenCR
+from load_test import percentile
+
+
+def stick_client(client, deadline, latencies, lock):
+    i = 0
+    samples = []
+    while time.monotonic() < deadline:
+        i += 1
+        body = {'action': 'vector', 'speed': 0.8, 'heading': (i * 7) % 360}
+        started = time.perf_counter()
+        client.post('/move', json=body)
+        samples.append((time.perf_counter() - started) * 1000)
+    with lock:
+        latencies.extend(samples)
+
+
+def run(clients=4, duration=5.0, send_rate=None, keepalive=None):
+    board = PtyOpenCR()
+    os.environ['OPENCR_PORT'] = board.port
+    if send_rate:
+        os.environ['JOYSTICK_SEND_RATE_HZ'] = str(send_rate)
+    if keepalive is not None:
+        os.environ['JOYSTICK_KEEPALIVE_MS'] = str(keepalive)
+    import joystick
+    app = joystick.create_app()
+    while joystick.ser is None:
+        time.sleep(0.01)
+
+    latencies, lock = [], threading.Lock()
+    deadline = time.monotonic() + duration
+    threads = [threading.Thread(target=stick_client, args=(app.test_client(), deadline, latencies, lock))
+               for _ in range(clients)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    app.test_client().post('/move', json={'action': 'stop'})
+    time.sleep(0.2)
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    received = [line for t, line in board.lines if t >= started]
+    stats = app.test_client().get('/api/latency').get_json()
+    board.close()
+    return {
+        'clients': clients,
+        'duration_s': duration,
+        'requests': len(latencies),
+        'request_p50_ms': round(percentile(latencies, 50), 3),
+        'request_p95_ms': round(percentile(latencies, 95), 3),
+        'request_p99_ms': round(percentile(latencies, 99), 3),
+        'serial_writes': len(received),
+        'serial_writes_per_s': round(len(received) / elapsed, 1),
+        'last_command': received[-1] if received else None,
+        'setpoint_to_write_ms': stats['server_ms'],
+        'writer': stats['writer']
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Joystick request latency and serial write rate')
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--send-rate', type=float, help='JOYSTICK_SEND_RATE_HZ')
+    parser.add_argument('--keepalive', type=int, help='JOYSTICK_KEEPALIVE_MS')
+    args = parser.parse_args()
+    print(json.dumps(run(args.clients, args.duration, args.send_rate, args.keepalive), indent=2))
@@ -0,0 +1,84 @@
+# === HTTP Load Test ===
+# Hammers a running app with concurrent clients and reports request latency
+# percentiles, e.g. against the ad manager while ads are playing:
+#
+#     python ad_manager.py --production &
+#     python benchmarks/load_test.py http://localhost:5002 /api/ads /api/status --clients 8 --duration 30
+#
+# Only the standard library is used so it runs on the Jetson as-is.
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_client(base_url, paths, deadline, results, errors, lock):
+    i = 0
+    etags = {}
+    while time.monotonic() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        req = urllib.request.Request(base_url + path)
+        if path in etags:
+            req.add_header('If-None-Match', etags[path])  # behave like the dashboard
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=10) as resp:
+                resp.read()
+                if resp.headers.get('ETag'):
+                    etags[path] = resp.headers['ETag']
+        except urllib.error.HTTPError as e:
+            if e.code != 304:
+                with lock:
+                    errors[path] = errors.get(path, 0) + 1
+        except (urllib.error.URLError, OSError) as e:
+            with lock:
+                errors[path] = errors.get(path, 0) + 1
+            continue
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with lock:
+            results.setdefault(path, []).append(elapsed_ms)
+
+
+def load_test(base_url, paths, clients=4, duration=10.0):
+    results, errors, lock = {}, {}, threading.Lock()
+    deadline = time.monotonic() + duration
+    threads = [threading.Thread(target=run_client, args=(base_url.rstrip('/'), paths, deadline, results, errors, lock))
+               for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    report = {'url': base_url, 'clients': clients, 'duration_s': duration, 'paths': {}}
+    for path in paths:
+        samples = sorted(results.get(path, []))
+        report['paths'][path] = {
+            'requests': len(samples),
+            'errors': errors.get(path, 0),
+            'rps': round(len(samples) / duration, 1),
+            'p50_ms': round(percentile(samples, 50), 2) if samples else None,
+            'p95_ms': round(percentile(samples, 95), 2) if samples else None,
+            'p99_ms': round(percentile(samples, 99), 2) if samples else None,
+            'max_ms': round(samples[-1], 2) if samples else None
+        }
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Concurrent HTTP latency test')
+    parser.add_argument('url', help='base URL, e.g. http://localhost:5002')
+    parser.add_argument('paths', nargs='*', default=['/api/ads', '/api/status'])
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10.0)
+    args = parser.parse_args()
+    print(json.dumps(load_test(args.url, args.paths, args.clients, args.duration), indent=2))
@@ -0,0 +1,76 @@
+# === Sampling Profiler ===
+# Opt-in and pure Python, so it runs on the Jetson without perf or py-spy: a
+# daemon thread snapshots every other thread's stack with sys._current_frames()
+# every `interval` seconds and counts identical stacks. write() emits the
+# collapsed format flamegraph.pl, inferno and speedscope read, one stack per
+# line, root first, thread name as the root frame:
+#
+#     MainThread;run (suite.py:120);get (test.py:1150);... 42
+#
+#     with SamplingProfiler() as profiler:
+#         run()
+#     profiler.write('run.folded')
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = 0
+        self.stacks = Counter()
+        self._running = False
+        self._thread = None
+
+    @staticmethod
+    def _label(frame):
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ':')
+
+    def _sample(self):
+        me = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, f'thread-{ident}').replace(';', ':'))
+            self.stacks[';'.join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        next_at = time.perf_counter()
+        while self._running:
+            self._sample()
+            next_at += self.interval
+            time.sleep(max(0.0, next_at - time.perf_counter()))
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def write(self, path):
+        """Write collapsed stacks, heaviest first; returns the number of distinct stacks."""
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return len(self.stacks)
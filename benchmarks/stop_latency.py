@@ -0,0 +1,81 @@
+# === Motion Stop Latency ===
+# Starts a motion run against the simulated OpenCR, hits stop at a random point
+# (mid-move, mid-wait) and measures:
+#   stop_to_write_ms   stop() called -> 's' handed to the port
+#   stop_to_exit_ms    stop() called -> worker thread gone, port closed
+# Exits non-zero when the p99 stop-to-write latency exceeds --max-ms, so it
+# can gate changes to the executor:
+#
+#     python benchmarks/stop_latency.py --runs 50 --max-ms 20
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'Text_motion'))
+
+from opencr.sim import FakeOpenCR, FakeSerial
+from executor import MotionExecutor
+from motion_script import compile_script
+from load_test import percentile
+
+SCRIPT = """
+repeat: 3
+  move: 0.1
+  turn: 45
+  wait: 0.3
+end
+"""
+
+
+def run(runs=50, max_delay=0.8):
+    ports = []
+
+    def connect(timeout=1):
+        port = FakeSerial(timeout=timeout, opencr=FakeOpenCR(move_seconds=0.25))
+        ports.append(port)
+        return port
+
+    executor = MotionExecutor(connect)
+    program = compile_script(SCRIPT)
+    to_write, to_exit, to_serial, leaked = [], [], [], 0
+    for _ in range(runs):
+        executor.start('bench', program)
+        time.sleep(random.uniform(0.05, max_delay))
+        requested = time.monotonic()
+        result = executor.stop()
+        to_write.append(result['stop_to_write_ms'])
+        to_exit.append(result['stop_to_exit_ms'])
+        port = ports[-1]
+        stops = [t for t, data in port.writes if data.strip() == b's' and t >= requested]
+        to_serial.append((stops[0] - requested) * 1000 if stops else float('inf'))
+        leaked += sum(1 for p in ports if p.is_open)
+        ports.clear()
+
+    report = {'runs': runs}
+    for name, samples in (('stop_to_write_ms', to_write), ('stop_to_serial_ms', to_serial),
+                          ('stop_to_exit_ms', to_exit)):
+        samples = sorted(float('inf') if v is None else v for v in samples)
+        report[name] = {'p50': round(percentile(samples, 50), 3), 'p99': round(percentile(samples, 99), 3),
+                        'max': round(samples[-1], 3)}
+    report['ports_left_open'] = leaked
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stop latency of the motion executor')
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--max-ms', type=float, default=20.0, help='fail above this p99 stop-to-write latency')
+    args = parser.parse_args()
+
+    report = run(args.runs)
+    print(json.dumps(report, indent=2))
+    assert report['stop_to_serial_ms']['p99'] <= args.max_ms, \
+        f"p99 stop latency {report['stop_to_serial_ms']['p99']}ms exceeds {args.max_ms}ms"
+    assert report['stop_to_exit_ms']['max'] <= 1000, "worker did not exit promptly after stop"
+    assert report['ports_left_open'] == 0, "ports left open after stop"
+    print("✅ stop latency within budget")
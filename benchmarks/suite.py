@@ -0,0 +1,434 @@
+# === Benchmark Suite ===
+# End-to-end numbers for the ad, motion and joystick paths, with no hardware:
+# headless display, simulated OpenCR (in-process or on a pty), temp folders.
+#
+#   resize            resize_to_fullscreen from common source resolutions to the panel
+#   ads_10/1k/10k     GET /api/ads with 10, 1000 and 10000 files in ADS_FOLDER
+#   upload            multipart and chunked upload throughput, 1 / 10 / 100 MB
+#   joystick_move     POST /move -> command written to the pty OpenCR
+#   motion_overhead   run time of a motion script minus its move times, per move
+#   stop              GET /stop latency, plus benchmarks/stop_latency.py's executor stop
+#
+# Every case runs in its own process (the apps keep module-level state). The
+# result is one JSON document, {case: {metric: value}}; with --baseline each
+# timing/throughput metric is compared against a saved run and the exit
+# status is 1 if any got worse by more than --tolerance.
+#
+#     python benchmarks/suite.py --output results.json
+#     python benchmarks/suite.py --save-baseline baseline.json
+#     python benchmarks/suite.py --baseline baseline.json --tolerance 0.2
+#     python benchmarks/suite.py upload --quick --profile profiles/   # collapsed stacks per case
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT, 'benchmarks')
+for path in (ROOT, BENCH_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from load_test import load_test, percentile
+
+MB = 1000 * 1000  # decimal, so the 100 MB upload fits MAX_CONTENT_LENGTH (100 MiB)
+LOWER_IS_BETTER = ('_ms', '_us', '_s')
+HIGHER_IS_BETTER = ('_per_s', '_mbps')
+NOISE_FLOOR = {'_ms': 0.25, '_us': 250.0, '_s': 0.00025}  # smaller absolute changes never count as regressions
+
+
+def summary(samples, prefix=''):
+    """p50/p95/max of a list of milliseconds as flat metrics."""
+    samples = sorted(samples)
+    return {f'{prefix}p50_ms': round(percentile(samples, 50), 3), f'{prefix}p95_ms': round(percentile(samples, 95), 3),
+            f'{prefix}max_ms': round(samples[-1], 3)}
+
+
+def workdir(name):
+    """A fresh working directory for an app that uses relative folders; the process moves into it."""
+    path = tempfile.mkdtemp(prefix=f'bench-{name}-')
+    os.chdir(path)
+    os.environ['ADROVER_EVENT_DIR'] = os.path.join(path, 'events')
+    return path
+
+
+def serve_in_thread(app):
+    """Serve `app` over real HTTP from this process (so a profile sees the server threads); returns its URL."""
+    try:
+        from waitress import create_server
+        server = create_server(app, host='127.0.0.1', port=0, threads=8)
+        port = server.effective_port
+        target = server.run
+    except ImportError:
+        from werkzeug.serving import make_server
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        port = server.server_port
+        target = server.serve_forever
+    threading.Thread(target=target, daemon=True).start()
+    return f'http://127.0.0.1:{port}'
+
+
+def call(url, method='GET', body=None):
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req, timeout=60) as resp:
+        return json.loads(resp.read().decode('utf-8'))
+
+
+def wait_for(predicate, timeout=120, interval=0.05):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = predicate()
+        if result:
+            return result
+        time.sleep(interval)
+    raise TimeoutError('condition not met in time')
+
+
+def ad_manager_app():
+    os.environ['AD_DISPLAY_MODE'] = 'headless'
+    sys.path.insert(0, os.path.join(ROOT, 'ad_management'))
+    import ad_manager
+    return ad_manager
+
+
+# === Cases ===
+def bench_resize(quick):
+    sys.path.insert(0, os.path.join(ROOT, 'ad_management'))
+    import numpy as np
+    from frame_cache import resize_to_fullscreen
+    from compositor_bench import WIDTH, HEIGHT
+
+    rng = np.random.default_rng(0)
+    metrics = {}
+    # 1080x1920 is the panel itself, i.e. the already-normalized fast path
+    for w, h in ((640, 360), (1280, 720), (1920, 1080), (1080, 1920), (2560, 1440), (3840, 2160)):
+        image = rng.integers(0, 255, (h, w, 3), dtype=np.uint8)
+        for _ in range(3):
+            resize_to_fullscreen(image, WIDTH, HEIGHT)
+        timings = []
+        for _ in range(20 if quick else 100):
+            started = time.perf_counter()
+            resize_to_fullscreen(image, WIDTH, HEIGHT)
+            timings.append((time.perf_counter() - started) * 1000)
+        metrics.update(summary(timings, f'{w}x{h}_'))
+    return metrics
+
+
+def bench_ads(quick, count):
+    """GET /api/ads over HTTP with `count` ads in ADS_FOLDER: first, full and conditional requests."""
+    import cv2
+    import numpy as np
+
+    base = workdir(f'ads{count}')
+    ads = os.path.join(base, 'advertisement')
+    os.makedirs(ads)
+    ok, jpeg = cv2.imencode('.jpg', np.full((90, 160, 3), 128, np.uint8))
+    started = time.perf_counter()
+    for i in range(count):
+        with open(os.path.join(ads, f'ad_{i:05d}.jpg'), 'wb') as f:
+            f.write(jpeg.tobytes() + str(i).encode())  # distinct bytes, or the blob store dedupes them all
+    ad_manager = ad_manager_app()
+    url = serve_in_thread(ad_manager.create_app())
+    wait_for(lambda: call(url + '/api/ads')['total'] == count)
+    ready_s = time.perf_counter() - started
+    # Media probes keep updating entries (and the ETag) for a while after the scan
+    etags = []
+
+    def settled():
+        with urllib.request.urlopen(url + '/api/ads', timeout=60) as resp:
+            etags.append(resp.headers.get('ETag'))
+        return len(etags) > 4 and len(set(etags[-5:])) == 1
+    wait_for(settled, 300, 0.2)
+    settled_s = time.perf_counter() - started
+
+    timings, size = [], 0
+    for _ in range(10 if quick else 50):
+        before = time.perf_counter()
+        with urllib.request.urlopen(url + '/api/ads', timeout=60) as resp:
+            size = len(resp.read())
+        timings.append((time.perf_counter() - before) * 1000)
+    conditional = load_test(url, ['/api/ads'], clients=4, duration=1.0 if quick else 3.0)['paths']['/api/ads']
+    return dict(summary(timings, 'full_'), ads=count, listing_kb=round(size / 1024, 1), catalog_ready_s=round(ready_s, 2),
+                catalog_settled_s=round(settled_s, 2),
+                conditional_p50_ms=conditional['p50_ms'], conditional_p95_ms=conditional['p95_ms'],
+                conditional_requests_per_s=conditional['rps'], errors=conditional['errors'])
+
+
+def _payload(path, size):
+    with open(path, 'wb') as f:
+        block = os.urandom(MB)
+        for _ in range(size // MB):
+            f.write(block)
+
+
+def _multipart(url, path, filename):
+    """Stream `path` as a multipart POST /api/upload without loading it into memory."""
+    boundary = f'bench{random.getrandbits(64):x}'
+    head = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n').encode()
+    tail = f'\r\n--{boundary}--\r\n'.encode()
+
+    def body():
+        yield head
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(1024 * 1024)
+                if not chunk:
+                    break
+                yield chunk
+        yield tail
+    host, port = url.rsplit('//', 1)[1].split(':')
+    conn = http.client.HTTPConnection(host, int(port), timeout=300)
+    conn.request('POST', '/api/upload', body=body(), headers={
+        'Content-Type': f'multipart/form-data; boundary={boundary}',
+        'Content-Length': str(len(head) + os.path.getsize(path) + len(tail))})
+    resp = conn.getresponse()
+    result = json.loads(resp.read().decode('utf-8'))
+    conn.close()
+    return resp.status, result
+
+
+def _chunked(url, path, filename):
+    """The dashboard's resumable path: init, PUT every chunk at its offset, finalize."""
+    size = os.path.getsize(path)
+    session = call(url + '/api/uploads', 'POST', {'filename': filename, 'size': size})
+    host, port = url.rsplit('//', 1)[1].split(':')
+    conn = http.client.HTTPConnection(host, int(port), timeout=300)
+    with open(path, 'rb') as f:
+        offset = 0
+        while offset < size:
+            chunk = f.read(session['chunk_size'])
+            conn.request('PUT', f"/api/uploads/{session['upload_id']}?offset={offset}", body=chunk,
+                         headers={'Content-Type': 'application/octet-stream'})
+            resp = conn.getresponse()
+            offset = json.loads(resp.read().decode('utf-8'))['offset']
+    conn.close()
+    return call(url + f"/api/uploads/{session['upload_id']}/finalize", 'POST', {})
+
+
+def bench_upload(quick):
+    base = workdir('upload')
+    ad_manager = ad_manager_app()
+    url = serve_in_thread(ad_manager.create_app())
+    metrics = {}
+    for size_mb in ((1, 10) if quick else (1, 10, 100)):
+        path = os.path.join(base, f'payload_{size_mb}.bin')
+        _payload(path, size_mb * MB)
+        for mode in ('multipart', 'chunked'):
+            name = f'{mode}_{size_mb}mb_{time.time_ns()}.mp4'
+            started = time.perf_counter()
+            if mode == 'multipart':
+                status, result = _multipart(url, path, name)
+                if status != 202:
+                    raise RuntimeError(f'upload failed with {status}: {result}')
+            else:
+                result = _chunked(url, path, name)
+            elapsed = time.perf_counter() - started
+            metrics[f'{mode}_{size_mb}mb_mbps'] = round(size_mb / elapsed, 1)
+            metrics[f'{mode}_{size_mb}mb_s'] = round(elapsed, 3)
+            # Let the transcoder finish with it before the next upload competes for the CPU
+            wait_for(lambda: call(url + result['status_url'])['job']['state'] not in ('queued', 'running'), 600)
+        os.unlink(path)
+    return metrics
+
+
+def bench_joystick_move(quick):
+    from opencr.sim import PtyOpenCR
+
+    board = PtyOpenCR()
+    os.environ.update(OPENCR_PORT=board.port, OPENCR_BROKER='off')
+    sys.path.insert(0, os.path.join(ROOT, 'Joystick'))
+    import joystick
+    client = joystick.create_app().test_client()
+    wait_for(lambda: joystick.ser is not None, 10)
+
+    request_ms, to_serial_ms = [], []
+    for i in range(50 if quick else 300):
+        body, expected = ({'direction': 'f', 'action': 'start'}, 'f') if i % 2 == 0 else ({'action': 'stop'}, 's')
+        started = time.monotonic()
+        client.post('/move', json=body)
+        request_ms.append((time.monotonic() - started) * 1000)
+        written = wait_for(lambda: next((t for t, line in reversed(board.lines)
+                                         if t >= started and line == expected), None), 2, 0.0005)
+        to_serial_ms.append((written - started) * 1000)
+        time.sleep(1.0 / joystick.SEND_RATE_HZ + 0.01)  # past the rate limit, so nothing coalesces
+    board.close()
+    return dict(summary(request_ms, 'request_'), **summary(to_serial_ms, 'move_to_serial_'))
+
+
+def bench_motion_overhead(quick):
+    sys.path.insert(0, os.path.join(ROOT, 'Text_motion'))
+    from opencr import open_serial
+    from opencr.sim import FakeOpenCR, PtyOpenCR
+    from executor import MotionExecutor
+    from motion_script import compile_script
+
+    move_seconds = 0.02
+    moves = 20 if quick else 100
+    program = compile_script(''.join('move: 0.1\n' if i % 2 else 'turn: 45\n' for i in range(moves)))
+    metrics = {}
+    for pipeline in (False, True):
+        board = PtyOpenCR(FakeOpenCR(move_seconds=move_seconds))
+        executor = MotionExecutor(lambda timeout=1: open_serial(board.port, timeout=timeout), pipeline=pipeline)
+        started = time.perf_counter()
+        executor.start('bench', program, loops=1)
+        executor.join(60)
+        elapsed = time.perf_counter() - started
+        board.close()
+        mode = 'pipelined' if pipeline else 'sequential'
+        metrics[f'{mode}_run_s'] = round(elapsed, 3)
+        metrics[f'{mode}_overhead_per_move_ms'] = round((elapsed - moves * move_seconds) / moves * 1000, 3)
+    metrics['moves'] = moves
+    return metrics
+
+
+def bench_stop(quick):
+    workdir('stop')
+    os.environ.update(OPENCR_PORT='fake', OPENCR_BROKER='off')
+    sys.path.insert(0, os.path.join(ROOT, 'Text_motion'))
+    import motion
+    import stop_latency
+
+    with open(os.path.join(motion.UPLOAD_FOLDER, 'bench.txt'), 'w') as f:
+        f.write(stop_latency.SCRIPT)
+    client = motion.create_app().test_client()
+    request_ms, to_write_ms = [], []
+    for _ in range(10 if quick else 40):
+        client.get('/send/bench.txt')
+        time.sleep(random.uniform(0.05, 0.5))
+        started = time.perf_counter()
+        client.get('/stop')
+        request_ms.append((time.perf_counter() - started) * 1000)
+        to_write_ms.append(motion.executor.status()['last_stop']['stop_to_write_ms'])
+        motion.executor.join(2)
+    executor = stop_latency.run(10 if quick else 50)
+    return dict(summary(request_ms, 'http_stop_'), **summary(to_write_ms, 'http_stop_to_write_'),
+                executor_stop_to_serial_p50_ms=executor['stop_to_serial_ms']['p50'],
+                executor_stop_to_serial_p99_ms=executor['stop_to_serial_ms']['p99'],
+                executor_stop_to_exit_p99_ms=executor['stop_to_exit_ms']['p99'])
+
+
+CASES = {
+    'resize': bench_resize,
+    'ads_10': lambda quick: bench_ads(quick, 10),
+    'ads_1k': lambda quick: bench_ads(quick, 1000),
+    'ads_10k': lambda quick: bench_ads(quick, 10000),
+    'upload': bench_upload,
+    'joystick_move': bench_joystick_move,
+    'motion_overhead': bench_motion_overhead,
+    'stop': bench_stop,
+}
+
+
+# === Runner ===
+def run_case(name, quick=False, profile_dir=None):
+    """Run one case in a child process; returns its metrics (or {'error': ...})."""
+    command = [sys.executable, os.path.abspath(__file__), '--child', name]
+    if quick:
+        command.append('--quick')
+    if profile_dir:
+        command += ['--profile', profile_dir]
+    proc = subprocess.run(command, capture_output=True, text=True, cwd=ROOT)
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        return {'error': (proc.stderr.strip().splitlines() or ['no output'])[-1]}
+    return json.loads(lines[-1])
+
+
+def child(name, quick, profile_dir):
+    if profile_dir:
+        from profiler import SamplingProfiler
+        os.makedirs(profile_dir, exist_ok=True)
+        path = os.path.abspath(os.path.join(profile_dir, f'{name}.folded'))
+        with SamplingProfiler() as profiler:
+            metrics = CASES[name](quick)
+        profiler.write(path)
+        metrics['profile'] = path
+    else:
+        metrics = CASES[name](quick)
+    print(json.dumps(metrics), flush=True)
+
+
+def direction(metric):
+    if metric.endswith('max_ms'):
+        return 0  # a single worst sample: reported, too noisy to judge
+    if metric.endswith(HIGHER_IS_BETTER):
+        return 1
+    if metric.endswith(LOWER_IS_BETTER):
+        return -1
+    return 0  # counts and sizes are reported, not judged
+
+
+def compare(results, baseline, tolerance):
+    """Per metric: baseline, current and relative change; regressions are worse than `tolerance`."""
+    comparison, regressions = {}, []
+    for case, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(case, {}).get(metric)
+            sign = direction(metric)
+            if not sign or not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+                continue
+            change = (value - old) / old
+            entry = {'baseline': old, 'current': value, 'change': round(change, 3)}
+            floor = next((v for suffix, v in NOISE_FLOOR.items() if metric.endswith(suffix)), 0.0)
+            if change * sign < -tolerance and abs(value - old) >= floor:
+                entry['regression'] = True
+                regressions.append(f'{case}.{metric}')
+            comparison.setdefault(case, {})[metric] = entry
+    return comparison, regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ad, motion and joystick benchmark suite')
+    parser.add_argument('cases', nargs='*', choices=[[]] + list(CASES), help='default: all')
+    parser.add_argument('--quick', action='store_true', help='fewer iterations and smaller uploads')
+    parser.add_argument('--output', help='write the results JSON here as well')
+    parser.add_argument('--baseline', help='results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown')
+    parser.add_argument('--save-baseline', help='write these results as the new baseline')
+    parser.add_argument('--profile', metavar='DIR', help='sample each case and write DIR/<case>.folded')
+    parser.add_argument('--child', choices=list(CASES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.quick, args.profile)
+        os._exit(0)  # the apps' daemon and native (GStreamer, OpenCV) threads don't tear down cleanly
+
+    results = {}
+    for name in args.cases or list(CASES):
+        print(f"⏱ {name}...", file=sys.stderr, flush=True)
+        results[name] = run_case(name, args.quick, args.profile)
+    report = {'meta': {'started': time.strftime('%Y-%m-%dT%H:%M:%S'), 'quick': args.quick,
+                       'python': platform.python_version(), 'machine': platform.machine(),
+                       'node': platform.node()},
+              'results': results}
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('meta', {}).get('quick', args.quick) != args.quick:
+            print("⚠️ baseline and this run differ in --quick; expect differences", file=sys.stderr)
+        report['comparison'], regressions = compare(results, baseline.get('results', baseline), args.tolerance)
+        report['regressions'] = regressions
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                f.write(text + '\n')
+    failed = [name for name, metrics in results.items() if 'error' in metrics]
+    if failed:
+        print(f"❌ failed: {', '.join(failed)}", file=sys.stderr)
+    if regressions:
+        print(f"❌ slower than baseline: {', '.join(regressions)}", file=sys.stderr)
+    sys.exit(1 if failed or regressions else 0)
@@ -0,0 +1,132 @@
+# === Multi-Rover Sync Check ===
+# Starts several ad_manager instances on localhost (headless display, one
+# working directory and port each), puts ads on the first one, then has every
+# other rover pull from its neighbour. Checks that:
+#   - all manifests end up identical and nothing already present is fetched again
+#   - a rename on one rover reaches the others without moving any blob bytes
+#   - a bandwidth-limited pull that is cancelled part way resumes where it stopped
+#
+#     python benchmarks/sync_rovers.py --rovers 3 --size-mb 20 --kbps 4000
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE_PORT = 5310
+
+
+def call(url, method='GET', body=None):
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req, timeout=30) as resp:
+        return json.loads(resp.read().decode('utf-8'))
+
+
+def wait_for(predicate, timeout=60, interval=0.1):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = predicate()
+        if result:
+            return result
+        time.sleep(interval)
+    raise TimeoutError('condition not met in time')
+
+
+def start_rover(workdir, port):
+    os.makedirs(os.path.join(workdir, 'advertisement'), exist_ok=True)
+    env = dict(os.environ, AD_DISPLAY_MODE='headless', ADROVER_EVENT_DIR=os.path.join(workdir, 'events'))
+    log = open(os.path.join(workdir, 'rover.log'), 'w')
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, 'ad_management', 'ad_manager.py'),
+                             '--production', '--port', str(port)], cwd=workdir, env=env, stdout=log, stderr=log)
+    url = f'http://127.0.0.1:{port}'
+
+    def up():
+        try:
+            return call(url + '/api/sync/manifest')
+        except OSError:
+            return None
+    wait_for(up, 30)
+    return proc, url
+
+
+def pull(url, peer, **options):
+    call(url + '/api/sync/pull', 'POST', dict(peer=peer, **options))
+    return wait_for(lambda: (lambda job: job if job['state'] != 'running' else None)(
+        call(url + '/api/sync/pull')['job']), 300)
+
+
+def run(rovers=3, size_mb=20, kbps=4000):
+    base = tempfile.mkdtemp(prefix='rover-sync-')
+    procs, urls = [], []
+    try:
+        for i in range(rovers):
+            proc, url = start_rover(os.path.join(base, f'rover{i}'), BASE_PORT + i)
+            procs.append(proc)
+            urls.append(url)
+
+        # Seed rover 0 out of band: two distinct videos and one duplicate of the first
+        ads = os.path.join(base, 'rover0', 'advertisement')
+        payload = os.urandom(size_mb * 1024 * 1024)
+        for name, data in (('promo.mp4', payload), ('menu.mp4', payload[::-1]), ('promo_copy.mp4', payload)):
+            with open(os.path.join(ads, name), 'wb') as f:
+                f.write(data)
+        wait_for(lambda: len(call(urls[0] + '/api/sync/manifest')['ads']) == 3)
+        store = call(urls[0] + '/api/status')['status']['store']
+
+        report = {'rovers': rovers, 'size_mb': size_mb, 'seed_store': store, 'pulls': []}
+        for i in range(1, rovers):
+            started = time.monotonic()
+            job = pull(urls[i], urls[i - 1])
+            report['pulls'].append({'rover': i, 'from': i - 1, 'state': job['state'],
+                                    'mb': round(job['bytes_done'] / (1024 * 1024), 1),
+                                    'seconds': round(time.monotonic() - started, 2), 'added': job['added']})
+        manifests = [call(url + '/api/sync/manifest')['ads'] for url in urls]
+        report['manifests_identical'] = all(m == manifests[0] for m in manifests)
+
+        # Rename on rover 0, then pull again: only names change
+        call(urls[0] + '/api/ads/menu.mp4/rename', 'POST', {'new_name': 'lunch_menu.mp4'})
+        job = pull(urls[1], urls[0], mirror=True)
+        report['rename'] = {'bytes_fetched': job['bytes_done'], 'added': job['added'], 'removed': job['removed']}
+
+        # Interrupted, bandwidth-limited pull of a new ad, then resume
+        with open(os.path.join(ads, 'new.mp4'), 'wb') as f:
+            f.write(os.urandom(size_mb * 1024 * 1024))
+        wait_for(lambda: 'new.mp4' in call(urls[0] + '/api/sync/manifest')['ads'])
+        call(urls[1] + '/api/sync/pull', 'POST', {'peer': urls[0], 'bandwidth_kbps': kbps})
+        time.sleep(1.0)
+        call(urls[1] + '/api/sync/pull', 'DELETE')
+        first = wait_for(lambda: (lambda job: job if job['state'] != 'running' else None)(
+            call(urls[1] + '/api/sync/pull')['job']))
+        second = pull(urls[1], urls[0])
+        report['resume'] = {'first_state': first['state'], 'first_mb': round(first['bytes_done'] / (1024 * 1024), 2),
+                            'first_rate_kbps': round(first['bytes_done'] / 1024 / (first['finished'] - first['started']), 1),
+                            'resumed_mb': round(second['bytes_resumed'] / (1024 * 1024), 2),
+                            'second_state': second['state']}
+        return report
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait(10)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sync ads between several local ad_manager instances')
+    parser.add_argument('--rovers', type=int, default=3)
+    parser.add_argument('--size-mb', type=int, default=20)
+    parser.add_argument('--kbps', type=float, default=4000)
+    args = parser.parse_args()
+
+    report = run(args.rovers, args.size_mb, args.kbps)
+    print(json.dumps(report, indent=2))
+    assert report['manifests_identical'], 'rovers disagree after sync'
+    assert report['seed_store']['stored_mb'] < report['seed_store']['logical_mb'], 'duplicate was stored twice'
+    assert report['rename']['bytes_fetched'] == 0, 'a rename moved blob bytes'
+    assert report['resume']['first_state'] == 'cancelled' and report['resume']['resumed_mb'] > 0, 'pull did not resume'
+    assert report['resume']['second_state'] == 'done'
+    print("✅ rovers in sync")
@@ -0,0 +1,163 @@
+# === Telemetry Recorder Benchmark ===
+# Drives opencr.telemetry with the simulated OpenCR's synthetic telemetry and
+# reports:
+#   ingest        parse_reply() + record() cost per line, as the reader thread pays it
+#   queries       window / resample / summary times over a full ring
+#   live_feed     frames per second another process gets at 50 and 1000 lines/s in
+#   crash         records still in the ring after the writer is SIGKILLed
+#
+#     python benchmarks/telemetry_bench.py --lines 200000 --rates 50 1000
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from opencr.protocol import ProtocolReader, parse_reply
+from opencr.sim import FakeOpenCR, FakeSerial
+from opencr.telemetry import (CAPACITY, TelemetryRecorder, TelemetryRing, live_feed, query, resample,
+                              summarize, to_record)
+from load_test import percentile
+
+
+def synthetic_lines(count, hz=100.0):
+    """Telemetry lines as the board would send them at `hz` while driving around, a Done every 50."""
+    opencr = FakeOpenCR(telemetry_hz=0)
+    start = time.monotonic()
+    for i in range(count):
+        if i % 400 == 0:
+            opencr.handle('flrb'[i // 400 % 4])
+        yield 'Done' if i % 50 == 49 else opencr.telemetry_line(start + i / hz)
+
+
+def ingest(path, count):
+    recorder = TelemetryRecorder(path)
+    lines = list(synthetic_lines(count))
+    calls = []
+    started = time.perf_counter()
+    for line in lines:
+        before = time.perf_counter()
+        recorder.record(parse_reply(line))
+        calls.append((time.perf_counter() - before) * 1e6)
+    elapsed = time.perf_counter() - started
+    recorder.release()
+    calls.sort()
+    return {'lines': count, 'lines_per_s': round(count / elapsed),
+            'record_us': {'p50': round(percentile(calls, 50), 2), 'p99': round(percentile(calls, 99), 2)}}
+
+
+def queries(path, capacity, hz=100.0):
+    """Fill a ring with `capacity` records at `hz` ending now, then time the read side."""
+    ring = TelemetryRing(path, capacity, writable=True)
+    first = time.time() - capacity / hz
+    for i, line in enumerate(synthetic_lines(capacity, hz)):
+        ring.append(*to_record(parse_reply(line)), t=first + i / hz)
+    ring.close()
+    reader = TelemetryRing(path)
+
+    def timed(fn, repeat=20):
+        times = []
+        for _ in range(repeat):
+            before = time.perf_counter()
+            result = fn()
+            times.append((time.perf_counter() - before) * 1000)
+        return result, round(sorted(times)[len(times) // 2], 3)
+
+    recent, recent_ms = timed(lambda: reader.window(seconds=60))
+    everything, all_ms = timed(lambda: reader.window())
+    _, resample_ms = timed(lambda: resample(everything, 1.0))
+    _, summary_ms = timed(lambda: summarize(everything))
+    _, query_ms = timed(lambda: query(reader, 600, 1.0))
+    tracemalloc.start()
+    reader.window(seconds=60)
+    _, window_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'capacity': capacity, 'ring_mb': round(os.path.getsize(path) / (1024 * 1024), 1),
+            'window_60s_ms': recent_ms, 'window_60s_records': len(recent),
+            'window_60s_peak_kb': round(window_peak / 1024, 1),
+            'window_all_ms': all_ms, 'resample_all_1s_ms': resample_ms, 'summary_all_ms': summary_ms,
+            'query_600s_1s_ms': query_ms}
+
+
+def live(path, rate, seconds=3.0, feed_hz=4.0):
+    """Record the simulator's stream at `rate` lines/s while a second process follows the live feed."""
+    if os.path.exists(path):
+        os.unlink(path)
+    recorder = TelemetryRecorder(path)
+    port = FakeSerial(opencr=FakeOpenCR(telemetry_hz=rate), timeout=0.2)
+    reader = ProtocolReader(port)
+    reader.taps.append(recorder.record)
+    reader.start()
+    deadline = time.monotonic() + 5
+    while recorder.ring is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    child = subprocess.run([sys.executable, __file__, '--child-feed', path, str(seconds), str(feed_hz)],
+                           capture_output=True, text=True, timeout=seconds + 30)
+    reader.close()
+    port.close()
+    recorder.release()
+    frames = [json.loads(line) for line in child.stdout.splitlines()]
+    return {'input_lines_per_s': rate, 'feed_hz': feed_hz, 'frames': len(frames),
+            'frames_per_s': round(len(frames) / seconds, 2),
+            'lines_per_frame': round(sum(f['lines'] for f in frames) / max(1, len(frames)), 1),
+            'recorded': recorder.recorded}
+
+
+def crash(path, count=5000):
+    """SIGKILL a writer mid-stream and check what survives in the ring."""
+    if os.path.exists(path):
+        os.unlink(path)
+    child = subprocess.run([sys.executable, __file__, '--child-crash', path, str(count)], timeout=60)
+    ring = TelemetryRing(path)
+    newest = ring.window()[-1:]
+    return {'killed_by_signal': child.returncode == -signal.SIGKILL, 'written': count,
+            'in_ring': ring.count(), 'last_seq': int(newest['seq'][0]) if len(newest) else None}
+
+
+def child_feed(path, seconds, feed_hz):
+    ring = TelemetryRing(path)
+    deadline = time.monotonic() + seconds
+    for frame in live_feed(ring, feed_hz):
+        print(json.dumps(frame), flush=True)
+        if time.monotonic() >= deadline:
+            break
+
+
+def child_crash(path, count):
+    recorder = TelemetryRecorder(path)
+    for line in synthetic_lines(count):
+        recorder.record(parse_reply(line))
+    os.kill(os.getpid(), signal.SIGKILL)  # no close(), no msync
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child-feed']:
+        child_feed(sys.argv[2], float(sys.argv[3]), float(sys.argv[4]))
+        sys.exit(0)
+    if sys.argv[1:2] == ['--child-crash']:
+        child_crash(sys.argv[2], int(sys.argv[3]))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description='Telemetry ring ingest, query, live feed and crash check')
+    parser.add_argument('--lines', type=int, default=200000)
+    parser.add_argument('--capacity', type=int, default=CAPACITY)
+    parser.add_argument('--rates', type=float, nargs='+', default=[50, 1000])
+    parser.add_argument('--seconds', type=float, default=3.0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='telemetry-bench-')
+    report = {
+        'ingest': ingest(os.path.join(workdir, 'ingest.ring'), args.lines),
+        'queries': queries(os.path.join(workdir, 'query.ring'), args.capacity),
+        'live_feed': [live(os.path.join(workdir, 'live.ring'), rate, args.seconds) for rate in args.rates],
+        'crash': crash(os.path.join(workdir, 'crash.ring'))
+    }
+    print(json.dumps(report, indent=2))
+    assert report['crash']['in_ring'] == report['crash']['written'], 'records lost in the crash'
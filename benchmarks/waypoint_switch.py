@@ -0,0 +1,97 @@
+# === Waypoint Ad Switch Latency ===
+# Runs the real motion executor (simulated serial) and the real ad player
+# (headless display) in one process, connected through the event bus, and
+# measures how long after a script's 'ad:' event that ad is on screen.
+# Fails when the p95 exceeds one frame (--max-ms, default 1000/60 plus 1ms).
+#
+#     python benchmarks/waypoint_switch.py --loops 10
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'Text_motion'))
+sys.path.insert(0, os.path.join(ROOT, 'ad_management'))
+
+import numpy as np
+
+SCRIPT = """
+move: 0.05
+ad: waypoint_a.jpg
+wait: 0.4
+move: 0.05
+waypoint: corner
+ad: waypoint_b.jpg
+wait: 0.4
+"""
+
+
+def run(loops=10):
+    workdir = tempfile.mkdtemp(prefix='waypoint-bench-')
+    os.chdir(workdir)
+    os.environ['AD_DISPLAY_MODE'] = 'headless'
+    os.environ['ADROVER_EVENT_DIR'] = os.path.join(workdir, 'events')
+    import cv2
+    os.makedirs('advertisement')
+    for name, color in (('rotation.jpg', 40), ('waypoint_a.jpg', 120), ('waypoint_b.jpg', 200)):
+        cv2.imwrite(os.path.join('advertisement', name), np.full((1920, 1080, 3), color, np.uint8))
+
+    import ad_manager
+    from eventbus import Publisher
+    from executor import MotionExecutor
+    from motion_script import compile_script
+    from opencr.sim import FakeOpenCR, FakeSerial
+    from load_test import percentile
+
+    samples, shown = [], {}
+    original = ad_manager.player_stats.cue_shown
+
+    def record(filename, cue_ms):
+        samples.append(cue_ms)
+        shown[filename] = shown.get(filename, 0) + 1
+        original(filename, cue_ms)
+
+    ad_manager.player_stats.cue_shown = record
+    ad_manager.create_app()
+    deadline = time.monotonic() + 10
+    while ad_manager.display.status()['state'] not in ('ready', 'first_ad') or len(ad_manager.ad_catalog.playlist()) < 3:
+        if time.monotonic() > deadline:
+            raise RuntimeError('ad player did not come up')
+        time.sleep(0.05)
+
+    bus = Publisher()
+    executor = MotionExecutor(lambda timeout=1: FakeSerial(timeout=timeout, opencr=FakeOpenCR(move_seconds=0.2)),
+                              publish=bus.publish)
+    executor.start('bench', compile_script(SCRIPT), loops=loops)
+    executor.join()
+    time.sleep(0.2)
+
+    samples.sort()
+    return {
+        'loops': loops,
+        'cues': len(samples),
+        'shown': shown,
+        'cue_to_frame_p50_ms': round(percentile(samples, 50), 2) if samples else None,
+        'cue_to_frame_p95_ms': round(percentile(samples, 95), 2) if samples else None,
+        'cue_to_frame_max_ms': round(samples[-1], 2) if samples else None,
+        'frame_cache': ad_manager.frame_cache.stats(),
+        'bus': bus.stats
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Waypoint cue to ad-on-screen latency')
+    parser.add_argument('--loops', type=int, default=10)
+    parser.add_argument('--max-ms', type=float, default=1000 / 60 + 1)
+    args = parser.parse_args()
+
+    report = run(args.loops)
+    print(json.dumps(report, indent=2))
+    assert report['cues'] == 2 * args.loops, "not every 'ad:' event reached the screen"
+    assert report['cue_to_frame_p95_ms'] <= args.max_ms, \
+        f"p95 cue latency {report['cue_to_frame_p95_ms']}ms exceeds {args.max_ms:.1f}ms"
+    print("✅ waypoint ads switch within one frame")
@@ -0,0 +1,112 @@
+# === Local Event Bus ===
+# Fire-and-forget pub/sub between the robot's processes on one machine, e.g.
+# motion.py announcing waypoints and ad cues that ad_manager.py acts on.
+#
+# Every Subscriber binds a Unix datagram socket in EVENT_DIR; publish() sends
+# one JSON datagram to each socket found there. No broker process, no
+# connection setup, and a non-blocking send, so a slow or dead subscriber can
+# never stall the publisher (dead sockets are removed, full ones are skipped).
+#
+#     bus = Publisher();  bus.publish('ad', ad='promo.jpg')
+#     Subscriber('player').listen(lambda event: print(event['topic'], event))
+import json
+import os
+import socket
+import threading
+import time
+
+EVENT_DIR = os.environ.get('ADROVER_EVENT_DIR', '/tmp/adrover-events')
+MAX_DATAGRAM = 8192
+
+
+class Publisher:
+    def __init__(self, directory=EVENT_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+        self._targets = []
+        self._listed_mtime = None
+        self._lock = threading.Lock()
+        self.stats = {'published': 0, 'delivered': 0, 'dropped': 0}
+
+    def _subscribers(self):
+        # Re-list only when a socket was added or removed (the directory mtime changes)
+        try:
+            mtime = os.stat(self.directory).st_mtime_ns
+        except OSError:
+            return []
+        if mtime != self._listed_mtime:
+            self._targets = [os.path.join(self.directory, name)
+                             for name in os.listdir(self.directory) if name.endswith('.sock')]
+            self._listed_mtime = mtime
+        return self._targets
+
+    def publish(self, topic, **fields):
+        """Send {'topic', 't', **fields} to every subscriber; returns how many received it."""
+        data = json.dumps(dict(fields, topic=topic, t=time.time())).encode()
+        delivered = 0
+        with self._lock:
+            self.stats['published'] += 1
+            for path in list(self._subscribers()):
+                try:
+                    self._sock.sendto(data, path)
+                    delivered += 1
+                except (ConnectionRefusedError, FileNotFoundError):
+                    try:
+                        os.unlink(path)  # subscriber died without cleaning up
+                    except OSError:
+                        pass
+                except (BlockingIOError, OSError):
+                    self.stats['dropped'] += 1
+            self.stats['delivered'] += delivered
+        return delivered
+
+    def close(self):
+        self._sock.close()
+
+
+class Subscriber:
+    def __init__(self, name, topics=None, directory=EVENT_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.topics = set(topics) if topics else None
+        self.path = os.path.join(directory, f"{name}-{os.getpid()}.sock")
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.path)
+        self._running = False
+
+    def listen(self, callback):
+        """Call callback(event) on a background thread for every matching event."""
+        self._running = True
+
+        def run():
+            while self._running:
+                try:
+                    data = self._sock.recv(MAX_DATAGRAM)
+                except OSError:
+                    break
+                try:
+                    event = json.loads(data)
+                except ValueError:
+                    continue
+                if self.topics is None or event.get('topic') in self.topics:
+                    try:
+                        callback(event)
+                    except Exception as e:
+                        print(f"Event handler error ({event.get('topic')}): {e}")
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def close(self):
+        self._running = False
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as waker:
+                waker.sendto(b'', self.path)  # wake the blocked recv()
+            os.unlink(self.path)
+        except OSError:
+            pass
+        self._sock.close()
@@ -0,0 +1,40 @@
+# === OpenCR Serial Helpers ===
+# Shared by Joystick/joystick.py and Text_motion/motion.py.
+#
+# open_serial() is the one place the apps open the OpenCR port. Besides a real
+# device path it accepts OPENCR_PORT=fake for an in-process simulated board
+# (see opencr/sim.py), so both apps run and can be tested without hardware.
+#
+# connect() is what the apps call: when the serial broker (opencr/broker.py) is
+# running they share its connection, otherwise they open the port directly.
+import os
+
+DEFAULT_PORT = '/dev/serial/by-path/platform-70090000.xusb-usb-0:3.2:1.0'
+BAUDRATE = 115200
+BROKER_SOCKET = os.environ.get('OPENCR_BROKER_SOCKET', '/tmp/opencr-broker.sock')
+TELEMETRY_FILE = os.environ.get('OPENCR_TELEMETRY_FILE', '/tmp/opencr-telemetry.ring')  # see opencr/telemetry.py
+
+
+def configured_port():
+    return os.environ.get('OPENCR_PORT', DEFAULT_PORT)
+
+
+def open_serial(port=None, baudrate=BAUDRATE, timeout=1, **kwargs):
+    """Open the OpenCR port (or its simulator) with a pyserial-compatible interface."""
+    port = port or configured_port()
+    if port == 'fake':
+        from opencr.sim import FakeSerial
+        return FakeSerial(port, baudrate, timeout=timeout, **kwargs)
+    import serial
+    return serial.Serial(port, baudrate, timeout=timeout, **kwargs)
+
+
+def connect(timeout=1):
+    """Broker connection if a broker is listening (unless OPENCR_BROKER=off), else the port itself."""
+    if os.environ.get('OPENCR_BROKER', 'auto') != 'off' and os.path.exists(BROKER_SOCKET):
+        from opencr.client import BrokerSerial
+        try:
+            return BrokerSerial(BROKER_SOCKET, timeout)
+        except OSError as e:
+            print(f"⚠️ Broker socket {BROKER_SOCKET} not answering ({e}), opening the port directly")
+    return open_serial(timeout=timeout)
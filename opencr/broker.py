@@ -0,0 +1,286 @@
+# === OpenCR Serial Broker ===
+# One process owns the OpenCR port; joystick.py and motion.py talk to it over a
+# Unix socket instead of opening the device themselves (see opencr.connect()).
+#
+#   - writer thread drains a priority queue: a stop jumps the queue and drops
+#     the drive commands still waiting behind it
+#   - reader thread broadcasts every line from the board to all clients
+#   - connector thread reopens the port with backoff after a disconnect, then
+#     replays what was queued meanwhile according to the replay policy:
+#       none    drop queued drive commands (stops are always kept)
+#       latest  keep only the newest drive command      (default)
+#       all     keep every queued command
+#     anything older than --replay-max-age is dropped regardless
+#   - every line read is also recorded to the telemetry ring (opencr/telemetry.py)
+#     and odometry is published as 'pose' events on the robot event bus
+#
+# Wire format: one JSON object per line.
+#   client -> broker  {"op": "send", "line": "d 10", "priority": "normal"|"stop"}
+#                     {"op": "status"}
+#   broker -> client  {"event": "line", "line": "Done", "t": <unix time>}
+#                     {"event": "status", ...}
+#
+#     python -m opencr.broker                      # real port (OPENCR_PORT)
+#     python -m opencr.broker --simulate           # pty-backed fake OpenCR
+#     python -m opencr.broker --simulate --telemetry-hz 50
+import argparse
+import heapq
+import itertools
+import json
+import os
+import socketserver
+import threading
+import time
+
+import serial
+
+from opencr import BAUDRATE, BROKER_SOCKET, TELEMETRY_FILE, configured_port, open_serial
+from opencr.protocol import parse_reply
+
+STOP, NORMAL = 0, 1
+PRIORITIES = {'stop': STOP, 'normal': NORMAL}
+REPLAY_POLICIES = ('none', 'latest', 'all')
+
+
+class SerialBroker:
+    def __init__(self, port, baudrate=BAUDRATE, replay='latest', replay_max_age=1.0, telemetry=None):
+        if replay not in REPLAY_POLICIES:
+            raise ValueError(f"replay policy must be one of {REPLAY_POLICIES}")
+        self.port = port
+        self.baudrate = baudrate
+        self.replay = replay
+        self.replay_max_age = replay_max_age
+        self.telemetry = telemetry  # TelemetryRecorder, or None
+        self.ser = None
+        self.connected_since = None
+        self._connected_once = False
+        self._queue = []  # (priority, seq, queued_at, line)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._clients = {}  # wfile -> send lock
+        self._clients_lock = threading.Lock()
+        self.stats = {'written': 0, 'stops': 0, 'preempted': 0, 'lines_read': 0,
+                      'reconnects': 0, 'replayed': 0, 'dropped_on_reconnect': 0}
+
+    # --- queue ---
+    def submit(self, line, priority='normal'):
+        prio = PRIORITIES.get(priority, NORMAL)
+        with self._cond:
+            if prio == STOP:
+                kept = [item for item in self._queue if item[0] == STOP]
+                self.stats['preempted'] += len(self._queue) - len(kept)
+                self._queue = kept
+                heapq.heapify(self._queue)
+            heapq.heappush(self._queue, (prio, next(self._seq), time.monotonic(), line))
+            self._cond.notify_all()
+
+    def _apply_replay_policy(self):
+        """Trim what queued up while the port was down; caller holds _cond."""
+        now = time.monotonic()
+        stops = [item for item in self._queue if item[0] == STOP]
+        drives = sorted(item for item in self._queue
+                        if item[0] != STOP and now - item[2] <= self.replay_max_age)
+        if self.replay == 'none':
+            drives = []
+        elif self.replay == 'latest':
+            drives = drives[-1:]
+        kept = stops + drives
+        self.stats['dropped_on_reconnect'] += len(self._queue) - len(kept)
+        self.stats['replayed'] += len(kept)
+        self._queue = kept
+        heapq.heapify(self._queue)
+
+    # --- serial side ---
+    def _lost(self, port, error):
+        with self._cond:
+            if self.ser is not port:
+                return
+            print(f"⚠️ OpenCR connection lost: {error}")
+            self.ser, self.connected_since = None, None
+            self._cond.notify_all()
+        try:
+            port.close()
+        except (serial.SerialException, OSError):
+            pass
+
+    def _connector(self):
+        delay = 0.05
+        while True:
+            with self._cond:
+                while self.ser is not None:
+                    self._cond.wait()
+            try:
+                port = open_serial(self.port, self.baudrate, timeout=0.5)
+            except (serial.SerialException, OSError) as e:
+                print(f"❌ Serial error: {e}, retrying in {delay:.2f}s...")
+                time.sleep(delay)
+                delay = min(2.0, delay * 2)
+                continue
+            delay = 0.05
+            with self._cond:
+                if self._connected_once:
+                    self.stats['reconnects'] += 1
+                self._connected_once = True
+                self._apply_replay_policy()
+                self.ser, self.connected_since = port, time.time()
+                self._cond.notify_all()
+            print(f"✅ Broker connected to OpenCR on {self.port}")
+
+    def _writer(self):
+        while True:
+            with self._cond:
+                while not self._queue or self.ser is None:
+                    self._cond.wait()
+                item = heapq.heappop(self._queue)
+                port = self.ser
+            try:
+                port.write(f"{item[3]}\r\n".encode('utf-8'))
+            except (serial.SerialException, OSError) as e:
+                with self._cond:
+                    heapq.heappush(self._queue, item)  # the replay policy decides its fate
+                self._lost(port, e)
+                continue
+            self.stats['written'] += 1
+            if item[0] == STOP:
+                self.stats['stops'] += 1
+
+    def _reader(self):
+        while True:
+            with self._cond:
+                while self.ser is None:
+                    self._cond.wait()
+                port = self.ser
+            try:
+                raw = port.readline()
+            except (serial.SerialException, OSError, TypeError) as e:
+                self._lost(port, e)
+                continue
+            line = raw.decode('utf-8', errors='ignore').strip()
+            if line:
+                self.stats['lines_read'] += 1
+                self.broadcast({'event': 'line', 'line': line, 't': time.time()})
+                if self.telemetry is not None:
+                    self.telemetry.record(parse_reply(line))
+
+    # --- clients ---
+    def add_client(self, wfile):
+        with self._clients_lock:
+            self._clients[wfile] = threading.Lock()
+
+    def remove_client(self, wfile):
+        with self._clients_lock:
+            self._clients.pop(wfile, None)
+
+    def send_to(self, wfile, message):
+        with self._clients_lock:
+            send_lock = self._clients.get(wfile)
+        if send_lock is None:
+            return
+        data = (json.dumps(message) + '\n').encode()
+        with send_lock:
+            try:
+                wfile.write(data)
+                wfile.flush()
+            except OSError:
+                self.remove_client(wfile)
+
+    def broadcast(self, message):
+        with self._clients_lock:
+            targets = list(self._clients)
+        for wfile in targets:
+            self.send_to(wfile, message)
+
+    def status(self):
+        with self._cond:
+            queued = len(self._queue)
+        with self._clients_lock:
+            clients = len(self._clients)
+        return {'event': 'status', 'port': self.port, 'connected': self.ser is not None,
+                'connected_since': self.connected_since, 'queued': queued, 'clients': clients,
+                'replay': self.replay, **self.stats,
+                'telemetry': self.telemetry.stats() if self.telemetry is not None else None}
+
+    def start(self):
+        for target in (self._connector, self._writer, self._reader):
+            threading.Thread(target=target, daemon=True).start()
+        return self
+
+
+class _ClientHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        broker = self.server.broker
+        broker.add_client(self.wfile)
+        try:
+            for raw in self.rfile:
+                try:
+                    msg = json.loads(raw)
+                except ValueError:
+                    continue
+                if msg.get('op') == 'send' and isinstance(msg.get('line'), str):
+                    broker.submit(msg['line'].strip(), msg.get('priority', 'normal'))
+                elif msg.get('op') == 'status':
+                    broker.send_to(self.wfile, broker.status())
+        except OSError:
+            pass
+        finally:
+            broker.remove_client(self.wfile)
+
+
+class BrokerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, broker):
+        if os.path.exists(path):
+            os.unlink(path)  # left over from a previous run
+        self.broker = broker
+        super().__init__(path, _ClientHandler)
+        os.chmod(path, 0o660)
+
+
+def telemetry_recorder(path):
+    """Recorder for the broker's lines, publishing 'pose' events when the event bus is available."""
+    from eventbus import Publisher
+    from opencr.telemetry import TelemetryRecorder
+    try:
+        publish = Publisher().publish
+    except OSError as e:
+        print(f"⚠ Robot event bus unavailable: {e}")
+        publish = None
+    return TelemetryRecorder(path, publish=publish)
+
+
+def serve(path=BROKER_SOCKET, port=None, baudrate=BAUDRATE, replay='latest', replay_max_age=1.0,
+          telemetry=None):
+    recorder = telemetry_recorder(telemetry) if telemetry else None
+    broker = SerialBroker(port or configured_port(), baudrate, replay, replay_max_age, recorder).start()
+    server = BrokerServer(path, broker)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"OpenCR broker listening on {path}")
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Shared OpenCR serial broker')
+    parser.add_argument('--socket', default=BROKER_SOCKET)
+    parser.add_argument('--port', help='serial device (default: OPENCR_PORT or the Jetson path)')
+    parser.add_argument('--replay', choices=REPLAY_POLICIES, default='latest')
+    parser.add_argument('--replay-max-age', type=float, default=1.0, help='seconds')
+    parser.add_argument('--simulate', action='store_true', help='serve a pty-backed fake OpenCR')
+    parser.add_argument('--telemetry-hz', type=float, default=0.0, help='synthetic telemetry rate with --simulate')
+    parser.add_argument('--telemetry', default=TELEMETRY_FILE, help='telemetry ring file')
+    parser.add_argument('--no-telemetry', action='store_true', help="don't record telemetry")
+    args = parser.parse_args()
+
+    port = args.port
+    if args.simulate:
+        from opencr.sim import FakeOpenCR, PtyOpenCR
+        port = PtyOpenCR(FakeOpenCR(telemetry_hz=args.telemetry_hz)).port
+        print(f"Simulated OpenCR on {port}")
+    server = serve(args.socket, port, replay=args.replay, replay_max_age=args.replay_max_age,
+                   telemetry=None if args.no_telemetry else args.telemetry)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.server_close()
+        os.unlink(args.socket)
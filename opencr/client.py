@@ -0,0 +1,117 @@
+# === Broker Client ===
+# BrokerSerial speaks the broker's socket protocol behind the pyserial calls the
+# apps already make (write, readline, read, in_waiting, reset_input_buffer,
+# close), so joystick.py and motion.py need no broker-specific code. A written
+# 's' goes out with stop priority. Lines from the board arrive on a background
+# thread and are buffered until read.
+import json
+import socket
+import threading
+import time
+
+import serial
+
+
+class BrokerSerial:
+    def __init__(self, path, timeout=1):
+        self.port = path
+        self.timeout = timeout
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(path)
+        self._rfile = self._sock.makefile('rb')
+        self._send_lock = threading.Lock()
+        self._rx = bytearray()
+        self._cond = threading.Condition()
+        self._status = None
+        self.is_open = True
+        threading.Thread(target=self._receive, daemon=True).start()
+
+    def _receive(self):
+        try:
+            for raw in self._rfile:
+                msg = json.loads(raw)
+                with self._cond:
+                    if msg.get('event') == 'line':
+                        self._rx += (msg['line'] + '\r\n').encode()
+                    elif msg.get('event') == 'status':
+                        self._status = msg
+                    self._cond.notify_all()
+        except (OSError, ValueError):
+            pass
+        with self._cond:
+            self.is_open = False
+            self._cond.notify_all()
+
+    def _send(self, message):
+        if not self.is_open:
+            raise serial.SerialException('Broker connection closed')
+        data = (json.dumps(message) + '\n').encode()
+        try:
+            with self._send_lock:
+                self._sock.sendall(data)
+        except OSError as e:
+            self.is_open = False
+            raise serial.SerialException(f'Broker connection lost: {e}')
+
+    # --- pyserial API ---
+    def write(self, data):
+        for line in data.decode('utf-8', errors='ignore').splitlines():
+            line = line.strip()
+            if line:
+                self._send({'op': 'send', 'line': line, 'priority': 'stop' if line == 's' else 'normal'})
+        return len(data)
+
+    @property
+    def in_waiting(self):
+        with self._cond:
+            return len(self._rx)
+
+    def _wait_for(self, ready):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while not ready() and self.is_open:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            self._cond.wait(remaining)
+
+    def read(self, size=1):
+        with self._cond:
+            self._wait_for(lambda: len(self._rx) >= size)
+            data = bytes(self._rx[:size])
+            del self._rx[:size]
+            return data
+
+    def readline(self):
+        with self._cond:
+            self._wait_for(lambda: b'\n' in self._rx)
+            end = self._rx.find(b'\n') + 1 or len(self._rx)
+            data = bytes(self._rx[:end])
+            del self._rx[:end]
+            return data
+
+    def reset_input_buffer(self):
+        with self._cond:
+            self._rx.clear()
+
+    def reset_output_buffer(self):
+        pass  # nothing is buffered client-side
+
+    def flush(self):
+        pass
+
+    def status(self, timeout=1.0):
+        """The broker's status dict (connection state, queue depth, counters)."""
+        with self._cond:
+            self._status = None
+        self._send({'op': 'status'})
+        with self._cond:
+            self._cond.wait_for(lambda: self._status is not None or not self.is_open, timeout)
+            return self._status
+
+    def close(self):
+        self.is_open = False
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
@@ -0,0 +1,150 @@
+# === OpenCR Reply Protocol ===
+# The board answers with newline-terminated lines:
+#   Done                      the oldest outstanding move finished
+#   Error: <text>             the oldest outstanding move was rejected
+#   key=value key=value ...   telemetry, unsolicited
+# anything else is kept as plain text.
+#
+# ProtocolReader runs one thread blocked in readline() (no polling), keeps the
+# last lines in a bounded ring, and matches Done/Error to the command that
+# caused it in send order, so a Done left over from an earlier command can't
+# complete a new one. Every matched command records its round-trip time.
+# Taps see every line first, e.g. opencr.telemetry's recorder.
+import threading
+import time
+from collections import deque
+
+import serial
+
+
+def parse_reply(line):
+    """Classify one line from the board: {'kind': 'done'|'error'|'telemetry'|'text', ...}."""
+    if line == 'Done':
+        return {'kind': 'done', 'line': line}
+    if line.lower().startswith('error'):
+        return {'kind': 'error', 'line': line, 'message': line.partition(':')[2].strip() or line}
+    if '=' in line:
+        values = {}
+        for pair in line.split():
+            key, sep, value = pair.partition('=')
+            if not sep:
+                break
+            try:
+                values[key] = float(value)
+            except ValueError:
+                values[key] = value
+        else:
+            return {'kind': 'telemetry', 'line': line, 'values': values}
+    return {'kind': 'text', 'line': line}
+
+
+class PendingCommand:
+    """A command waiting for its Done; wait() returns the matching reply or None on timeout."""
+
+    def __init__(self, line):
+        self.line = line
+        self.sent_at = None
+        self.reply = None
+        self.rtt_ms = None
+        self._event = threading.Event()
+
+    def resolve(self, reply, at):
+        self.reply = reply
+        self.rtt_ms = (at - self.sent_at) * 1000 if self.sent_at else None
+        self._event.set()
+
+    def wait(self, timeout=None):
+        self._event.wait(timeout)
+        return self.reply
+
+    @property
+    def ok(self):
+        return self.reply is not None and self.reply['kind'] == 'done'
+
+
+class ProtocolReader:
+    def __init__(self, ser, ring_size=256, timing_window=200):
+        self.ser = ser
+        self.recent = deque(maxlen=ring_size)  # (monotonic time, parsed reply)
+        self.listeners = []  # callables(reply) for telemetry and text lines
+        self.taps = []  # callables(reply) for every line, before Done/Error matching (recorders)
+        self.stray = 0  # Done/Error that no command was waiting for
+        self.history = deque(maxlen=1000)  # (command line, rtt ms) of completed commands
+        self._pending = deque()
+        self._timings = {}  # command letter -> deque of rtt ms
+        self._timing_window = timing_window
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self.ser.reset_input_buffer()  # nothing from before this reader can match
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        """Stop reading; the reader thread exits at its next readline timeout or when the port closes."""
+        self._running = False
+        with self._lock:
+            pending, self._pending = list(self._pending), deque()
+        for command in pending:
+            command.resolve(None, time.monotonic())
+
+    def _run(self):
+        while self._running:
+            try:
+                raw = self.ser.readline()
+            except (serial.SerialException, OSError, TypeError):
+                break  # port closed under us
+            line = raw.decode('utf-8', errors='ignore').strip()
+            if line:
+                self._dispatch(parse_reply(line), time.monotonic())
+        self._running = False
+
+    def _dispatch(self, reply, at):
+        self.recent.append((at, reply))
+        for tap in list(self.taps):
+            tap(reply)
+        if reply['kind'] in ('done', 'error'):
+            with self._lock:
+                command = self._pending.popleft() if self._pending else None
+            if command is None:
+                self.stray += 1
+                return
+            command.resolve(reply, at)
+            if command.rtt_ms is not None:
+                if reply['kind'] == 'done':
+                    self.history.append((command.line, command.rtt_ms))
+                key = command.line.split()[0] if command.line.split() else command.line
+                with self._lock:
+                    self._timings.setdefault(key, deque(maxlen=self._timing_window)).append(command.rtt_ms)
+            return
+        for listener in list(self.listeners):
+            listener(reply)
+
+    def send(self, line):
+        """Write a command that answers Done/Error and return its PendingCommand."""
+        command = PendingCommand(line.strip())
+        with self._lock:
+            self._pending.append(command)
+        command.sent_at = time.monotonic()
+        try:
+            self.ser.write(f"{command.line}\r\n".encode('utf-8'))
+        except (serial.SerialException, OSError):
+            with self._lock:
+                if command in self._pending:
+                    self._pending.remove(command)
+            raise
+        return command
+
+    def timings(self):
+        """Round-trip stats per command letter, e.g. {'a': {'count', 'avg_ms', 'p95_ms', 'max_ms'}}."""
+        with self._lock:
+            snapshot = {key: sorted(values) for key, values in self._timings.items()}
+        return {key: {'count': len(values),
+                      'avg_ms': round(sum(values) / len(values), 2),
+                      'p95_ms': round(values[min(len(values) - 1, int(0.95 * len(values)))], 2),
+                      'max_ms': round(values[-1], 2)}
+                for key, values in snapshot.items() if values}
@@ -0,0 +1,283 @@
+# === Simulated OpenCR ===
+# FakeOpenCR models what the firmware does with our commands:
+#   f / l / r / b     drive while repeated, no reply
+#   s                 stop, no reply
+#   v <lin> <ang>     continuous velocity setpoint, no reply
+#   a <deg>, d <dist> turn / drive, reply "Done" after the move time
+# With telemetry_hz > 0 it also streams synthetic odometry/battery/current
+# lines ("x=.. y=.. th=.. v=.. w=.. bat=.. il=.. ir=..") at that rate, from a
+# pose integrated over whatever it is currently doing (OPENCR_FAKE_TELEMETRY_HZ
+# sets the default, e.g. for OPENCR_PORT=fake).
+# FakeSerial wraps it in the subset of the pyserial API the apps use, entirely
+# in-process, and timestamps every write so tests can measure latency.
+# PtyOpenCR serves the same model on a pseudo-terminal for code (or another
+# process) that opens a real device path.
+import math
+import os
+import random
+import threading
+import time
+import tty
+from collections import deque
+
+import serial
+
+FAKE_TELEMETRY_HZ = float(os.environ.get('OPENCR_FAKE_TELEMETRY_HZ', 0))
+
+
+class FakeOpenCR:
+    def __init__(self, move_seconds=0.0, turn_speed=90.0, drive_speed=0.2, telemetry_hz=FAKE_TELEMETRY_HZ):
+        self.move_seconds = move_seconds  # fixed move time; 0 means derive from speeds
+        self.turn_speed = turn_speed  # degrees per second
+        self.drive_speed = drive_speed  # distance units per second
+        self.telemetry_hz = telemetry_hz  # synthetic telemetry lines per second, 0 = none
+        self.state = 's'
+        self.commands = deque(maxlen=10000)
+        self.busy_until = 0.0  # moves queue up and finish one after another
+        self.moves = deque()  # (start, end, linear, angular) of queued a/d moves
+        self.pose = [0.0, 0.0, 0.0]  # x, y, heading in degrees
+        self.battery = 12.6
+        self._pose_at = None
+        self._lock = threading.Lock()  # handle() and the telemetry thread share the move queue
+
+    def move_time(self, cmd, value):
+        if self.move_seconds:
+            return self.move_seconds
+        speed = self.turn_speed if cmd == 'a' else self.drive_speed
+        return abs(value) / speed if speed else 0.0
+
+    def handle(self, line):
+        """Process one command line; returns [(delay_seconds, reply_line), ...]."""
+        self.commands.append((time.monotonic(), line))
+        parts = line.split()
+        if not parts:
+            return []
+        cmd = parts[0]
+        if cmd in ('f', 'l', 'r', 'b', 's', 'v'):
+            self.state = line if cmd == 'v' else cmd
+            if cmd == 's':
+                with self._lock:
+                    self.busy_until = 0.0
+                    self.moves.clear()
+            return []
+        if cmd in ('a', 'd') and len(parts) > 1:
+            try:
+                value = float(parts[1])
+            except ValueError:
+                return [(0.0, f'Error: bad value {parts[1]}')]
+            now = time.monotonic()
+            with self._lock:
+                start = max(now, self.busy_until)
+                self.busy_until = start + self.move_time(cmd, value)
+                seconds = self.busy_until - start
+                if seconds > 0:
+                    rate = value / seconds
+                    self.moves.append((start, self.busy_until, 0.0 if cmd == 'a' else rate,
+                                       rate if cmd == 'a' else 0.0))
+            return [(self.busy_until - now, 'Done')]
+        return [(0.0, f'Error: unknown command {cmd}')]
+
+    # --- synthetic telemetry ---
+    def velocity(self, now):
+        """(linear, angular deg/s) the robot is doing at `now`."""
+        while self.moves and self.moves[0][1] <= now:
+            self.moves.popleft()
+        if self.moves and self.moves[0][0] <= now:
+            return self.moves[0][2], self.moves[0][3]
+        state = self.state.split()
+        if state[0] == 'v' and len(state) == 3:
+            try:
+                return float(state[1]) * self.drive_speed, float(state[2]) * self.turn_speed
+            except ValueError:
+                return 0.0, 0.0
+        return {'f': (self.drive_speed, 0.0), 'b': (-self.drive_speed, 0.0),
+                'l': (0.0, self.turn_speed), 'r': (0.0, -self.turn_speed)}.get(state[0], (0.0, 0.0))
+
+    def telemetry_line(self, now=None):
+        """Advance the simulated pose and battery to `now` and report them as one line."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            linear, angular = self.velocity(now)
+        dt = 0.0 if self._pose_at is None else max(0.0, now - self._pose_at)
+        self._pose_at = now
+        heading = math.radians(self.pose[2])
+        self.pose[0] += linear * math.cos(heading) * dt
+        self.pose[1] += linear * math.sin(heading) * dt
+        self.pose[2] = (self.pose[2] + angular * dt) % 360
+        load = (abs(linear) / self.drive_speed if self.drive_speed else 0.0) + \
+            (abs(angular) / self.turn_speed if self.turn_speed else 0.0)
+        current_l = 0.3 + 1.2 * load + random.gauss(0, 0.02)
+        current_r = 0.3 + 1.2 * load + random.gauss(0, 0.02)
+        self.battery = max(10.5, self.battery - (current_l + current_r) * dt * 1e-4)
+        return (f'x={self.pose[0]:.3f} y={self.pose[1]:.3f} th={self.pose[2]:.1f} v={linear:.3f} '
+                f'w={angular:.1f} bat={self.battery - 0.05 * load:.2f} il={current_l:.2f} ir={current_r:.2f}')
+
+    def stream_telemetry(self, is_running, send):
+        """Call send(line) telemetry_hz times a second while is_running() (run on its own thread)."""
+        period = 1.0 / self.telemetry_hz
+        next_at = time.monotonic()
+        while is_running():
+            send(self.telemetry_line())
+            next_at += period
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_at = time.monotonic()  # fell behind; don't burst to catch up
+
+
+class FakeSerial:
+    """In-process stand-in for serial.Serial backed by a FakeOpenCR."""
+
+    def __init__(self, port='fake', baudrate=115200, timeout=1, write_timeout=None, opencr=None, **kwargs):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.opencr = opencr or FakeOpenCR()
+        self.is_open = True
+        self.writes = deque(maxlen=10000)  # (monotonic time, bytes)
+        self._tx = ''
+        self._rx = bytearray()
+        self._cond = threading.Condition()
+        if self.opencr.telemetry_hz:
+            threading.Thread(target=self.opencr.stream_telemetry, args=(lambda: self.is_open, self._reply),
+                             daemon=True).start()
+
+    # --- firmware side ---
+    def _reply(self, line):
+        with self._cond:
+            if self.is_open:
+                self._rx += (line + '\r\n').encode()
+                self._cond.notify_all()
+
+    def _process(self, line):
+        for delay, reply in self.opencr.handle(line.strip()):
+            if delay > 0:
+                timer = threading.Timer(delay, self._reply, args=(reply,))
+                timer.daemon = True
+                timer.start()
+            else:
+                self._reply(reply)
+
+    # --- pyserial API ---
+    def write(self, data):
+        if not self.is_open:
+            raise serial.SerialException('Port is closed')
+        self.writes.append((time.monotonic(), bytes(data)))
+        self._tx += data.decode('utf-8', errors='ignore')
+        while '\n' in self._tx:
+            line, self._tx = self._tx.split('\n', 1)
+            self._process(line)
+        if self._tx.strip() == 's':
+            # motion.py sends a bare 's' without a line ending
+            self._tx = ''
+            self._process('s')
+        return len(data)
+
+    @property
+    def in_waiting(self):
+        with self._cond:
+            return len(self._rx)
+
+    def read(self, size=1):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        with self._cond:
+            while len(self._rx) < size and self.is_open:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            data = bytes(self._rx[:size])
+            del self._rx[:size]
+            return data
+
+    def readline(self):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        with self._cond:
+            while b'\n' not in self._rx and self.is_open:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            end = self._rx.find(b'\n') + 1 or len(self._rx)
+            data = bytes(self._rx[:end])
+            del self._rx[:end]
+            return data
+
+    def reset_input_buffer(self):
+        with self._cond:
+            self._rx.clear()
+
+    def reset_output_buffer(self):
+        self._tx = ''
+
+    def flush(self):
+        pass
+
+    def close(self):
+        with self._cond:
+            self.is_open = False
+            self._cond.notify_all()
+
+
+class PtyOpenCR:
+    """FakeOpenCR behind a pseudo-terminal, so real serial.Serial code can open `port`."""
+
+    def __init__(self, opencr=None):
+        self.opencr = opencr or FakeOpenCR()
+        self.lines = deque(maxlen=100000)  # (monotonic time, line) as the board received them
+        self._master, slave = os.openpty()
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        self._slave = slave  # kept open so the master never sees EOF between clients
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        if self.opencr.telemetry_hz:
+            threading.Thread(target=self.opencr.stream_telemetry, args=(lambda: self._running, self._reply),
+                             daemon=True).start()
+
+    def _reply(self, line):
+        if self._running:
+            try:
+                os.write(self._master, (line + '\r\n').encode())
+            except OSError:
+                pass
+
+    def _run(self):
+        pending = b''
+        while self._running:
+            try:
+                chunk = os.read(self._master, 4096)
+            except OSError:
+                break
+            now = time.monotonic()
+            pending += chunk
+            while b'\n' in pending:
+                raw, pending = pending.split(b'\n', 1)
+                self._handle(now, raw)
+            if pending.strip() == b's':
+                # motion.py sends a bare 's' without a line ending
+                self._handle(now, pending)
+                pending = b''
+
+    def _handle(self, now, raw):
+        line = raw.decode('utf-8', errors='ignore').strip()
+        if not line:
+            return
+        self.lines.append((now, line))
+        for delay, reply in self.opencr.handle(line):
+            if delay > 0:
+                timer = threading.Timer(delay, self._reply, args=(reply,))
+                timer.daemon = True
+                timer.start()
+            else:
+                self._reply(reply)
+
+    def close(self):
+        self._running = False
+        for fd in (self._master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
@@ -0,0 +1,330 @@
+# === OpenCR Telemetry Recorder ===
+# Every line the board sends back becomes one fixed-width record in a
+# memory-mapped ring file:
+#   key=value telemetry   x y th v w bat il ir (odometry, battery, motor currents)
+#   Done / Error          move acknowledgements, kept as events without values
+#   anything else         counted as 'text'
+#
+#   header (64 bytes)     magic, record size, capacity, records written so far
+#   records               capacity x RECORD; record n lives in slot n % capacity
+#
+# The file's pages belong to the kernel page cache, so the last `capacity`
+# records survive a crash of the recording process (the writer also msyncs
+# every SYNC_INTERVAL against power loss). Other processes map the same file
+# read-only and query it with NumPy without copying the ring. One process
+# writes at a time, guarded by an flock: the broker when it runs, otherwise
+# the motion run that holds the port.
+#
+#   ring = shared_ring()                      # read side, any process
+#   ring.window(seconds=30)                   # structured array, oldest first
+#   resample(ring.window(seconds=600), 1.0)   # 1s buckets for charts
+#   for frame in live_feed(ring, 4): ...      # 4 Hz summaries, whatever the input rate
+import fcntl
+import math
+import mmap
+import os
+import time
+
+import numpy as np
+
+from opencr import TELEMETRY_FILE
+
+CAPACITY = int(os.environ.get('OPENCR_TELEMETRY_RECORDS', 2 ** 17))  # ~22 min at 100 lines/s, 6 MB
+SYNC_INTERVAL = 5.0  # seconds between msyncs by the writer
+FEED_HZ = 4.0  # live feed frames per second
+POSE_HZ = 2.0  # 'pose' events published per second at most
+MAX_BUCKETS = 2000  # per resampled series
+
+FIELDS = ('x', 'y', 'theta', 'v', 'w', 'battery', 'current_l', 'current_r')
+ALIASES = {'th': 'theta', 'yaw': 'theta', 'bat': 'battery', 'vbat': 'battery',
+           'il': 'current_l', 'ir': 'current_r'}
+KINDS = ('telemetry', 'done', 'error', 'text')
+RECORD = np.dtype([('t', '<f8'), ('seq', '<u4'), ('kind', '<u4')] + [(name, '<f4') for name in FIELDS])
+MAGIC = b'ADRTELEM'
+HEADER_SIZE = 64  # magic[8] record_size<u4 capacity<u4 count<u8, rest reserved
+_COUNT_OFFSET = 16
+_FIELD_INDEX = dict({name: i for i, name in enumerate(FIELDS)},
+                    **{alias: FIELDS.index(name) for alias, name in ALIASES.items()})
+_KIND_INDEX = {kind: i for i, kind in enumerate(KINDS)}
+
+
+def to_record(reply):
+    """(kind code, field values with NaN for missing) for one parse_reply() result."""
+    values = [math.nan] * len(FIELDS)
+    for key, value in reply.get('values', {}).items():
+        index = _FIELD_INDEX.get(key)
+        if index is not None and isinstance(value, float):
+            values[index] = value
+    return _KIND_INDEX.get(reply['kind'], _KIND_INDEX['text']), values
+
+
+class TelemetryRing:
+    def __init__(self, path=TELEMETRY_FILE, capacity=CAPACITY, writable=False):
+        """Map the ring file; writable=True creates it if needed and takes the writer lock
+        (BlockingIOError if another process holds it), otherwise it must already exist."""
+        self.path = path
+        self.writable = writable
+        self._last_sync = time.monotonic()
+        if writable:
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self._prepare(capacity)
+            except OSError:
+                os.close(self._fd)
+                raise
+        else:
+            self._fd = os.open(path, os.O_RDONLY)
+        try:
+            header = os.pread(self._fd, HEADER_SIZE, 0)
+            if header[:8] != MAGIC or int.from_bytes(header[8:12], 'little') != RECORD.itemsize:
+                raise ValueError(f'{path} is not a telemetry ring')
+            self.capacity = int.from_bytes(header[12:16], 'little')
+            self._mm = mmap.mmap(self._fd, HEADER_SIZE + self.capacity * RECORD.itemsize,
+                                 access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            os.close(self._fd)
+            raise
+        self.records = np.frombuffer(self._mm, dtype=RECORD, count=self.capacity, offset=HEADER_SIZE)
+        self._count = np.frombuffer(self._mm, dtype='<u8', count=1, offset=_COUNT_OFFSET)
+        self.inode = os.fstat(self._fd).st_ino
+
+    def _prepare(self, capacity):
+        """Keep an existing ring of the same shape (that's the crash recovery), else start a new one."""
+        size = HEADER_SIZE + capacity * RECORD.itemsize
+        header = os.pread(self._fd, HEADER_SIZE, 0)
+        if (header[:8] == MAGIC and int.from_bytes(header[8:12], 'little') == RECORD.itemsize
+                and int.from_bytes(header[12:16], 'little') == capacity and os.fstat(self._fd).st_size == size):
+            return
+        if header:
+            print(f"⚠️ Telemetry ring {self.path} has a different layout, starting a new one")
+        os.ftruncate(self._fd, 0)
+        os.ftruncate(self._fd, size)
+        os.pwrite(self._fd, MAGIC + RECORD.itemsize.to_bytes(4, 'little') + capacity.to_bytes(4, 'little'), 0)
+
+    def count(self):
+        """Records written since the ring was created (the newest is count() - 1)."""
+        return int(self._count[0])
+
+    # --- writer ---
+    def append(self, kind, values, t=None):
+        n = int(self._count[0])
+        self.records[n % self.capacity] = (time.time() if t is None else t, n & 0xffffffff, kind, *values)
+        self._count[0] = n + 1  # published only after the slot is complete
+        if time.monotonic() - self._last_sync >= SYNC_INTERVAL:
+            self._mm.flush()
+            self._last_sync = time.monotonic()
+
+    # --- readers ---
+    def _copy(self, first, count):
+        """Records first..count-1 (clipped to what the ring still holds), oldest first."""
+        first = max(first, count - self.capacity, 0)
+        if first >= count:
+            return np.empty(0, dtype=RECORD)
+        start, end = first % self.capacity, count % self.capacity or self.capacity
+        if start < end:
+            out = self.records[start:end].copy()
+        else:
+            out = np.concatenate((self.records[start:], self.records[:end]))
+        # The writer may have lapped the oldest slots while we copied
+        overwritten = self.count() - self.capacity + 1 - first
+        return out[overwritten:] if overwritten > 0 else out
+
+    def since(self, first):
+        """(records numbered >= first, count) for incremental readers."""
+        count = self.count()
+        return self._copy(first, count), count
+
+    def retention(self):
+        """Seconds back to the oldest record once the ring has wrapped; None while it is still filling."""
+        count = self.count()
+        if count <= self.capacity:
+            return None
+        return time.time() - float(self.records[count % self.capacity]['t'])
+
+    def window(self, start=None, end=None, seconds=None):
+        """Records with start <= t < end (unix times), or from the last `seconds`; oldest first."""
+        if seconds is not None:
+            start, end = time.time() - seconds, None
+        count = self.count()
+        first = max(count - self.capacity, 0)
+        if start is not None and count > first:
+            # Binary search over record numbers; each probe reads one slot of the mapped ring
+            lo, hi = first, count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self.records[mid % self.capacity]['t'] < start:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            first = lo
+        records = self._copy(first, count)
+        if end is not None:
+            records = records[:np.searchsorted(records['t'], end)]
+        return records
+
+    def close(self):
+        self.records = self._count = None
+        try:
+            self._mm.close()
+        except BufferError:
+            pass  # a caller still holds a view; the mapping goes when it does
+        os.close(self._fd)  # also releases the writer lock
+
+
+_shared = {}
+
+
+def shared_ring(path=TELEMETRY_FILE):
+    """A read-only ring for this process, reopened if the writer replaced the file; None if there is none."""
+    ring = _shared.get(path)
+    try:
+        inode = os.stat(path).st_ino
+    except OSError:
+        return None
+    if ring is None or ring.inode != inode:
+        try:
+            ring = _shared[path] = TelemetryRing(path)
+        except (OSError, ValueError):
+            return None
+    return ring
+
+
+# === Recording ===
+class TelemetryRecorder:
+    """Writes parsed replies to the ring once it holds the writer lock; while another
+    process records, record() just drops lines and retries the lock now and then."""
+
+    def __init__(self, path=TELEMETRY_FILE, capacity=CAPACITY, publish=None, retry_interval=5.0):
+        self.path = path
+        self.capacity = capacity
+        self.publish = publish  # eventbus Publisher.publish, for decimated 'pose' events
+        self.retry_interval = retry_interval
+        self.ring = None
+        self.recorded = 0
+        self.skipped = 0
+        self._retry_at = 0.0
+        self._last_pose = 0.0
+
+    def _acquire(self):
+        now = time.monotonic()
+        if now < self._retry_at:
+            return None
+        try:
+            self.ring = TelemetryRing(self.path, self.capacity, writable=True)
+            print(f"📈 Recording OpenCR telemetry to {self.path}")
+        except BlockingIOError:
+            self._retry_at = now + self.retry_interval  # another process records
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Telemetry ring {self.path} unavailable: {e}")
+            self._retry_at = now + self.retry_interval
+        return self.ring
+
+    def record(self, reply):
+        """Append one parse_reply() result (a ProtocolReader tap)."""
+        ring = self.ring or self._acquire()
+        if ring is None:
+            self.skipped += 1
+            return
+        kind, values = to_record(reply)
+        t = time.time()
+        ring.append(kind, values, t)
+        self.recorded += 1
+        if self.publish is not None and kind == 0 and t - self._last_pose >= 1.0 / POSE_HZ:
+            x, y, theta = values[0], values[1], values[2]
+            if not (math.isnan(x) or math.isnan(y)):
+                self._last_pose = t
+                try:
+                    self.publish('pose', x=x, y=y, theta=None if math.isnan(theta) else theta)
+                except OSError:
+                    pass
+
+    def release(self):
+        """Close the ring and give up the writer lock (e.g. when a motion run ends)."""
+        ring, self.ring = self.ring, None
+        if ring is not None:
+            ring.close()
+        self._retry_at = 0.0
+
+    def stats(self):
+        return {'path': self.path, 'recording': self.ring is not None, 'recorded': self.recorded,
+                'skipped': self.skipped, 'count': self.ring.count() if self.ring else None}
+
+
+# === Queries ===
+def _json_values(values, digits=4):
+    return [None if math.isnan(v) else round(v, digits) for v in values.tolist()]
+
+
+def summarize(records, fields=FIELDS):
+    """Per field {'min', 'max', 'mean', 'last'} over the non-missing values, plus event counts."""
+    summary = {'records': int(len(records)),
+               'events': {kind: int(np.count_nonzero(records['kind'] == i)) for i, kind in enumerate(KINDS)}}
+    for name in fields:
+        values = records[name]
+        values = values[~np.isnan(values)]
+        summary[name] = None if not len(values) else {
+            'min': round(float(values.min()), 4), 'max': round(float(values.max()), 4),
+            'mean': round(float(values.mean(dtype=np.float64)), 4), 'last': round(float(values[-1]), 4)}
+    return summary
+
+
+def resample(records, bucket=1.0, fields=FIELDS):
+    """Bucket means per field (None where a bucket had no value) and Done/Error counts per bucket."""
+    series = {'bucket': bucket, 't': [], 'records': [], 'done': [], 'error': []}
+    series.update({name: [] for name in fields})
+    if not len(records):
+        return series
+    t0 = math.floor(records['t'][0] / bucket) * bucket
+    index = ((records['t'] - t0) // bucket).astype(np.int64)
+    n = int(index[-1]) + 1
+    series['t'] = _json_values(t0 + np.arange(n) * bucket, 3)
+    series['records'] = np.bincount(index, minlength=n).tolist()
+    for kind in ('done', 'error'):
+        series[kind] = np.bincount(index[records['kind'] == _KIND_INDEX[kind]], minlength=n).tolist()
+    for name in fields:
+        values = records[name]
+        present = ~np.isnan(values)
+        totals = np.bincount(index[present], values[present].astype(np.float64), minlength=n)
+        counts = np.bincount(index[present], minlength=n)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            series[name] = _json_values(np.where(counts > 0, totals / counts, np.nan))
+    return series
+
+
+def query(ring, seconds=60.0, bucket=None, fields=FIELDS):
+    """What the motion and debug pages ask for: a summary of the last `seconds` and, with
+    `bucket`, a resampled series (coarsened to at most MAX_BUCKETS points)."""
+    records = ring.window(seconds=seconds)
+    result = {'seconds': seconds, 'capacity': ring.capacity, 'count': ring.count(),
+              'summary': summarize(records, fields),
+              'events': [{'t': round(float(t), 3), 'kind': KINDS[kind]}
+                         for t, kind in records[records['kind'] != 0][['t', 'kind']][-50:].tolist()]}
+    if bucket:
+        result['series'] = resample(records, max(float(bucket), seconds / MAX_BUCKETS), fields)
+    return result
+
+
+def live_feed(ring, rate_hz=FEED_HZ):
+    """Yield one frame per 1/rate_hz seconds: newest value of every field, how many lines
+    arrived since the last frame and how many of them were Done/Error."""
+    period = 1.0 / rate_hz
+    seen = ring.count()
+    latest = dict.fromkeys(FIELDS)
+    last = time.monotonic()
+    while True:
+        time.sleep(max(0.0, last + period - time.monotonic()))
+        now = time.monotonic()
+        records, seen = ring.since(seen)
+        for name in FIELDS:
+            values = records[name]
+            present = np.flatnonzero(~np.isnan(values))
+            if len(present):
+                latest[name] = round(float(values[present[-1]]), 4)
+        frame = dict(latest, t=round(time.time(), 3), lines=int(len(records)),
+                     line_rate_hz=round(len(records) / (now - last), 1),
+                     done=int(np.count_nonzero(records['kind'] == 1)),
+                     error=int(np.count_nonzero(records['kind'] == 2)),
+                     last_line_t=round(float(records['t'][-1]), 3) if len(records) else None)
+        last = now
+        yield frame
@@ -0,0 +1,52 @@
+# === Production Serving ===
+# The pieces the three Flask apps (motion, joystick, ad_manager) share for
+# running outside the debug server.
+#
+# Each app is one process because it owns a device (serial port or display),
+# so it scales with threads, not workers. Every request holds a server thread
+# while it runs, and a Server-Sent Events stream holds one for as long as it is
+# open: with waitress' default 8 threads, each open dashboard tab costs a
+# thread. Streams therefore end after SSE_MAX_SECONDS and the browser's
+# EventSource reconnects after SSE_RETRY_MS, so a forgotten tab gives its
+# thread back instead of keeping it until the client goes away.
+#
+#     run_production(create_app(), 5000, threads=8)
+#     return sse_response(frames())   # frames() yields JSON-able dicts
+import json
+import os
+import time
+
+from flask import Response, stream_with_context
+
+SSE_MAX_SECONDS = float(os.environ.get('ADROVER_SSE_MAX_SECONDS', 300))
+SSE_RETRY_MS = 1000
+
+
+def run_production(app, port, threads):
+    """Serve app with waitress (or the threaded Werkzeug server without debug if it is missing)."""
+    try:
+        from waitress import serve
+    except ImportError:
+        print("⚠️ waitress not installed, using the threaded Werkzeug server without debug")
+        app.run(host='0.0.0.0', port=port, debug=False, threaded=True, use_reloader=False)
+        return
+    print(f"Starting waitress on port {port} with {threads} threads...")
+    serve(app, host='0.0.0.0', port=port, threads=threads)
+
+
+def sse_response(frames, max_seconds=None):
+    """Stream each dict from frames as an SSE data event, ending after max_seconds."""
+    max_seconds = SSE_MAX_SECONDS if max_seconds is None else max_seconds
+
+    def events():
+        deadline = time.monotonic() + max_seconds
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        try:
+            for frame in frames:
+                yield f"data: {json.dumps(frame)}\n\n"
+                if time.monotonic() >= deadline:
+                    break
+        finally:
+            frames.close()
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})